@@ -0,0 +1,157 @@
+'''
+
+This module provides CommandScheduler which decides what the serial thread sends to the machine
+next.
+
+'''
+
+from DataStructures.streamCheckpoint         import resumeCommands
+from collections                             import deque
+
+
+class CommandScheduler(object):
+    '''
+
+    CommandScheduler takes lines from three streams, in order of priority:
+
+        quick   - commands on quick_queue like ! (stop) and ~ (resume). They are sent as soon as
+                  they are put on the queue, even when the machine's buffer is full, because the
+                  firmware acts on them as they arrive.
+        manual  - commands on gcode_queue from the buttons, jogging and calibration. They go
+                  ahead of any program lines which have not been sent yet.
+        program - the lines of data.gcode while a program is running.
+
+    A manual command which does not fit in the machine's buffer yet is held in waitingCommand and
+    holds back the program, so a manual command is never overtaken by the program lines after it.
+    When a program is resumed after the connection was lost, the lines which put the machine back
+    where it was are sent ahead of the program lines.
+    The queues are WakingQueues, so the serial thread sleeps until one of them has something in it
+    instead of polling them.
+
+    '''
+
+    def __init__(self, data, buffering):
+        '''
+
+        Create a scheduler. With buffering off only one line is sent at a time and only once the
+        machine has acknowledged the line before it.
+
+        '''
+        self.data           = data
+        self.buffering      = buffering
+        self.waitingCommand = None             #a manual command taken from gcode_queue which has not been sent yet
+        self.resumePending  = False            #True when the program must be resumed at gcodeIndex once it runs again
+        self.resumeLines    = deque()          #lines which are sent before the program lines to resume it
+
+    def takeQuickCommands(self):
+        '''
+
+        Returns every waiting quick command. A stop also throws away the manual command which was
+        waiting and any resume which has not been sent, in the same way that stopping clears
+        gcode_queue.
+
+        '''
+
+        commands = []
+        while not self.data.quick_queue.empty():
+            command = self.data.quick_queue.get_nowait()
+            if command[:1] == '!':
+                self.waitingCommand = None
+                self.resumePending  = False
+                self.resumeLines.clear()
+            commands.append(command)
+        return commands
+
+    def takeLines(self, freeSpace, machineIsReady):
+        '''
+
+        Returns the manual commands and program lines to send now, in the order they should be
+        sent, as (line, programIndex) pairs where programIndex is None for a line which is not
+        from the program. freeSpace is how much of the machine's buffer can be used and
+        machineIsReady is True when every line sent so far has been acknowledged.
+
+        '''
+
+        lines = []
+
+        if not self.buffering:
+            if not machineIsReady:
+                return lines
+            freeSpace = 0                      #one line goes out whatever its length
+
+        #manual commands
+        while True:
+            if self.waitingCommand is None:
+                if self.data.gcode_queue.empty():
+                    break
+                self.waitingCommand = self.data.gcode_queue.get_nowait() + " "
+            if not self._fits(self.waitingCommand, freeSpace, lines):
+                return lines                   #the program waits behind the manual command
+            lines.append((self.waitingCommand, None))
+            freeSpace = freeSpace - len(self.waitingCommand) - 1
+            self.waitingCommand = None
+
+        if not self.data.uploadFlag:
+            return lines
+
+        gcode     = self.data.gcode
+        transform = self.data.gcodeTransform
+        index     = self.data.gcodeIndex
+        ended     = False
+
+        #lines which put the machine back where it was before the connection was lost
+        if self.resumePending:
+            self.resumePending = False
+            resumeLines = resumeCommands(gcode, transform, index)
+            if resumeLines is None:
+                #the operator has put the machine back in place, only the modal state is restored
+                resumeLines = [gcode.modalCommandsBefore(index)] if gcode.modalCommandsBefore(index) else []
+            self.resumeLines.extend(resumeLines)
+        while self.resumeLines:
+            if not self._fits(self.resumeLines[0], freeSpace, lines):
+                return lines
+            line = self.resumeLines.popleft()
+            lines.append((line, None))
+            freeSpace = freeSpace - len(line) - 1
+
+        #program lines
+
+        try:
+            while True:
+                line = transform.line(gcode, index)
+                if not self._fits(line, freeSpace, lines):
+                    break
+
+                if line.strip():                                   #blank lines (kept when large files are read from the disk) are skipped
+                    lines.append((line, index))
+                    freeSpace = freeSpace - len(line) - 1
+
+                if index + 1 < len(gcode):
+                    index = index + 1
+                else:
+                    ended = True
+                    break
+        except IndexError:
+            print "index error when reading gcode" #we don't want the whole serial thread to close if the gcode can't be sent because of an index error (file deleted...etc)
+
+        #the index is only set once for all of the lines since other threads are bound to it
+        if ended:
+            self.data.gcodeIndex = len(gcode)         #past the last line, so that listeners can tell the program ended
+            self.data.uploadFlag = 0
+            self.data.gcodeIndex = 0
+            print "Gcode Ended"
+        elif index != self.data.gcodeIndex:
+            self.data.gcodeIndex = index
+
+        return lines
+
+    def _fits(self, line, freeSpace, lines):
+        '''
+
+        Returns True if line can be sent after lines. Without buffering that is only when nothing
+        else is being sent.
+
+        '''
+        if self.buffering:
+            return freeSpace > len(line)       #the line and its newline must fit
+        return not lines
@@ -0,0 +1,298 @@
+'''
+
+This module provides FirmwareEmulator which stands in for a Maslow on a Linux pseudo-terminal so
+that Ground Control can be connected to it and run programs without a machine. It answers the
+same way as the firmware: an ok (or an error:) for each line, position reports, [PE:...] error
+reports, $$ settings and the firmware version, and it holds received lines in a buffer of the
+same size as the Arduino's.
+
+Run it with
+
+    python -m Connection.firmwareEmulator
+
+then set the port it prints as the COMport in groundcontrol.ini (or give --link a path under
+/dev so that it is listed in the Ports menu).
+
+'''
+
+from Settings                                import maslowSettings
+import argparse
+import os
+import pty
+import select
+import time
+import tty
+
+
+class FirmwareEmulator(object):
+    '''
+
+    FirmwareEmulator reads lines from the pseudo-terminal into a buffer of bufferSize bytes and
+    runs them one at a time, taking lineDelay seconds for each. The ok for a line is sent when it
+    has finished running, which is when Ground Control frees its space in the buffer. Bytes which
+    arrive while the buffer is full are dropped and a buffer overflow is reported.
+
+    '''
+
+    def __init__(self, bufferSize = 126, lineDelay = .01, reportInterval = .2, statsInterval = 5, version = '1.28'):
+        '''
+
+        Create an emulator. Call open() to make its pseudo-terminal and run() to start it.
+
+        '''
+        self.bufferSize     = bufferSize
+        self.lineDelay      = lineDelay           #the time taken to run each line
+        self.reportInterval = reportInterval      #the time between position reports
+        self.statsInterval  = statsInterval       #the time between printing how fast lines are running
+        self.version        = version
+
+        self.master         = None
+        self.portName       = None
+
+        self.received       = ""                  #bytes in the buffer which have not been run yet
+        self.lineArrived    = []                  #when each whole line in received finished arriving
+        self.running        = None                #(line, time it finishes, time it arrived) of the line being run
+
+        self.x              = 0.0
+        self.y              = 0.0
+        self.z              = 0.0
+        self.inches         = False
+        self.relative       = False
+
+        self.settings       = self.defaultSettings()
+
+        self.linesRun       = 0
+        self.ackLatency     = 0.0
+        self.overflows      = 0
+
+    def defaultSettings(self):
+        '''
+
+        Returns the default value of every setting which is stored in the firmware, keyed by its
+        firmware key, so that $$ reports the same settings as a freshly loaded machine.
+
+        '''
+
+        settings = {}
+        for section in maslowSettings.settings:
+            for option in maslowSettings.settings[section]:
+                if 'firmwareKey' in option and 'default' in option:
+                    try:
+                        settings[option['firmwareKey']] = float(option['default'])
+                    except ValueError:
+                        settings[option['firmwareKey']] = 0.0      #options like spindleAutomate are stored as numbers
+        return settings
+
+    def open(self, link = None):
+        '''
+
+        Create the pseudo-terminal and return the name of the port to connect to. If link is given
+        a symbolic link to the port is made there.
+
+        '''
+
+        self.master, slave = pty.openpty()
+        tty.setraw(slave)
+        self.portName = os.ttyname(slave)
+        self.slave    = slave                     #kept open so the port does not close when Ground Control disconnects
+
+        if link is not None:
+            if os.path.islink(link):
+                os.remove(link)
+            os.symlink(self.portName, link)
+            return link
+        return self.portName
+
+    def send(self, message):
+        os.write(self.master, message + "\r\n")
+
+    def run(self):
+        '''
+
+        Answer the port until the process is stopped.
+
+        '''
+
+        now = time.time()
+        nextReport = now + self.reportInterval
+        nextStats  = now + self.statsInterval
+        linesAtLastStats = 0
+
+        while True:
+            now = time.time()
+
+            wakeAt = min(nextReport, nextStats)
+            if self.running is not None:
+                wakeAt = min(wakeAt, self.running[1])
+
+            readable, _, _ = select.select([self.master], [], [], max(wakeAt - now, 0))
+            if readable:
+                try:
+                    self.receive(os.read(self.master, 1024))
+                except OSError:
+                    pass                          #nothing is connected to the port
+
+            now = time.time()
+
+            if self.running is not None and now >= self.running[1]:
+                line, finishes, arrived = self.running
+                self.running = None
+                self.finishLine(line, arrived, now)
+
+            if self.running is None:
+                self.startNextLine(now)
+
+            if now >= nextReport:
+                self.report()
+                nextReport = now + self.reportInterval
+
+            if now >= nextStats:
+                linesRun = self.linesRun - linesAtLastStats
+                if linesRun:
+                    print "%.1f lines/s, average ack latency %.1f ms, %i overflows" % (linesRun/float(self.statsInterval), 1000*self.ackLatency/linesRun, self.overflows)
+                linesAtLastStats = self.linesRun
+                self.ackLatency  = 0.0
+                nextStats = now + self.statsInterval
+
+    def receive(self, data):
+        '''
+
+        Add bytes which have arrived to the buffer. A ! stops the machine straight away like it
+        does on the machine, throwing away the line being run and everything in the buffer.
+
+        '''
+
+        now = time.time()
+        overflowed = False
+        for character in data:
+            if character == '!':
+                self.received    = ""
+                self.lineArrived = []
+                self.running     = None
+
+            if len(self.received) >= self.bufferSize:
+                overflowed = True
+                continue
+
+            self.received = self.received + character
+            if character == '\n':
+                self.lineArrived.append(now)
+
+        if overflowed:
+            self.overflows = self.overflows + 1
+            self.send("Buffer overflow!")
+
+    def startNextLine(self, now):
+        '''
+
+        Take the next whole line out of the buffer and start running it.
+
+        '''
+
+        if not self.lineArrived:
+            return
+
+        line, self.received = self.received.split('\n', 1)
+        arrived = self.lineArrived.pop(0)
+        line = line.strip()
+
+        if line in ('!', '~', '\x18', ''):
+            self.finishLine(line, arrived, now)   #real-time commands take no time
+        else:
+            self.running = (line, now + self.lineDelay, arrived)
+
+    def finishLine(self, line, arrived, now):
+        '''
+
+        Carry out a line which has finished running and acknowledge it.
+
+        '''
+
+        try:
+            self.execute(line)
+        except ValueError:
+            self.send("error: unable to read " + line)
+        else:
+            self.send("ok")
+
+        self.linesRun   = self.linesRun + 1
+        self.ackLatency = self.ackLatency + now - arrived
+
+    def execute(self, line):
+        '''
+
+        Carry out one line. Raises ValueError if a number on the line can not be read.
+
+        '''
+
+        if line == '\x18':
+            self.x = self.y = self.z = 0.0
+            self.relative = False
+            return
+
+        if line.startswith('B05'):
+            self.send("Firmware Version " + self.version)
+            return
+
+        if line.startswith('$$'):
+            for key in sorted(self.settings):
+                self.send("$" + str(key) + "=" + ('%.3f' % self.settings[key]))
+            return
+
+        if line.startswith('$'):
+            key, value = line[1:].split('=', 1)
+            self.settings[int(key)] = float(value)
+            return
+
+        words = {}
+        for word in line.upper().split():
+            letter = word[0]
+            if letter in 'GM':
+                command = int(float(word[1:]))
+                if letter == 'G' and command == 20:
+                    self.inches = True
+                elif letter == 'G' and command == 21:
+                    self.inches = False
+                elif letter == 'G' and command == 90:
+                    self.relative = False
+                elif letter == 'G' and command == 91:
+                    self.relative = True
+            elif letter in 'XYZ':
+                words[letter] = float(word[1:])
+
+        scale = 25.4 if self.inches else 1.0
+        for letter in words:
+            value = words[letter]*scale
+            if letter == 'X':
+                self.x = self.x + value if self.relative else value
+            elif letter == 'Y':
+                self.y = self.y + value if self.relative else value
+            else:
+                self.z = self.z + value if self.relative else value
+
+    def report(self):
+        '''
+
+        Send a position report and a position error report like the machine does while it is idle
+        or running.
+
+        '''
+
+        scale = 1/25.4 if self.inches else 1.0
+        state = "Run" if self.running is not None else "Idle"
+        self.send("<%s,MPos:%.3f,%.3f,%.3f,WPos:0.000,0.000,0.000>" % (state, self.x*scale, self.y*scale, self.z*scale))
+        self.send("[PE:0.00,0.00,%i]" % (self.bufferSize - len(self.received)))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = "Emulate a Maslow on a pseudo-terminal.")
+    parser.add_argument('--buffer', type = int, default = 126, help = "size of the receive buffer in bytes")
+    parser.add_argument('--line-delay', type = float, default = .01, help = "seconds taken to run each line")
+    parser.add_argument('--report-interval', type = float, default = .2, help = "seconds between position reports")
+    parser.add_argument('--stats-interval', type = float, default = 5, help = "seconds between printing the line rate")
+    parser.add_argument('--link', help = "make a symbolic link to the port at this path")
+    arguments = parser.parse_args()
+
+    emulator = FirmwareEmulator(arguments.buffer, arguments.line_delay, arguments.report_interval, arguments.stats_interval)
+    print "Emulated machine on " + emulator.open(arguments.link)
+    emulator.run()
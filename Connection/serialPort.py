@@ -2,6 +2,7 @@ from kivy.properties                           import  ListProperty
 from kivy.clock                                import  Clock
 from DataStructures.makesmithInitFuncs         import  MakesmithInitFuncs
 from Connection.serialPortThread               import  SerialPortThread
+from Connection.serialProcess                  import  SerialProcess
 
 import sys
 import serial
@@ -20,6 +21,9 @@ class SerialPort(MakesmithInitFuncs):
     
     # COMports = ListProperty(("Available Ports:", "None"))
     
+    serialProcess = None    #runs the connection when it is in a separate process
+    th            = None    #the thread which runs the connection
+    
     def __init__(self):
         '''
         
@@ -56,14 +60,44 @@ class SerialPort(MakesmithInitFuncs):
     
     def openConnection(self, *args):
         #This function opens the thread which handles the input from the serial port
-        #It only needs to be run once, it is run by connecting to the machine
+        #It only needs to be run once, it is run by connecting to the machine, after which the thread
+        #connects again by itself whenever the connection is lost
         
         
         if not self.data.connectionStatus:
+            if self.useSeparateProcess():
+                if self.serialProcess is None:
+                    self.serialProcess = SerialProcess()
+                    self.serialProcess.setUpData(self.data)
+                    self.serialProcess.start()
+                self.serialProcess.connect()
+                return
+            
+            #the thread keeps trying to connect by itself once it is running, so only one is started
+            if self.th is not None and self.th.is_alive():
+                return
+            
             #self.data.message_queue is the queue which handles passing CAN messages between threads
             x = SerialPortThread()
             x.setUpData(self.data)
             self.th=threading.Thread(target=x.getmessage)
             self.th.daemon = True
             self.th.start()
-    
\ No newline at end of file
+    
+    
+    def useSeparateProcess(self):
+        '''
+        
+        Returns True if the connection should be run in its own process. Windows would start the
+        new process by importing the whole interface again, so it always uses a thread.
+        
+        '''
+        
+        if self.serialProcess is not None:
+            return True
+        if sys.platform.startswith('win'):
+            return False
+        try:
+            return bool(int(self.data.config.get('Maslow Settings', 'serialProcess')))
+        except:
+            return False
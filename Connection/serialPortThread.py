@@ -1,5 +1,9 @@
 from DataStructures.makesmithInitFuncs         import   MakesmithInitFuncs
 from DataStructures.data          import   Data
+from Connection.commandScheduler  import   CommandScheduler
+from DataStructures.streamCheckpoint import StreamCheckpoint, resumeCommands
+from DataStructures.machineMessage   import parseMachineMessage, ACK, POSITION, ERROR
+from DataStructures.jobRecorder      import JobRecorder
 import serial
 import time
 from collections import deque
@@ -10,32 +14,40 @@ class SerialPortThread(MakesmithInitFuncs):
     
     SerialPort is the thread which handles direct communication with the CNC machine. 
     SerialPort initializes the connection and then receives
-    and parses messages. These messages are then passed to the main thread via the message_queue 
-    queue where they are added to the GUI
+    and parses messages. These messages are then passed to the main thread as MachineMessages via
+    the message_queue queue where they are added to the GUI
     
     '''
     
     machineIsReadyForData      = False # Tracks whether last command was acked
-    lastWriteTime              = time.time()
+    machineHasAnswered         = False # Tracks whether the machine has acked anything since it was reset
     bufferSize                 = 126                #The total size of the arduino buffer
     bufferSpace                = bufferSize         #The amount of space currently available in the buffer
+    bufferReserve              = 0                  #space left unused after the machine reports that its buffer overflowed
+    acksSinceOverflow          = 0
     lengthOfLastLineStack      =  deque()
-    
-    # Minimum time between lines sent to allow Arduino to cope
-    # could be smaller (0.02) however larger number doesn't seem to impact performance
-    MINTimePerLine = 0.05    
+    sentLineStack              =  deque()           #(time sent, program line or None) for each line in lengthOfLastLineStack, kept in the same order
+    readBuffer                 = ""                 #bytes read from the machine which do not yet make up a whole line
+    readTimeout                = .25                #the longest the thread sleeps waiting for the machine, so that a lost connection is noticed
+    firstRetryDelay            = 1                  #seconds to wait before trying to connect again, doubled after each failed try
+    longestRetryDelay          = 5
     
     def _write (self, message, isQuickCommand = False):
         #message = message + 'L' + str(len(message) + 1 + 2 + len(str(len(message))) )
         
-        taken = time.time() - self.lastWriteTime
-        if taken < self.MINTimePerLine:  # wait between sends
-            # self.data.logger.writeToLog("Sleeping: " + str( taken ) + "\n")
-            time.sleep (self.MINTimePerLine) # could use (taken - MINTimePerLine)
-        
         message = message.encode()
         print "Sending: " + str(message)
         
+        self._writeToPort(self._trackLine(message, isQuickCommand))
+    
+    def _trackLine(self, message, isQuickCommand = False, programIndex = None):
+        '''
+        
+        Account for a line which is about to be sent in the machine's buffer. programIndex is the
+        line of the program it came from, if any. Returns the line with its newline, ready to write.
+        
+        '''
+        
         message = message + '\n'
         
         self.bufferSpace       = self.bufferSpace - len(message)        #shrink the available buffer space by the length of the line
@@ -44,27 +56,40 @@ class SerialPortThread(MakesmithInitFuncs):
         
         #if this is a quick message sent as soon as the button is pressed (like stop) then put it on the right side of the queue
         #because it is the first message sent, otherwise put it at the end (left) because it is the last message sent
+        now = time.time()
         if isQuickCommand:
             if message[0] == '!':
                 #if we've just sent a stop command, the buffer is now empty on the arduino side
                 self.lengthOfLastLineStack.clear()
+                self.sentLineStack.clear()
+                self.checkpoint.clear()
                 self.bufferSpace = self.bufferSize - len(message)
                 self.lengthOfLastLineStack.append(len(message)) 
+                self.sentLineStack.append((now, None))
             else:
                 self.lengthOfLastLineStack.append(len(message))
+                self.sentLineStack.append((now, None))
         else:
             self.lengthOfLastLineStack.appendleft(len(message))
+            self.sentLineStack.appendleft((now, programIndex))
         
+        self.telemetry.lineSent(len(message))
+        
+        return message
+    
+    def _writeToPort(self, message):
+        '''
+        
+        Write one or more lines to the machine with a single call.
+        
+        '''
         
-        message = message.encode()
         try:
             self.serialInstance.write(message)
             self.data.logger.writeToLog("Sent: " + str(message))
         except:
             print("write issue")
             self.data.logger.writeToLog("Send FAILED: " + str(message))
-    
-        self.lastWriteTime = time.time()
 
     def _getFirmwareVersion(self):
         self.data.gcode_queue.put('B05 ')
@@ -75,129 +100,352 @@ class SerialPortThread(MakesmithInitFuncs):
         else:
             self.data.gcode_queue.put('G21 ')
     
-    def sendNextLine(self):
+    def wakeUp(self, *args):
         '''
-            Sends the next line of gcode to the machine
+        
+        Wake the thread if it is waiting for the machine because there is something new to send.
+        This is called from other threads when they put a command in one of the queues or start
+        a program running.
+        
+        '''
+        try:
+            self.serialInstance.cancel_read()
+        except:
+            pass                                   #before pyserial 3.1 the thread wakes up when its read times out
+    
+    def _lineAcknowledged(self):
         '''
         
-        if self.data.uploadFlag:
-            self._write(self.data.gcode[self.data.gcodeIndex])
-            
-            #increment gcode index
-            if self.data.gcodeIndex + 1 < len(self.data.gcode):
-                self.data.gcodeIndex = self.data.gcodeIndex + 1
+        The machine has finished reading a line, so the space it took up in the buffer is free. After
+        an overflow the space held back is given back a little at a time as lines go through cleanly.
+        
+        '''
+        self.machineIsReadyForData = True
+        self.machineHasAnswered    = True
+        if bool(self.lengthOfLastLineStack) is True:                                     #if we've sent lines to the machine
+            self.bufferSpace = self.bufferSpace + self.lengthOfLastLineStack.pop()    #free up that space in the buffer
+            sendTime, programIndex = self.sentLineStack.pop()
+            self.telemetry.lineAcknowledged(time.time() - sendTime)
+            if programIndex is not None:
+                self._programLineAcknowledged(programIndex)
+                self.recorder.ack(programIndex, time.time() - sendTime)
             else:
-                self.data.uploadFlag = 0
-                self.data.gcodeIndex = 0
-                print "Gcode Ended"
+                self.recorder.ack(-1, time.time() - sendTime)
+        
+        if self.bufferReserve > 0:
+            self.acksSinceOverflow = self.acksSinceOverflow + 1
+            if self.acksSinceOverflow >= 100:
+                self.bufferReserve     = max(self.bufferReserve - 8, 0)
+                self.acksSinceOverflow = 0
     
-    def getmessage (self):
-        #opens a serial connection called self.serialInstance
+    def _programLineAcknowledged(self, index):
+        '''
         
-        #check for serial version being > 3
-        if float(serial.VERSION[0]) < 3:
-            self.data.message_queue.put("Pyserial version 3.x is needed, version " + serial.VERSION + " is installed")
+        Record in the checkpoint that the machine has taken line index of the program, or that the
+        job is over if it was the last line.
+        
+        '''
+        program = self.data.gcode
+        if index + 1 >= len(program):
+            self.checkpoint.clear()
+            return
+        try:
+            self.checkpoint.fileName = self.data.gcodeFile
+            self.checkpoint.lineAcknowledged(index, program.modalState[index])
+        except IndexError:
+            pass                                   #the program was changed while its lines were being sent
+    
+    def _resumeIndex(self):
+        '''
+        
+        Returns the first program line which the machine has not acknowledged, or None if no
+        program lines are waiting to be acknowledged.
+        
+        '''
+        for sendTime, programIndex in reversed(self.sentLineStack):      #the oldest line is on the right
+            if programIndex is not None:
+                return programIndex
+        return None
+    
+    def _updateRecording(self):
+        '''
+        
+        Start recording a job when a program starts running, record each move of gcodeIndex, and
+        stop once the program has been stopped or has finished and every line of it has been
+        acknowledged. Pausing a program or losing the connection does not end the recording.
+        
+        '''
+        
+        if not self.recorder.isRecording():
+            if self.recordJobs and self.data.uploadFlag:
+                self.recorder.start(self.data.gcodeFile)
+                self.recordedIndex = None
+            if not self.recorder.isRecording():
+                return
+        
+        index = self.data.gcodeIndex
+        if index != self.recordedIndex:
+            self.recorder.index(index)
+            self.recordedIndex = index
+        
+        if not self.data.uploadFlag and index == 0 and self._resumeIndex() is None:
+            self.recorder.stop()
+        else:
+            self.recorder.flushIfDue()
+    
+    def _bufferOverflowed(self):
+        '''
+        
+        The machine received more than it could hold. Hold back part of the buffer so that the lines
+        sent from now on leave the firmware some room.
+        
+        '''
+        self.bufferReserve     = min(self.bufferReserve + 32, self.bufferSize/2)
+        self.acksSinceOverflow = 0
+        print "Machine buffer overflowed, keeping " + str(self.bufferReserve) + " bytes free"
+    
+    def _readLines(self, wait):
+        '''
+        
+        Read whatever the machine has sent and return the whole lines in it. If wait is True and
+        nothing has arrived the thread sleeps in the read until a byte arrives, wakeUp is called or
+        readTimeout passes.
+        
+        '''
+        
+        if wait:
+            received = self.serialInstance.read(1)
+        else:
+            received = ""
+        
+        waiting = self.serialInstance.in_waiting
+        if waiting > 0:
+            received = received + self.serialInstance.read(waiting)
+        
+        if not received:
+            return []
+        
+        self.lastMessageTime = time.time()
+        self.telemetry.bytesRead(len(received))
+        
+        lines = (self.readBuffer + received).split('\n')
+        self.readBuffer = lines.pop()               #the last piece has no newline yet
+        return [line + '\n' for line in lines]
+    
+    def _sendWaiting(self):
+        '''
+        
+        Send everything the scheduler says can be sent right now in a single write. Returns True
+        if anything was written.
+        
+        '''
+        
+        lines = []
+        
+        #quick commands go out even when the buffer is full
+        for command in self.scheduler.takeQuickCommands():
+            lines.append(self._trackLine(command.encode(), True))
+        
+        #nothing else is sent until the machine has answered since it was reset
+        if self.machineHasAnswered:
+            freeSpace      = self.bufferSpace - self.bufferReserve
+            machineIsReady = self.bufferSpace == self.bufferSize and self.machineIsReadyForData
+            for line, programIndex in self.scheduler.takeLines(freeSpace, machineIsReady):
+                lines.append(self._trackLine(line.encode(), False, programIndex))
+        
+        if not lines:
+            return False
+        
+        message = ''.join(lines)
+        print "Sending: " + message.replace('\n', ' ')
+        self._writeToPort(message)
+        return True
+    
+    def _resetConnectionState(self):
+        '''
+        
+        Forget everything about the last connection. The machine is reset when it is connected to, so
+        its buffer is empty.
+        
+        '''
+        self.machineIsReadyForData = False
+        self.machineHasAnswered    = False
+        self.bufferSpace           = self.bufferSize
+        self.bufferReserve         = 0
+        self.acksSinceOverflow     = 0
+        self.lengthOfLastLineStack = deque()
+        self.sentLineStack         = deque()
+        self.readBuffer            = ""
+    
+    def _connect(self):
+        '''
         
-        weAreBufferingLines = bool(int(self.data.config.get('Maslow Settings', "bufferOn")))
+        Try to open the port in data.comport and reset the machine. Returns True if the port opened.
+        
+        '''
         
         try:
             #print("connecting")
-            self.serialInstance = serial.Serial(self.data.comport, 57600, timeout = .25) #self.data.comport is the com port which is opened
+            self.serialInstance = serial.Serial(self.data.comport, 57600, timeout = self.readTimeout) #self.data.comport is the com port which is opened
         except:
             #print(self.data.comport + " is unavailable or in use")
             #self.data.message_queue.put("\n" + self.data.comport + " is unavailable or in use")
-            pass
-        else:
-            self.data.message_queue.put("\r\nConnected on port " + self.data.comport + "\r\n")
-            print("\r\nConnected on port " + self.data.comport + "\r\n")
-            gcode = ""
-            msg = ""
-            subReadyFlag = True
-            
-            
-            if self.serialInstance.isOpen(): 
-                self.serialInstance.close()
-            
-            self.serialInstance.open()
-            
-            # reset Arduino boards by toggling DTR signal
+            return False
+        
+        self.data.message_queue.put("\r\nConnected on port " + self.data.comport + "\r\n")
+        print("\r\nConnected on port " + self.data.comport + "\r\n")
+        
+        self.scheduler.buffering = bool(int(self.data.config.get('Maslow Settings', "bufferOn")))
+        self.recordJobs          = bool(int(self.data.config.get('Maslow Settings', "jobTelemetry")))
+        self.telemetry.reset()
+        self._resetConnectionState()
+        
+        if self.serialInstance.isOpen(): 
+            self.serialInstance.close()
+        
+        self.serialInstance.open()
+        
+        # reset Arduino boards by toggling DTR signal
+        try:
             self.serialInstance.dtr = False
             self.serialInstance.dtr = True
+        except IOError:
+            pass                                   #ports without modem lines (like the firmware emulator) can't be reset this way
+        
+        # reset non-Arduino boards by sending 
+        self._write(b'\x18') # ctrl-X
+        
+        #print "port open?:"
+        #print self.serialInstance.isOpen()
+        self.lastMessageTime = time.time()
+        self.data.connectionStatus = 1
+        
+        self._getFirmwareVersion()
+        self._setupMachineUnits()
+        return True
+    
+    def _connectionLost(self):
+        '''
+        
+        Close the port after the machine has stopped answering. If a program was running the program
+        is moved back to the first line the machine did not acknowledge, and the lines which return
+        the machine to where it was are sent before it when it carries on. If where the machine was
+        can not be worked out from the program the operator is asked to move it back before pressing
+        Continue.
+        
+        '''
+        
+        print "Connection Timed Out"
+        self.data.message_queue.put("Connection Timed Out\n")
+        
+        resumeIndex = self._resumeIndex()
+        if resumeIndex is not None:
+            self.data.gcodeIndex = resumeIndex
+        if resumeIndex is not None or self.data.uploadFlag:
+            self.scheduler.resumePending = True
+        
+        if self.data.uploadFlag and resumeCommands(self.data.gcode, self.data.gcodeTransform, self.data.gcodeIndex) is None:
+            self.data.message_queue.put("Message: USB connection lost. This has likely caused the machine to loose it's calibration, which can cause erratic behavior. It is recommended to stop the program, remove the sled, and perform the chain calibration process. Ground Control can not work out where the machine was for this file, so it will not move the machine back by itself. Once the machine is connected again, raise the z-axis, move the machine to where line " + str(self.data.gcodeIndex + 1) + " starts and lower it to the depth of the cut, then press Continue to carry on from that line.")
+        elif self.data.uploadFlag:
+            self.data.message_queue.put("Message: USB connection lost. This has likely caused the machine to loose it's calibration, which can cause erratic behavior. It is recommended to stop the program, remove the sled, and perform the chain calibration process. Press Continue to override and proceed with the cut. Once the machine is connected again it will raise the z-axis, move back to where it was and carry on from line " + str(self.data.gcodeIndex + 1) + ".")
+        else:
+            self.data.message_queue.put("It is possible that the serial port selected is not the one used by the Maslow's Arduino,\nor that the firmware is not loaded on the Arduino.")
+        self.data.connectionStatus = 0
+        self.recorder.flush()
+        try:
+            self.serialInstance.close()
+        except:
+            pass
+    
+    def getmessage (self):
+        '''
+        
+        The body of the thread. It connects to the machine and runs the connection, and when the
+        connection is lost it tries to connect again, waiting longer between each failed try.
+        
+        '''
+        
+        #check for serial version being > 3
+        if float(serial.VERSION[0]) < 3:
+            self.data.message_queue.put("Pyserial version 3.x is needed, version " + serial.VERSION + " is installed")
+        
+        self.telemetry  = self.data.serialTelemetry
+        self.checkpoint = StreamCheckpoint()
+        self.scheduler  = CommandScheduler(self.data, False)
+        self.recorder   = JobRecorder()
+        self.recordedIndex = None
+        
+        #the thread sleeps in the serial read until the machine sends something, so anything
+        #which gives it more to send has to wake it up
+        self.data.gcode_queue.wakeUp = self.wakeUp
+        self.data.quick_queue.wakeUp = self.wakeUp
+        self.data.bind(uploadFlag = self.wakeUp)
+        
+        retryDelay = self.firstRetryDelay
+        while True:
+            if self._connect():
+                self._runConnection()
+                retryDelay = self.firstRetryDelay
+            else:
+                time.sleep(retryDelay)
+                retryDelay = min(retryDelay*2, self.longestRetryDelay)
+    
+    def _runConnection(self):
+        '''
+        
+        Pass lines between Ground Control and the machine until the connection is lost.
+        
+        '''
+        
+        wroteSomething = True
+        while True:
             
-            # reset non-Arduino boards by sending 
-            self._write(b'\x18') # ctrl-X
-            
-            #print "port open?:"
-            #print self.serialInstance.isOpen()
-            self.lastMessageTime = time.time()
-            self.data.connectionStatus = 1
             
-            self._getFirmwareVersion()
-            self._setupMachineUnits()
+                                    #Read serial lines from machine
+            #-------------------------------------------------------------------------------------
+            #only wait for the machine if nothing was sent on the last pass, otherwise there may be more to send
+            try:
+                linesFromMachine = self._readLines(not wroteSomething)
+            except:
+                linesFromMachine = []
             
-            while True:
-                
-                
-                                        #Read serial line from machine if available
-                #-------------------------------------------------------------------------------------
-                lineFromMachine = ""
-                
+            for lineFromMachine in linesFromMachine:
+                message = parseMachineMessage(lineFromMachine)
                 try:
-                    if self.serialInstance.in_waiting > 0:
-                        lineFromMachine = self.serialInstance.readline()
-                        self.lastMessageTime = time.time()
-                        self.data.message_queue.put(lineFromMachine)
+                    self.data.message_queue.put(message)
                 except:
-                    pass
+                    print "Unable to pass on the line " + repr(lineFromMachine) + " from the machine"
                 
                 #Check if a line has been completed
-                if lineFromMachine == "ok\r\n" or (len(lineFromMachine) >= 6 and lineFromMachine[0:6] == "error:"):
-                    self.machineIsReadyForData = True
-                    if bool(self.lengthOfLastLineStack) is True:                                     #if we've sent lines to the machine
-                        self.bufferSpace = self.bufferSpace + self.lengthOfLastLineStack.pop()    #free up that space in the buffer
-                
-                
-                
-                                            #Write to the machine if ready
-                #-------------------------------------------------------------------------------------
-                
-                #send any emergency instructions to the machine if there are any
-                if self.data.quick_queue.empty() != True:
-                    command = self.data.quick_queue.get_nowait()
-                    self._write(command, True)
+                if message.kind == ACK or lineFromMachine[0:6] == "error:":
+                    self._lineAcknowledged()
                 
-                #send regular instructions to the machine if there are any
-                if self.bufferSpace == self.bufferSize and self.machineIsReadyForData:
-                    if self.data.gcode_queue.empty() != True:
-                        command = self.data.gcode_queue.get_nowait() + " "
-                        self._write(command)
+                if message.kind == POSITION and message.values is not None:
+                    self.checkpoint.positionReported(message.values)
+                    x, y, z = message.values
+                    self.recorder.position(x, y, z, self.checkpoint.lastAckedIndex)
+                elif message.kind == ERROR and message.values is not None:
+                    left, right = message.values
+                    self.recorder.error(left, right, self.checkpoint.lastAckedIndex)
                 
-                #Send the next line of gcode to the machine if we're running a program. Will send lines to buffer if there is space
-                #and the feature is turned on
-                if weAreBufferingLines:
-                    try:
-                        if self.bufferSpace > len(self.data.gcode[self.data.gcodeIndex]): #if there is space in the buffer keep sending lines
-                            self.sendNextLine()
-                    except IndexError:
-                        print "index error when reading gcode" #we don't want the whole serial thread to close if the gcode can't be sent because of an index error (file deleted...etc)
-                else:
-                    if self.bufferSpace == self.bufferSize and self.machineIsReadyForData: #if the receive buffer is empty and the machine has acked the last line complete
-                        self.sendNextLine()
-                
-                
-                                            #Check for serial connection loss
-                #-------------------------------------------------------------------------------------
-                if time.time() - self.lastMessageTime > 2:
-                    print "Connection Timed Out"
-                    self.data.message_queue.put("Connection Timed Out\n")
-                    if self.data.uploadFlag:
-                        self.data.message_queue.put("Message: USB connection lost. This has likely caused the machine to loose it's calibration, which can cause erratic behavior. It is recommended to stop the program, remove the sled, and perform the chain calibration process. Press Continue to override and proceed with the cut.")
-                    else:
-                        self.data.message_queue.put("It is possible that the serial port selected is not the one used by the Maslow's Arduino,\nor that the firmware is not loaded on the Arduino.")
-                    self.data.connectionStatus = 0
-                    self.serialInstance.close()
-                    return
+                if "overflow" in lineFromMachine.lower():
+                    self._bufferOverflowed()
+            
+            
+            
+                                        #Write to the machine if ready
+            #-------------------------------------------------------------------------------------
+            
+            wroteSomething = self._sendWaiting()
+            
+            self.telemetry.sample(self.bufferSize - self.bufferSpace, self.data.gcode_queue.qsize(), self.data.quick_queue.qsize(), self.data.message_queue.qsize())
+            self.checkpoint.flushIfDue()
+            self._updateRecording()
+            
+            
+                                        #Check for serial connection loss
+            #-------------------------------------------------------------------------------------
+            if time.time() - self.lastMessageTime > 2:
+                self._connectionLost()
+                return
                 
-                # Sleep between passes to save CPU
-                time.sleep(.001)
-                    
\ No newline at end of file
@@ -0,0 +1,341 @@
+'''
+
+This module runs the serial link to the machine in its own process so that drawing or anything
+else which keeps the interface busy can not hold up the lines being sent to the machine.
+
+SerialProcess is used in the interface process in place of starting a SerialPortThread. It starts
+a second process which runs runSerialProcess, and the two talk through:
+
+    commands  -  a multiprocessing Queue carrying what the interface asks for to the serial process
+    ring      -  a SharedRing carrying everything the serial process reports back
+
+'''
+
+from DataStructures.makesmithInitFuncs       import MakesmithInitFuncs
+from DataStructures.wakingQueue              import WakingQueue
+from DataStructures.serialTelemetry          import SerialTelemetry
+from DataStructures.sharedRing               import SharedRing
+from DataStructures.sharedGcodeProgram       import SharedGcodeProgram
+from DataStructures.mappedGcodeProgram       import MappedGcodeProgram
+from DataStructures.gcodeProgram             import GcodeProgram
+from DataStructures.gcodeTransform           import GcodeTransform
+from DataStructures.gcodeLoader              import GcodeLoader
+from DataStructures.machineMessage           import MachineMessage
+from kivy.clock                              import Clock
+import json
+import multiprocessing
+import os
+import tempfile
+import threading
+
+
+class SerialProcess(MakesmithInitFuncs):
+    '''
+
+    SerialProcess starts the serial process and keeps it in step with the data object. Commands
+    put on gcode_queue and quick_queue are passed on as soon as they are put, and changes to the
+    program, the transform, the units, uploadFlag and gcodeIndex are passed on when they happen.
+    The reports which come back are read from the ring on every frame and applied to the data
+    object, without passing the changes they cause back to the serial process.
+
+    '''
+
+    def start(self):
+        '''
+
+        Start the serial process.
+
+        '''
+
+        self.commands       = multiprocessing.Queue()
+        self.ring           = SharedRing()
+        self.applyingReport = False            #True while a report from the serial process is being applied
+        self.programLock    = threading.Lock() #keeps the programs passed on in the order they were loaded
+
+        self.process = multiprocessing.Process(target = runSerialProcess, args = (self.commands, self.ring))
+        self.process.daemon = True
+        self.process.start()
+
+        self.data.gcode_queue.wakeUp = self.passOnGcode
+        self.data.quick_queue.wakeUp = self.passOnQuickCommands
+
+        GcodeLoader.sharePrograms = True       #programs loaded from now on are written out for the serial process as they load
+
+        self.data.bind(gcode          = self.passOnProgram)
+        self.data.bind(gcodeTransform = self.passOnTransform)
+        self.data.bind(units          = self.passOnValue('units'))
+        self.data.bind(uploadFlag     = self.passOnValue('uploadFlag'))
+        self.data.bind(gcodeIndex     = self.passOnValue('gcodeIndex'))
+
+        self.passOnProgram()
+        self.passOnTransform()
+        self.commands.put(('gcodeIndex', self.data.gcodeIndex))
+
+        Clock.schedule_interval(self.readReports, .01)
+
+    def connect(self):
+        '''
+
+        Ask the serial process to connect to the machine using the current port and settings. Once
+        it is running the serial thread keeps trying to connect, so only the settings are updated.
+
+        '''
+        settings = dict((key, self.data.config.get('Maslow Settings', key)) for key in SerialProcessData.settingKeys)
+        self.commands.put(('connect', self.data.comport, self.data.units, settings))
+
+    def passOnGcode(self):
+        while not self.data.gcode_queue.empty():
+            self.commands.put(('gcode', self.data.gcode_queue.get_nowait()))
+
+    def passOnQuickCommands(self):
+        while not self.data.quick_queue.empty():
+            self.commands.put(('quick', self.data.quick_queue.get_nowait()))
+
+    def passOnValue(self, name):
+        '''
+
+        Returns a function which passes changes to the data property name on to the serial process.
+
+        '''
+        def passOn(instance, value):
+            if not self.applyingReport:
+                self.commands.put((name, value))
+        return passOn
+
+    def passOnTransform(self, *args):
+        transform = self.data.gcodeTransform
+        self.commands.put(('transform', (transform.xShift, transform.yShift, transform.rotation, transform.scale)))
+
+    def passOnProgram(self, *args):
+        '''
+
+        Share the current program with the serial process. A parsed program is passed on as the
+        path of the temporary file which the loader wrote it to, and which the serial process maps.
+        A large file which is read from the disk is opened again by the serial process using the
+        indexes built when it was loaded.
+
+        '''
+
+        self.commands.put(('gcodeFile', self.data.gcodeFile))
+
+        program = self.data.gcode
+        with self.programLock:
+            if program.isMapped:
+                if program.fileObject is not None:
+                    self.commands.put(('mappedProgram', program.fileObject.name, program.digits, program.indexes()))
+                return
+
+            if program.sharedPath is not None:
+                self.commands.put(('program', program.sharedPath))
+                program.sharedPath = None      #the serial process deletes the file once it has mapped it
+                return
+
+        #a program loaded before the serial process started is written out here, off the main thread
+        writer = threading.Thread(target = self.writeProgram, args = (program,))
+        writer.daemon = True
+        writer.start()
+
+    def writeProgram(self, program):
+        '''
+
+        Runs on a worker thread. Write program to a temporary file and pass its path on to the
+        serial process, unless a newer program has been loaded in the meantime.
+
+        '''
+
+        handle, path = tempfile.mkstemp(suffix = '.gprogram')
+        os.close(handle)
+        SharedGcodeProgram.write(program, path)
+        with self.programLock:
+            if self.data.gcode is program:
+                self.commands.put(('program', path))
+                return
+        os.remove(path)
+
+    def readReports(self, *args):
+        '''
+
+        Apply everything the serial process has reported since the last frame.
+
+        '''
+
+        self.applyingReport = True
+        try:
+            for record in self.ring.get():
+                kind, value = record[0], record[1:]
+                if kind == 'M':
+                    self.data.message_queue.put(value)
+                elif kind == 'E':
+                    self.data.message_queue.put(MachineMessage.unpack(value))
+                elif kind == 'L':
+                    self.data.logger.writeToLog(value)
+                elif kind == 'I':
+                    self.data.gcodeIndex = int(value)
+                elif kind == 'U':
+                    self.data.uploadFlag = int(value)
+                elif kind == 'C':
+                    self.data.connectionStatus = int(value)
+                elif kind == 'S':
+                    self.storeStatistics(value)
+        finally:
+            self.applyingReport = False
+
+    def storeStatistics(self, report):
+        '''
+
+        Copy a sample of the serial link statistics kept by the serial process into
+        data.serialTelemetry so that the Diagnostics menu can show it.
+
+        '''
+
+        values, histogram, totals = json.loads(report)
+        telemetry = self.data.serialTelemetry
+        telemetry.storeSample(values)
+        telemetry.histogram = histogram
+        telemetry.totalLines, telemetry.totalBytesSent, telemetry.totalBytesReceived = totals
+
+
+class ReportingQueue(object):
+    '''
+
+    Stands in for the message queue in the serial process, passing each message to the ring. A
+    MachineMessage is passed with the values already read from it so they are not read again.
+
+    '''
+
+    def __init__(self, ring, kind):
+        self.ring = ring
+        self.kind = kind
+
+    def put(self, message):
+        if isinstance(message, MachineMessage):
+            self.ring.put('E' + message.pack())
+        else:
+            self.ring.put(self.kind + message)
+
+    def qsize(self):
+        return 0
+
+    def writeToLog(self, message):
+        self.ring.put(self.kind + str(message))
+
+
+class SerialProcessData(object):
+    '''
+
+    Stands in for the data object in the serial process. It holds the values the serial thread
+    reads, and passes the changes the serial thread makes to uploadFlag, gcodeIndex and
+    connectionStatus back through the ring.
+
+    '''
+
+    settingKeys = ('bufferOn', 'jobTelemetry')  #the Maslow Settings which the serial thread reads
+
+    def __init__(self, ring):
+        self.ring             = ring
+        self.gcode_queue      = WakingQueue()
+        self.quick_queue      = WakingQueue()
+        self.message_queue    = ReportingQueue(ring, 'M')
+        self.logger           = ReportingQueue(ring, 'L')
+        self.serialTelemetry  = SerialTelemetry()
+        self.serialTelemetry.onSample = self.reportStatistics
+        self.config           = self
+        self.gcode            = GcodeProgram()
+        self.gcodeTransform   = GcodeTransform()
+        self.gcodeFile        = ""
+        self.comport          = ""
+        self.units            = "MM"
+        self.settings         = dict((key, "0") for key in self.settingKeys)
+        self.callbacks        = []
+        self._uploadFlag      = 0
+        self._gcodeIndex      = 0
+        self._connectionStatus = 0
+
+    def get(self, section, key):
+        return self.settings[key]              #the serial thread only reads settings in settingKeys
+
+    def bind(self, uploadFlag):
+        self.callbacks.append(uploadFlag)
+
+    def unbind(self, uploadFlag):
+        if uploadFlag in self.callbacks:
+            self.callbacks.remove(uploadFlag)
+
+    def setFromInterface(self, name, value):
+        '''
+
+        Set a value which was changed in the interface process, without reporting it back.
+
+        '''
+        setattr(self, '_' + name, value)
+        if name == 'uploadFlag':
+            for callback in self.callbacks:
+                callback(self, value)
+
+    def reportStatistics(self, telemetry, values):
+        totals = (telemetry.totalLines, telemetry.totalBytesSent, telemetry.totalBytesReceived)
+        self.ring.put('S' + json.dumps((values, telemetry.histogram, totals)))
+
+    def _report(name, kind):
+        def getValue(self):
+            return getattr(self, '_' + name)
+        def setValue(self, value):
+            setattr(self, '_' + name, value)
+            self.ring.put(kind + str(int(value)))
+        return property(getValue, setValue)
+
+    uploadFlag       = _report('uploadFlag', 'U')
+    gcodeIndex       = _report('gcodeIndex', 'I')
+    connectionStatus = _report('connectionStatus', 'C')
+    del _report
+
+
+def runSerialProcess(commands, ring):
+    '''
+
+    The body of the serial process. It carries out the commands from the interface process and
+    starts a SerialPortThread the first time it is asked to connect.
+
+    '''
+
+    from Connection.serialPortThread         import SerialPortThread
+
+    data   = SerialProcessData(ring)
+    thread = None
+
+    while True:
+        command = commands.get()
+        kind    = command[0]
+
+        if kind == 'connect':
+            data.comport, data.units, data.settings = command[1:]
+            if thread is None or not thread.is_alive():
+                serialPortThread = SerialPortThread()
+                serialPortThread.setUpData(data)
+                thread = threading.Thread(target = serialPortThread.getmessage)
+                thread.daemon = True
+                thread.start()
+        elif kind == 'gcode':
+            data.gcode_queue.put(command[1])
+        elif kind == 'quick':
+            if command[1][:1] == '!':
+                with data.gcode_queue.mutex:
+                    data.gcode_queue.queue.clear()    #the interface clears gcode_queue when it stops, but the commands have already been passed on
+            data.quick_queue.put(command[1])
+        elif kind == 'program':
+            program = SharedGcodeProgram(command[1])
+            os.remove(command[1])                  #the mapping stays valid after the file is gone
+            data.gcode = program
+        elif kind == 'mappedProgram':
+            program = MappedGcodeProgram()
+            program.openIndexed(command[1], command[2], command[3])
+            data.gcode = program
+        elif kind == 'gcodeFile':
+            data.gcodeFile = command[1]
+        elif kind == 'transform':
+            data.gcodeTransform = GcodeTransform(*command[1])
+        elif kind in ('uploadFlag', 'gcodeIndex', 'units'):
+            if kind == 'units':
+                data.units = command[1]
+            else:
+                data.setFromInterface(kind, command[1])
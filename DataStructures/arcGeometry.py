@@ -0,0 +1,109 @@
+'''
+
+This module provides the geometry of G2 and G3 arcs so that drawing and the bounds check find the
+sweep of an arc the same way.
+
+'''
+
+import math
+
+
+def arcSweep(xStart, yStart, xEnd, yEnd, centerX, centerY, clockwise):
+    '''
+
+    Returns (radius, startAngle, sweep) of an arc from the start point to the end point around the
+    center. sweep is negative for clockwise arcs. An arc which ends where it starts is a full
+    circle.
+
+    '''
+
+    radius = math.sqrt((xStart - centerX)**2 + (yStart - centerY)**2)
+
+    startAngle = math.atan2(yStart - centerY, xStart - centerX)
+    endAngle   = math.atan2(yEnd - centerY, xEnd - centerX)
+
+    sweep = endAngle - startAngle
+    if clockwise:
+        if sweep >= 0:
+            sweep = sweep - 2*math.pi
+    else:
+        if sweep <= 0:
+            sweep = sweep + 2*math.pi
+
+    return radius, startAngle, sweep
+
+
+def arcBounds(xStart, yStart, xEnd, yEnd, centerX, centerY, clockwise):
+    '''
+
+    Returns [minX, minY, maxX, maxY] of an arc. Besides its end points, an arc reaches the edge of
+    its circle's bounding box at each multiple of 90 degrees which it sweeps through.
+
+    '''
+
+    radius, startAngle, sweep = arcSweep(xStart, yStart, xEnd, yEnd, centerX, centerY, clockwise)
+
+    bounds = [min(xStart, xEnd), min(yStart, yEnd), max(xStart, xEnd), max(yStart, yEnd)]
+
+    lowAngle  = min(startAngle, startAngle + sweep)
+    highAngle = max(startAngle, startAngle + sweep)
+    quarter   = int(math.ceil(lowAngle/(math.pi/2)))
+    while quarter*(math.pi/2) <= highAngle:
+        side = quarter % 4
+        if side == 0:
+            bounds[2] = max(bounds[2], centerX + radius)
+        elif side == 1:
+            bounds[3] = max(bounds[3], centerY + radius)
+        elif side == 2:
+            bounds[0] = min(bounds[0], centerX - radius)
+        else:
+            bounds[1] = min(bounds[1], centerY - radius)
+        quarter = quarter + 1
+
+    return bounds
+
+
+def segmentsForArc(radius, sweep, tolerance):
+    '''
+
+    Returns the number of straight segments needed to follow an arc without any point of a segment
+    being further than tolerance from the arc.
+
+    '''
+
+    if radius <= tolerance:
+        return max(int(math.ceil(abs(sweep)/(math.pi/2))), 1)      #the arc is smaller than the tolerance
+
+    #a chord spanning angle a is at most r*(1 - cos(a/2)) from the arc
+    largestStep = 2*math.acos(1 - tolerance/radius)
+    return max(int(math.ceil(abs(sweep)/largestStep)), 1)
+
+
+def arcPoints(xStart, yStart, xEnd, yEnd, centerX, centerY, clockwise, tolerance):
+    '''
+
+    Returns a list of points along an arc from the start point to the end point around the center,
+    spaced so that the segments joining them stay within tolerance of the arc. The first and last
+    points are exactly the start and end points.
+
+    The points are found by turning the vector from the center by the same angle at each step, so
+    the cosine and sine only need to be found once for the whole arc.
+
+    '''
+
+    radius, startAngle, sweep = arcSweep(xStart, yStart, xEnd, yEnd, centerX, centerY, clockwise)
+    segments = segmentsForArc(radius, sweep, tolerance)
+
+    step    = sweep/segments
+    cosStep = math.cos(step)
+    sinStep = math.sin(step)
+
+    dx = xStart - centerX
+    dy = yStart - centerY
+
+    points = [(xStart, yStart)]
+    for _ in xrange(segments - 1):
+        dx, dy = dx*cosStep - dy*sinStep, dx*sinStep + dy*cosStep
+        points.append((centerX + dx, centerY + dy))
+    points.append((xEnd, yEnd))
+    return points
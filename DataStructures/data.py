@@ -7,7 +7,11 @@ from kivy.properties                                  import NumericProperty
 from kivy.event                                       import EventDispatcher
 from DataStructures.logger                            import   Logger
 from DataStructures.loggingQueue                      import   LoggingQueue
-import Queue
+from DataStructures.wakingQueue                       import   WakingQueue
+from DataStructures.serialTelemetry                   import   SerialTelemetry
+from DataStructures.gcodeProgram                      import   GcodeProgram
+from DataStructures.zLayerIndex                       import   ZLayerIndex
+from DataStructures.gcodeTransform                    import   GcodeTransform
 
 class Data(EventDispatcher):
     '''
@@ -24,8 +28,8 @@ class Data(EventDispatcher):
     Data available to all widgets
     '''
     
-    #Gcodes contains all of the lines of gcode in the opened file
-    gcode      = ObjectProperty([])
+    #Gcodes contains all of the lines of gcode in the opened file along with their parsed values
+    gcode      = ObjectProperty(GcodeProgram())
     version    = '1.28'
     #all of the available COM ports
     comPorts   = []
@@ -33,8 +37,11 @@ class Data(EventDispatcher):
     comport    = StringProperty("")
     #The index of the next unread line of Gcode
     gcodeIndex = NumericProperty(0)
-    #Index of changes in z
-    zMoves     = ObjectProperty([])
+    #The z-axis passes of the gcode, the line each one starts on and its depth
+    zLayers    = ObjectProperty(ZLayerIndex())
+    #Set while a gcode file is being read in the background and how far along it is in percent
+    gcodeLoading      = BooleanProperty(False)
+    gcodeLoadProgress = NumericProperty(0)
     #Holds the current value of the feed rate
     feedRate   = 20
     #holds the address of the g-code file so that the gcode can be refreshed
@@ -45,6 +52,7 @@ class Data(EventDispatcher):
     units      = OptionProperty("MM", options=["MM", "INCHES"])
     tolerance  = NumericProperty(0.5)
     gcodeShift = ObjectProperty([0.0,0.0])                          #the amount that the gcode has been shifted
+    gcodeTransform = ObjectProperty(GcodeTransform())               #the shift, rotation, and scale applied to the gcode as it is drawn and sent
     logger     =  Logger()                                          #the module which records the machines behavior to review later
     
     # Background image stuff, persist but not saved
@@ -78,6 +86,7 @@ class Data(EventDispatcher):
     '''
     fontColor                                             =  StringProperty('[color=7a7a7a]')
     drawingColor                                          =  ObjectProperty([.47,.47,.47])
+    cutPathColor                                          =  ObjectProperty([0,.6,.2])
     iconPath                                              =  StringProperty('./Images/Icons/normal/')
     posIndicatorColor                                     =  ObjectProperty([0,0,0])
     targetInicatorColor                                   =  ObjectProperty([1,0,0])
@@ -95,8 +104,13 @@ class Data(EventDispatcher):
     Queues
     '''
     message_queue   =  LoggingQueue(logger)
-    gcode_queue     =  Queue.Queue()
-    quick_queue     =  Queue.Queue()
+    gcode_queue     =  WakingQueue()
+    quick_queue     =  WakingQueue()
+    
+    '''
+    Statistics about the serial link, filled in by the serial thread
+    '''
+    serialTelemetry =  SerialTelemetry()
     
     def __init__(self):
         '''
@@ -0,0 +1,169 @@
+'''
+
+This module provides a cache on the disk of parsed gcode programs so that reopening a file which
+has been opened before does not need to parse it again.
+
+'''
+
+from DataStructures.gcodeProgram             import GcodeProgram
+from DataStructures.zLayerIndex              import ZLayerIndex
+from array                                   import array
+import hashlib
+import json
+import os
+
+
+class GcodeCache(object):
+    '''
+
+    GcodeCache stores parsed programs along with their z layer index and bounding box.
+
+    Each entry is keyed by a hash of the file contents, its modification time, and the settings
+    which change how it is parsed, so an entry is never used for a file which has changed. Entries
+    are single files made of a one line JSON header followed by the raw bytes of the program text
+    and columns. Reading an entry updates its modification time, and when the cache grows past
+    maxSize the entries which were used longest ago are deleted.
+
+    '''
+
+    formatVersion = 8                    #change this when the parser or the columns change
+
+    def __init__(self, directory = None, maxSize = 200000000):
+        '''
+
+        Create a cache in directory holding at most maxSize bytes. A maxSize of 0 turns the cache off.
+
+        '''
+        if directory is None:
+            directory = os.path.join(os.path.expanduser('~'), '.groundcontrol', 'gcodeCache')
+        self.directory = directory
+        self.maxSize   = maxSize
+
+    def key(self, filename, digits, tolerance):
+        '''
+
+        Returns the key for a file parsed with the given settings.
+
+        '''
+
+        contentHash = hashlib.sha1()
+        with open(filename, 'rb') as gcodeFile:
+            while True:
+                chunk = gcodeFile.read(1 << 20)
+                if not chunk:
+                    break
+                contentHash.update(chunk)
+
+        keyHash = hashlib.sha1()
+        keyHash.update(contentHash.hexdigest())
+        keyHash.update(repr(os.path.getmtime(filename)))
+        keyHash.update(repr((digits, tolerance, self.formatVersion)))
+        return keyHash.hexdigest()
+
+    def load(self, key):
+        '''
+
+        Returns (program, zLayers) for key or None if it is not in the cache.
+
+        '''
+
+        if self.maxSize <= 0:
+            return None
+
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as entry:
+                header = json.loads(entry.readline())
+                if header['formatVersion'] != self.formatVersion:
+                    return None
+
+                program = GcodeProgram()
+                program.text = bytearray(entry.read(header['textSize']))
+                for name, typecode, size in header['columns']:
+                    column = array(str(typecode))
+                    column.fromstring(entry.read(size))
+                    setattr(program, name, column)
+                program.boundingBox = header['boundingBox']
+                zLayers = ZLayerIndex(header['layerStarts'], header['layerDepths'], len(program))
+        except (IOError, OSError, ValueError, KeyError):
+            return None
+
+        try:
+            os.utime(path, None)                  #mark the entry as recently used
+        except OSError:
+            pass
+
+        return program, zLayers
+
+    def save(self, key, program, zLayers):
+        '''
+
+        Store a program in the cache and remove old entries if the cache is too big.
+
+        '''
+
+        if self.maxSize <= 0:
+            return
+
+        columns = []
+        for name in program.columnNames:
+            column = getattr(program, name)
+            columns.append((name, column.typecode, len(column)*column.itemsize))
+
+        header = {
+                    'formatVersion': self.formatVersion,
+                    'textSize':      len(program.text),
+                    'columns':       columns,
+                    'layerStarts':   zLayers.starts.tolist(),
+                    'layerDepths':   zLayers.depths.tolist(),
+                    'boundingBox':   program.boundingBox
+                 }
+
+        path          = self._path(key)
+        temporaryPath = path + '.' + str(os.getpid()) + '.tmp'
+        try:
+            if not os.path.isdir(self.directory):
+                os.makedirs(self.directory)
+            with open(temporaryPath, 'wb') as entry:
+                entry.write(json.dumps(header) + '\n')
+                entry.write(program.text)
+                for name in program.columnNames:
+                    entry.write(getattr(program, name).tostring())
+            os.rename(temporaryPath, path)    #the entry appears all at once so a half written file is never read
+        except (IOError, OSError):
+            try:
+                os.remove(temporaryPath)
+            except OSError:
+                pass
+            return
+
+        self.evict()
+
+    def evict(self):
+        '''
+
+        Delete the least recently used entries until the cache fits in maxSize.
+
+        '''
+
+        try:
+            entries = []
+            for name in os.listdir(self.directory):
+                if name.endswith('.gcache'):
+                    stats = os.stat(os.path.join(self.directory, name))
+                    entries.append((stats.st_mtime, stats.st_size, name))
+        except OSError:
+            return
+
+        totalSize = sum(size for modified, size, name in entries)
+        for modified, size, name in sorted(entries):
+            if totalSize <= self.maxSize:
+                break
+            try:
+                os.remove(os.path.join(self.directory, name))
+                totalSize = totalSize - size
+            except OSError:
+                pass
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + '.gcache')
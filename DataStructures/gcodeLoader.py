@@ -0,0 +1,175 @@
+'''
+
+This module reads and parses gcode files in a background thread so that the UI and the serial
+status display keep running while a large file loads.
+
+'''
+
+from DataStructures.makesmithInitFuncs       import MakesmithInitFuncs
+from DataStructures.gcodeProgram             import GcodeProgram
+from DataStructures.mappedGcodeProgram       import MappedGcodeProgram
+from DataStructures.gcodeCache               import GcodeCache
+from DataStructures.sharedGcodeProgram       import SharedGcodeProgram
+from DataStructures.zLayerIndex              import ZLayerIndex
+from kivy.clock                              import Clock
+from functools                               import partial
+import threading
+import tempfile
+import os
+
+
+class GcodeLoader(MakesmithInitFuncs):
+    '''
+
+    GcodeLoader runs the read/parse/index work for a gcode file on a worker thread.
+
+    Each load is given a number. Starting a new load changes the current number, which causes any
+    load still running to stop at its next progress report. Progress and the finished program are
+    passed back to the main thread with Clock.schedule_once so that the Kivy properties on the data
+    object are only ever changed from the main thread. The finished program and its z layer index
+    are published together in a single callback.
+    
+    Files larger than the 'largeFileSize' setting are opened as a MappedGcodeProgram, which indexes
+    the lines and modal state of the file here and reads each line from the disk when it is needed.
+    Other files are looked up in the GcodeCache first and only parsed if they are not found there.
+    When the serial link runs in its own process the program is also written out for it here, so
+    the interface never has to.
+
+    '''
+
+    loadNumber          = 0      #the number of the most recent load, older loads stop when they see it change
+    lastReportedPercent = -1
+    cache               = GcodeCache()
+    sharePrograms       = False  #set by SerialProcess, write each program to a file which the serial process maps
+
+    def load(self, filename, digits = None):
+        '''
+
+        Begin loading a file in the background. Loading "" blanks the gcode right away.
+
+        '''
+
+        self.loadNumber = self.loadNumber + 1
+
+        if filename == "":
+            self.data.gcodeLoading = False
+            self.data.gcode = GcodeProgram()
+            return
+
+        self.lastReportedPercent    = -1
+        self.data.gcodeLoadProgress = 0
+        self.data.gcodeLoading      = True
+
+        tolerance = self.data.tolerance
+        
+        try:
+            largeFileSize = float(self.data.config.get('Ground Control Settings', 'largeFileSize'))*1000000
+            useMappedFile = os.path.getsize(filename) > largeFileSize
+        except:
+            useMappedFile = False #if the file can't be found the error is reported by the loading thread
+        
+        try:
+            previewLines = int(self.data.config.get('Ground Control Settings', 'largeFilePreviewLines'))
+        except:
+            previewLines = None
+        
+        try:
+            self.cache.maxSize = float(self.data.config.get('Ground Control Settings', 'gcodeCacheSize'))*1000000
+        except:
+            pass
+
+        t = threading.Thread(target=self._loadInBackground, args=(self.loadNumber, filename, digits, tolerance, useMappedFile, previewLines))
+        t.daemon = True
+        t.start()
+
+    def cancel(self):
+        '''
+
+        Stop any load which is currently running without publishing its result.
+
+        '''
+        self.loadNumber = self.loadNumber + 1
+        self.data.gcodeLoading = False
+
+    def _loadInBackground(self, loadNumber, filename, digits, tolerance, useMappedFile, previewLines):
+        '''
+
+        Runs on the worker thread. Nothing in here may touch Kivy properties directly.
+
+        '''
+
+        try:
+            if useMappedFile:
+                program = MappedGcodeProgram()
+                if not program.open(filename, digits, partial(self._progress, loadNumber), previewLines):
+                    return #a newer load has replaced this one
+                zLayers = ZLayerIndex(lineCount = len(program)) #finding the passes would mean reading the whole file
+            else:
+                cacheKey = self.cache.key(filename, digits, tolerance)
+                cached   = self.cache.load(cacheKey)
+                if cached is not None:
+                    program, zLayers = cached
+                else:
+                    program = GcodeProgram()
+                    if not program.load(filename, digits, partial(self._progress, loadNumber)):
+                        return #a newer load has replaced this one
+                    zLayers = ZLayerIndex.fromProgram(program, tolerance)
+                    program.boundingBox = program.findBoundingBox()
+                    self.cache.save(cacheKey, program, zLayers)
+                if self.sharePrograms:
+                    handle, path = tempfile.mkstemp(suffix = '.gprogram')
+                    os.close(handle)
+                    SharedGcodeProgram.write(program, path)
+                    program.sharedPath = path
+        except:
+            Clock.schedule_once(partial(self._loadFailed, loadNumber))
+            return
+
+        Clock.schedule_once(partial(self._publish, loadNumber, program, zLayers))
+
+    def _progress(self, loadNumber, fraction):
+        '''
+
+        Called by the parser on the worker thread. Returns False to stop the parser if this load has
+        been replaced.
+
+        '''
+
+        if loadNumber != self.loadNumber:
+            return False
+
+        percent = int(100*fraction)
+        if percent != self.lastReportedPercent:
+            self.lastReportedPercent = percent
+            Clock.schedule_once(partial(self._reportProgress, loadNumber, percent))
+
+        return True
+
+    def _reportProgress(self, loadNumber, percent, *args):
+        if loadNumber == self.loadNumber:
+            self.data.gcodeLoadProgress = percent
+
+    def _publish(self, loadNumber, program, zLayers, *args):
+        '''
+
+        Hand the finished program to the rest of the program on the main thread.
+
+        '''
+
+        if loadNumber != self.loadNumber:
+            if program.sharedPath is not None:
+                os.remove(program.sharedPath)
+            return
+
+        self.data.gcodeLoadProgress = 100
+        self.data.zLayers      = zLayers
+        self.data.gcode        = program
+        self.data.gcodeLoading = False
+
+    def _loadFailed(self, loadNumber, *args):
+        if loadNumber != self.loadNumber:
+            return
+
+        self.data.gcodeLoading = False
+        self.data.message_queue.put("Message: Cannot reopen gcode file. It may have been moved or deleted. To locate it or open a different file use Actions > Open G-code")
+        self.data.gcodeFile = ""
@@ -0,0 +1,469 @@
+'''
+
+This module provides a single pass gcode tokenizer and the GcodeProgram object which holds its
+output. The file is read once and each line is stored both as the cleaned up text which is sent
+to the machine and as a set of compact numeric columns which the rest of the program can read
+without needing to search the text again.
+
+'''
+
+from DataStructures.arcGeometry              import arcBounds
+from array                                   import array
+import os
+import re
+
+#Flags describing what was found on each line
+HAS_X           = 1 << 0
+HAS_Y           = 1 << 1
+HAS_Z           = 1 << 2
+HAS_I           = 1 << 3
+HAS_J           = 1 << 4
+HAS_F           = 1 << 5
+SETS_INCHES     = 1 << 6      #line contains G20
+SETS_MM         = 1 << 7      #line contains G21
+SETS_ABSOLUTE   = 1 << 8      #line contains G90
+SETS_RELATIVE   = 1 << 9      #line contains G91
+SETS_XZ_PLANE   = 1 << 10     #line contains G18
+PASS_THROUGH    = 1 << 11     #line contains a command like G28 or G92 whose axis words are not a move
+
+NO_COMMAND      = -1          #value of the command column for lines which do not move the machine
+
+#Bits of the modalState column
+STATE_INCHES    = 1 << 0      #G20 is in effect, otherwise G21
+STATE_RELATIVE  = 1 << 1      #G91 is in effect, otherwise G90
+STATE_UNITS_SET = 1 << 2      #the file has given G20 or G21, otherwise the machine keeps its own units
+STATE_MODE_SET  = 1 << 3      #the file has given G90 or G91
+
+#which value column each letter is stored in, the HAS_ flag for column n is 1 << n
+COLUMN_OF_LETTER = {'X': 0, 'Y': 1, 'Z': 2, 'I': 3, 'J': 4, 'F': 5}
+
+#the flag set by each of the modal g commands which are tracked
+MODAL_FLAG_OF_G  = {20: SETS_INCHES, 21: SETS_MM, 90: SETS_ABSOLUTE, 91: SETS_RELATIVE, 18: SETS_XZ_PLANE}
+MODAL_FLAGS      = SETS_INCHES | SETS_MM | SETS_ABSOLUTE | SETS_RELATIVE
+
+#g commands which use the axis words on their line for something other than a move in the current
+#motion mode (dwell, setting offsets, homing, probing and moving in machine coordinates)
+PASS_THROUGH_G   = (4, 10, 28, 30, 38, 52, 53, 92)
+
+#m commands which are followed by text for the display rather than words
+MESSAGE_M        = ('117',)
+
+#matches one word (a letter followed by an optional number) of a line of gcode, a number can have
+#an exponent, so Y1E-2 is one word
+WORD = re.compile(r'([A-Za-z])\s*([+-]?(?:(?:[0-9]*\.[0-9]*|[0-9]+)(?:[eE][+-]?[0-9]+)?|[0-9]*))')
+
+
+class WordColumn(object):
+    '''
+
+    The value of one word (X, Y, Z, I, J or F) on each line of a program. The values are not stored,
+    the line is tokenized again when a value is asked for. The words of the most recently read line
+    are kept in the program's wordCache because the words of a line are usually read one after
+    another.
+
+    '''
+
+    def __init__(self, program, position):
+        self.program  = program
+        self.position = position
+
+    def __len__(self):
+        return len(self.program)
+
+    def __getitem__(self, index):
+        cachedIndex, values = self.program.wordCache
+        if cachedIndex != index:
+            tokens = tokenizeLine(self.program[index])
+            values = (0.0, 0.0, 0.0, 0.0, 0.0, 0.0) if tokens is None else tokens[2]
+            self.program.wordCache = (index, values)
+        return values[self.position]
+
+
+class GcodeProgram(object):
+    '''
+
+    GcodeProgram holds one gcode file. Indexing or slicing it returns the text of lines (ready to
+    be sent to the machine) so it can be used in place of a list of strings. The text of every line
+    is kept back to back in one bytearray with the start of each line stored in lineStarts, which
+    avoids the overhead of a separate string object for each line. The parsed values of each line
+    are available in the columns:
+
+        command  -  the motion command (0, 1, 2, or 3) for the line or NO_COMMAND
+        flags    -  which words were present and which modal commands the line contains
+        x, y, z, i, j, f  -  the value of each word, only meaningful if the matching flag is set.
+                            These are WordColumns which read the value from the text of the line.
+
+    The modal state table gives the state of the machine after each line has run, so the state at
+    any point in the file can be found without reading the lines before it:
+
+        absoluteX, absoluteY, absoluteZ  -  the position in the units in effect on that line
+        feedRate    -  the feed rate in effect
+        modalState  -  STATE_INCHES and STATE_RELATIVE bits, and whether the file has set them yet
+
+    The positions and feed rate are single precision, which is within a micron over the size of
+    the machine. The file is assumed to start at (0, 0, 0) in millimeters and absolute mode.
+
+    '''
+
+    isMapped               = False
+    linesPerProgressReport = 10000
+    sharedPath             = None           #a copy written for the serial process by SharedGcodeProgram.write, if any
+    
+    #the arrays which make up a program, other than the text
+    columnNames = ('lineStarts', 'command', 'flags', 'absoluteX', 'absoluteY', 'absoluteZ', 'feedRate', 'modalState')
+
+    def __init__(self):
+        '''
+
+        Create an empty program.
+
+        '''
+        self.text          = bytearray()
+        self.lineStarts    = array('I', [0])  #line n is text[lineStarts[n]:lineStarts[n+1]]
+        self.command = array('b')
+        self.flags   = array('H')
+        
+        self.absoluteX  = array('f')
+        self.absoluteY  = array('f')
+        self.absoluteZ  = array('f')
+        self.feedRate   = array('f')
+        self.modalState = array('B')
+        
+        self.wordCache = (-1, None)
+        self.x       = WordColumn(self, 0)
+        self.y       = WordColumn(self, 1)
+        self.z       = WordColumn(self, 2)
+        self.i       = WordColumn(self, 3)
+        self.j       = WordColumn(self, 4)
+        self.f       = WordColumn(self, 5)
+        
+        self.boundingBox = None                  #[minX, minY, maxX, maxY] of the positions the program moves through
+
+    def __len__(self):
+        return len(self.lineStarts) - 1
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[lineNumber] for lineNumber in xrange(*index.indices(len(self)))]
+
+        if index < 0:
+            index = index + len(self)
+        if index < 0 or index >= len(self):
+            raise IndexError("gcode line index out of range")
+
+        return str(self.text[self.lineStarts[index]:self.lineStarts[index+1]])
+
+    def __iter__(self):
+        for index in xrange(len(self)):
+            yield self[index]
+
+    def load(self, filename, digits = None, progress = None):
+        '''
+
+        Read and parse a gcode file from the disk. If digits is given, numbers are truncated to
+        that many places after the decimal point. If progress is given it is called every so often
+        with the fraction of the file read so far. Returns False if progress returned False to stop
+        the load early.
+
+        '''
+        fileSize = max(os.path.getsize(filename), 1)
+        with open(filename, 'rb') as gcodeFile:
+            return self.parse(gcodeFile, digits, progress, fileSize)
+
+    def parse(self, rawLines, digits = None, progress = None, totalSize = 1, keepEveryLine = False):
+        '''
+
+        Parse an iterable of raw lines in one pass. Comments and blank lines are removed, words
+        are separated by single spaces, and the modal state after each line is stored in the
+        columns. If keepEveryLine is True each raw line is filtered on its own and blank lines are
+        kept as "", so that line numbers match the file as MappedGcodeProgram numbers them.
+
+        '''
+
+        if digits is not None:
+            digits = int(digits)
+
+        motionCommand = 0     #the motion command stays in effect until a new one is given
+        modalState    = 0
+        xPosition     = 0.0
+        yPosition     = 0.0
+        zPosition     = 0.0
+        feedRate      = 0.0
+        inComment     = False #mach3 style comments can span lines
+        position      = 0
+
+        appendText   = self.text.extend
+        appendStart  = self.lineStarts.append
+        appendCommand = self.command.append
+        appendFlags  = self.flags.append
+        stateColumns = (self.absoluteX.append, self.absoluteY.append, self.absoluteZ.append, self.feedRate.append)
+        appendState  = self.modalState.append
+
+        for lineCount, rawLine in enumerate(rawLines):
+            lineStart = position
+            position  = position + len(rawLine)
+
+            if progress is not None and lineCount % self.linesPerProgressReport == 0:
+                if progress(float(lineStart)/totalSize) is False:
+                    return False
+
+            line, inComment = stripComments(rawLine, inComment and not keepEveryLine)
+            tokens = tokenizeLine(line, digits)
+            if tokens is None:
+                if not keepEveryLine:
+                    continue
+                tokens = ("", NO_COMMAND, None, 0)
+            text, command, values, flags = tokens
+
+            #lines which give coordinates without a command use the last motion command
+            if command != NO_COMMAND:
+                motionCommand = command
+            elif flags & (HAS_X | HAS_Y | HAS_Z | HAS_I | HAS_J):
+                command = motionCommand
+            if flags & PASS_THROUGH:
+                command = NO_COMMAND  #the axis words are not a move in the coordinates of the file
+
+            appendText(text)
+            appendStart(len(self.text))
+            appendCommand(command)
+            appendFlags(flags)
+
+            #update the modal state, modal commands take effect before the line moves
+            if flags & MODAL_FLAGS:
+                modalState = nextModalState(modalState, flags)
+
+            if flags & PASS_THROUGH:
+                pass
+            elif modalState & STATE_RELATIVE:
+                if flags & HAS_X:
+                    xPosition = xPosition + values[0]
+                if flags & HAS_Y:
+                    yPosition = yPosition + values[1]
+                if flags & HAS_Z:
+                    zPosition = zPosition + values[2]
+            else:
+                if flags & HAS_X:
+                    xPosition = values[0]
+                if flags & HAS_Y:
+                    yPosition = values[1]
+                if flags & HAS_Z:
+                    zPosition = values[2]
+            if flags & HAS_F:
+                feedRate = values[5]
+
+            for appendColumn, value in zip(stateColumns, (xPosition, yPosition, zPosition, feedRate)):
+                appendColumn(value)
+            appendState(modalState)
+
+        return True
+
+    def unitsAt(self, index):
+        '''
+
+        Returns "INCHES" or "MM", the units in effect after line index.
+
+        '''
+        return unitsOfState(self.modalState[index])
+
+    def modalCommandsBefore(self, index):
+        '''
+
+        Returns the gcode which puts the machine in the units and distance mode which are in effect
+        just before line index, for starting a program part way through. Modes which the file has
+        not set by then are left as the machine has them, so this can be ''.
+
+        '''
+
+        if index <= 0 or index > len(self):
+            return ''
+        return modalCommandsOfState(self.modalState[index-1])
+
+    def findBoundingBox(self):
+        '''
+
+        Returns [minX, minY, maxX, maxY] of the positions the program moves to, including the parts
+        of arcs which bulge past their end points, or None if the program never moves in X or Y.
+
+        '''
+
+        moves = [index for index in xrange(len(self)) if self.flags[index] & (HAS_X | HAS_Y) and not self.flags[index] & PASS_THROUGH]
+        if not moves:
+            return None
+
+        xValues = [self.absoluteX[index] for index in moves]
+        yValues = [self.absoluteY[index] for index in moves]
+        boundingBox = [min(xValues), min(yValues), max(xValues), max(yValues)]
+
+        for index, command in enumerate(self.command):
+            if command != 2 and command != 3:
+                continue
+            if index > 0:
+                xStart = self.absoluteX[index - 1]
+                yStart = self.absoluteY[index - 1]
+            else:
+                xStart = 0.0
+                yStart = 0.0
+            bounds = arcBounds(xStart, yStart, self.absoluteX[index], self.absoluteY[index],
+                               xStart + self.i[index], yStart + self.j[index], command == 2)
+            boundingBox[0] = min(boundingBox[0], bounds[0])
+            boundingBox[1] = min(boundingBox[1], bounds[1])
+            boundingBox[2] = max(boundingBox[2], bounds[2])
+            boundingBox[3] = max(boundingBox[3], bounds[3])
+
+        return boundingBox
+
+
+def unitsOfState(modalState):
+    '''
+
+    Returns the units ("INCHES" or "MM") of a modalState value.
+
+    '''
+    if modalState & STATE_INCHES:
+        return "INCHES"
+    return "MM"
+
+def nextModalState(modalState, flags):
+    '''
+
+    Returns the modalState after a line with flags.
+
+    '''
+    if flags & SETS_INCHES:
+        modalState = modalState | STATE_INCHES | STATE_UNITS_SET
+    if flags & SETS_MM:
+        modalState = (modalState & ~STATE_INCHES) | STATE_UNITS_SET
+    if flags & SETS_RELATIVE:
+        modalState = modalState | STATE_RELATIVE | STATE_MODE_SET
+    if flags & SETS_ABSOLUTE:
+        modalState = (modalState & ~STATE_RELATIVE) | STATE_MODE_SET
+    return modalState
+
+def modalCommandsOfState(modalState):
+    '''
+
+    Returns the gcode which sets the units and distance mode of a modalState value, leaving out
+    the ones which the file had not set.
+
+    '''
+
+    commands = ''
+    if modalState & STATE_UNITS_SET:
+        if modalState & STATE_INCHES:
+            commands = commands + 'G20 '
+        else:
+            commands = commands + 'G21 '
+    if modalState & STATE_MODE_SET:
+        if modalState & STATE_RELATIVE:
+            commands = commands + 'G91 '
+        else:
+            commands = commands + 'G90 '
+    return commands
+
+def formatValue(value):
+    '''
+
+    Format a coordinate with at most six decimal places and no trailing zeros.
+
+    '''
+
+    valueString = ('%.6f' % value).rstrip('0').rstrip('.')
+    if valueString == '-0':
+        valueString = '0'
+    return valueString
+
+def stripComments(line, inComment = False):
+    '''
+
+    Remove ( ) and ; style comments from a line. Returns the stripped line and whether a ( comment
+    is still open at the end of the line.
+
+    '''
+
+    if not inComment and '(' not in line and ';' not in line:
+        return line, False
+
+    kept = []
+    for character in line:
+        if inComment:
+            if character == ')':
+                inComment = False
+                kept.append(' ')
+        elif character == '(':
+            inComment = True
+        elif character == ';':
+            break
+        else:
+            kept.append(character)
+
+    return ''.join(kept), inComment
+
+def tokenizeLine(line, digits = None):
+    '''
+
+    Split one line (with its comments already removed) into words. Returns None for a blank line,
+    otherwise the cleaned up text of the line, the motion command given on the line (or
+    NO_COMMAND), the X, Y, Z, I, J, F values, and the flags. Numbers with an exponent are written
+    out in full since the firmware does not read exponents, and the text after an M117 is kept as
+    it is.
+
+    '''
+
+    original = line.strip()
+    line     = original.upper()
+    if not line:
+        return None
+
+    words   = []
+    flags   = 0
+    command = NO_COMMAND
+    values  = [0.0, 0.0, 0.0, 0.0, 0.0, 0.0]
+
+    for match in WORD.finditer(line):
+        letter, number = match.groups()
+
+        if letter == 'M' and number in MESSAGE_M:
+            words.append(letter + number)
+            message = original[match.end():].strip()
+            if message:
+                words.append(message)
+            break
+
+        if 'E' in number:
+            try:
+                number = formatValue(float(number))
+            except ValueError:
+                pass
+
+        if digits is not None:
+            decimal = number.find('.')
+            if decimal != -1:
+                number = number[:decimal + 1 + digits]
+
+        words.append(letter + number)
+
+        column = COLUMN_OF_LETTER.get(letter)
+        if column is not None:
+            try:
+                values[column] = float(number)
+            except ValueError:
+                continue
+            flags = flags | (1 << column)      #HAS_X through HAS_F follow the column order
+        elif letter == 'G':
+            try:
+                gNumber = int(float(number))
+            except ValueError:
+                continue
+            if 0 <= gNumber <= 3:
+                command = gNumber
+            elif gNumber in PASS_THROUGH_G:
+                flags = flags | PASS_THROUGH
+            else:
+                flags = flags | MODAL_FLAG_OF_G.get(gNumber, 0)
+
+    if words:
+        text = ' '.join(words) + ' '
+    else:
+        text = line + ' ' #keep lines like '%' which contain no words unchanged
+
+    return text, command, values, flags
@@ -0,0 +1,148 @@
+'''
+
+This module provides GcodeTransform which moves, rotates and scales a gcode program as it is drawn
+and sent to the machine, without changing the program itself.
+
+'''
+
+from DataStructures.gcodeProgram             import HAS_X, HAS_Y, HAS_I, HAS_J, SETS_RELATIVE, STATE_RELATIVE, PASS_THROUGH, formatValue
+import math
+
+
+class GcodeTransform(object):
+    '''
+
+    GcodeTransform holds the position of the home point along with a rotation (in degrees,
+    counter-clockwise about the origin of the file) and a scale for the X and Y axes. It is applied
+    to the parsed values of a line when the line is drawn or sent, so moving the home point only
+    needs a new transform instead of reloading the file.
+
+    A transform is not changed once it has been made. A new one is created whenever the settings
+    change so that the serial thread can read data.gcodeTransform at any time.
+
+    '''
+
+    def __init__(self, xShift = 0.0, yShift = 0.0, rotation = 0.0, scale = 1.0):
+        '''
+
+        Create a transform. The default transform leaves every line unchanged.
+
+        '''
+        self.xShift   = float(xShift)
+        self.yShift   = float(yShift)
+        self.rotation = float(rotation)
+        self.scale    = float(scale)
+
+        angle = math.radians(self.rotation)
+        self.cos = math.cos(angle)*self.scale
+        self.sin = math.sin(angle)*self.scale
+
+        self.isIdentity  = self.xShift == 0 and self.yShift == 0 and self.rotation == 0 and self.scale == 1
+        self.onlyShifts  = self.rotation == 0 and self.scale == 1
+
+        self.lastLine = (None, -1, None)     #the most recent line built by line(), the serial thread asks for each line twice
+
+    def point(self, x, y):
+        '''
+
+        Returns the transformed position of an absolute point.
+
+        '''
+        return (self.cos*x - self.sin*y + self.xShift, self.sin*x + self.cos*y + self.yShift)
+
+    def vector(self, x, y):
+        '''
+
+        Returns the transformed value of a relative distance, such as a G91 move or the I and J of
+        an arc, which is rotated and scaled but not moved.
+
+        '''
+        return (self.cos*x - self.sin*y, self.sin*x + self.cos*y)
+
+    def line(self, program, index):
+        '''
+
+        Returns the text of line index of a program with the transform applied to its X, Y, I and J
+        values. Lines which the transform does not change, and lines like G28 or G92 whose axis
+        words are not a move, are returned as they are.
+
+        '''
+
+        if self.isIdentity:
+            return program[index]
+
+        lastProgram, lastIndex, lastText = self.lastLine
+        if lastIndex == index and lastProgram is program:
+            return lastText
+
+        text  = program[index]
+        flags = program.flags[index]
+
+        if self.onlyShifts:
+            changesLine = flags & (HAS_X | HAS_Y)
+        else:
+            changesLine = flags & (HAS_X | HAS_Y | HAS_I | HAS_J)
+
+        relative = program.modalState[index] & STATE_RELATIVE or flags & SETS_RELATIVE
+        if relative and self.onlyShifts:
+            changesLine = False                  #relative moves are not moved by the home position
+        if flags & PASS_THROUGH:
+            changesLine = False
+
+        if changesLine:
+            text = self._rebuild(program, index, text, flags, relative)
+
+        self.lastLine = (program, index, text)
+        return text
+
+    def _rebuild(self, program, index, text, flags, relative):
+        '''
+
+        Replace the X, Y, I and J words of a line with their transformed values.
+
+        '''
+
+        values = {}
+
+        if flags & (HAS_X | HAS_Y):
+            if relative:
+                x = program.x[index] if flags & HAS_X else 0.0
+                y = program.y[index] if flags & HAS_Y else 0.0
+                x, y = self.vector(x, y)
+            else:
+                #the words on the line are exact, the position columns are only single precision
+                x = program.x[index] if flags & HAS_X else program.absoluteX[index]
+                y = program.y[index] if flags & HAS_Y else program.absoluteY[index]
+                x, y = self.point(x, y)
+
+            if self.onlyShifts:
+                if flags & HAS_X:
+                    values['X'] = x
+                if flags & HAS_Y:
+                    values['Y'] = y
+            else:
+                values['X'] = x                  #a rotated move along one axis moves along both
+                values['Y'] = y
+
+        if flags & (HAS_I | HAS_J) and not self.onlyShifts:
+            i = program.i[index] if flags & HAS_I else 0.0
+            j = program.j[index] if flags & HAS_J else 0.0
+            values['I'], values['J'] = self.vector(i, j)
+
+        words = text.split()
+        for position, word in enumerate(words):
+            letter = word[:1]
+            if letter in values:
+                words[position] = letter + formatValue(values.pop(letter))
+
+        #words which were not on the line go ahead of any Z or F word, which is where they usually appear
+        insertAt = len(words)
+        for position, word in enumerate(words):
+            if word[:1] == 'Z' or word[:1] == 'F':
+                insertAt = position
+                break
+        newWords = [axis + formatValue(values[axis]) for axis in ('X', 'Y', 'I', 'J') if axis in values]
+        words[insertAt:insertAt] = newWords
+
+        return ' '.join(words) + ' '
+
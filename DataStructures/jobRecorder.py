@@ -0,0 +1,174 @@
+'''
+
+This module provides JobRecorder which records what happens during a job as fixed size binary
+records, so that the position, the position error and the timing of a long job can be studied
+afterwards.
+
+A recording is a header of headerSize bytes followed by the records, each packed with
+recordFormat. With NumPy it can be loaded with
+
+    numpy.fromfile(path, dtype = numpy.dtype(JobRecorder.dtype), offset = JobRecorder.headerSize)
+
+and without it readRecords() reads it one record at a time.
+
+'''
+
+import json
+import os
+import struct
+import time
+
+
+class JobRecorder(object):
+    '''
+
+    JobRecorder is filled in by the serial thread while a program runs. Each record holds the time,
+    the kind of record, a program line and three values which depend on the kind:
+
+        POSITION  - a position report, line is the last program line acknowledged and a, b, c are
+                    the x, y and z of the machine
+        ERROR     - a position error report, line as for POSITION and a, b are the left and right
+                    chain errors
+        INDEX     - gcodeIndex moved, line is the new gcodeIndex
+        ACK       - the machine acknowledged a line, line is the program line or -1 for a line
+                    which was not from the program and a is the seconds since it was sent
+
+    Adding a record only packs it into a chunk in memory. A chunk is written to the file when it
+    is full or flushInterval seconds after the last one was written, so the file only ever holds
+    whole records.
+
+    '''
+
+    POSITION      = 1
+    ERROR         = 2
+    INDEX         = 3
+    ACK           = 4
+
+    recordFormat  = '<dB3xifff'
+    dtype         = [('time', '<f8'), ('kind', 'u1'), ('spare', 'V3'), ('line', '<i4'),
+                     ('a', '<f4'), ('b', '<f4'), ('c', '<f4')]
+    headerSize    = 512
+    chunkRecords  = 1024                       #records gathered before they are written
+    flushInterval = 2.0                        #the longest a record waits before it is written
+    directory     = 'jobTelemetry'             #where recordings are written, next to the log file
+
+    def __init__(self):
+        '''
+
+        Create a recorder which is not recording. Call start() to begin a recording.
+
+        '''
+        self.record        = struct.Struct(self.recordFormat)
+        self.chunk         = bytearray(self.chunkRecords*self.record.size)
+        self.count         = 0                 #records in chunk
+        self.recordFile    = None
+        self.lastFlushTime = time.time()
+
+    def isRecording(self):
+        return self.recordFile is not None
+
+    def start(self, gcodeFile):
+        '''
+
+        Begin a new recording of a job running gcodeFile. Returns the path of the recording.
+
+        '''
+
+        if self.recordFile is not None:
+            self.stop()
+
+        started = time.time()
+        name    = os.path.splitext(os.path.basename(gcodeFile))[0] or 'job'
+        path    = os.path.join(self.directory, name + time.strftime('-%Y%m%d-%H%M%S', time.localtime(started)) + '.gct')
+
+        headerFile = gcodeFile
+        while True:
+            header = json.dumps({'gcodeFile': headerFile, 'started': started,
+                                 'recordFormat': self.recordFormat, 'dtype': self.dtype})
+            header = 'GCTELEMETRY 1\n' + header
+            if len(header) < self.headerSize:
+                break
+            headerFile = headerFile[len(headerFile)/2:]     #keep the end of a long path, which has the file name
+
+        try:
+            if not os.path.isdir(self.directory):
+                os.makedirs(self.directory)
+            self.recordFile = open(path, 'wb')
+            self.recordFile.write(header.ljust(self.headerSize - 1) + '\n')
+        except (IOError, OSError):
+            print "Unable to record the job to " + path
+            self.recordFile = None
+            return None
+
+        self.count         = 0
+        self.lastFlushTime = started
+        return path
+
+    def stop(self):
+        '''
+
+        Write the records which are waiting and close the recording.
+
+        '''
+        if self.recordFile is None:
+            return
+        self.flush()
+        self.recordFile.close()
+        self.recordFile = None
+
+    def position(self, x, y, z, line):
+        self._add(self.POSITION, line, x, y, z)
+
+    def error(self, left, right, line):
+        self._add(self.ERROR, line, left, right, 0.0)
+
+    def index(self, line):
+        self._add(self.INDEX, line, 0.0, 0.0, 0.0)
+
+    def ack(self, line, latency):
+        self._add(self.ACK, line, latency, 0.0, 0.0)
+
+    def _add(self, kind, line, a, b, c):
+        if self.recordFile is None:
+            return
+        self.record.pack_into(self.chunk, self.count*self.record.size, time.time(), kind, line, a, b, c)
+        self.count = self.count + 1
+        if self.count == self.chunkRecords:
+            self.flush()
+
+    def flushIfDue(self):
+        if self.count and time.time() - self.lastFlushTime >= self.flushInterval:
+            self.flush()
+
+    def flush(self):
+        '''
+
+        Write the records gathered in the chunk to the file.
+
+        '''
+        if self.recordFile is not None and self.count:
+            try:
+                self.recordFile.write(buffer(self.chunk, 0, self.count*self.record.size))
+                self.recordFile.flush()
+            except (IOError, OSError):
+                print "Unable to write the job recording"
+        self.count         = 0
+        self.lastFlushTime = time.time()
+
+
+def readRecords(path):
+    '''
+
+    Returns the header of the recording at path as a dictionary and a list of its records as
+    (time, kind, line, a, b, c) tuples.
+
+    '''
+
+    record = struct.Struct(JobRecorder.recordFormat)
+    with open(path, 'rb') as recordFile:
+        header = recordFile.read(JobRecorder.headerSize)
+        data   = recordFile.read()
+
+    header  = json.loads(header.split('\n', 1)[1])
+    records = [record.unpack_from(data, position) for position in xrange(0, len(data) - record.size + 1, record.size)]
+    return header, records
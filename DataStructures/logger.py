@@ -6,19 +6,39 @@ behavior.
 '''
 
 from DataStructures.makesmithInitFuncs       import MakesmithInitFuncs
+import Queue
+import atexit
+import os
 import threading
+import time
 
 
 class Logger(MakesmithInitFuncs):
+    '''
+    
+    Messages written to the log are put on a queue and written to the file by a single thread, which
+    gathers them up and writes them together once flushSize bytes are waiting or flushInterval seconds
+    have passed. When the file grows past maxLogSize it is renamed to log.txt.1 (and the older files
+    move up to log.txt.2 and so on) and a new log is started, which is also done each time Ground
+    Control starts so that each run has its own log.
+    
+    '''
     
     errorValues = []
     recordingPositionalErrors = False 
     
-    messageBuffer = ""
+    logFileName     = "log.txt"
+    maxLogSize      = 5000000               #bytes written to a log file before it is rotated
+    logBackups      = 3                     #how many rotated log files are kept
+    flushSize       = 4096                  #bytes gathered before they are written
+    flushInterval   = 1.0                   #the longest a message waits before it is written
+    queueSize       = 10000                 #messages which can wait to be written before new ones are dropped
     
-    #clear the old log file
-    with open("log.txt", "a") as logFile:
-            logFile.truncate()
+    def __init__(self):
+        self.writeQueue      = None         #created with the writing thread when the first message is logged
+        self.writer          = None
+        self.startLock       = threading.Lock()
+        self.droppedMessages = 0
     
     def writeToLog(self, message):
         '''
@@ -26,34 +46,139 @@ class Logger(MakesmithInitFuncs):
         Writes a message into the log
         
         Actual writing is done in a separate thread to no lock up the UI because file IO is 
-        way slow
+        way slow. If the thread falls so far behind that the queue is full the message is dropped
+        rather than holding up the caller.
         
         '''
         
+        if isinstance(message, unicode):
+            message = message.encode('utf-8')
+        elif not isinstance(message, str):
+            return
+        
+        if self.writeQueue is None:
+            self._startWriter()
+        
         try:
-            self.messageBuffer = self.messageBuffer + message
-        except:
-            pass
+            self.writeQueue.put_nowait(message)
+        except Queue.Full:
+            self.droppedMessages = self.droppedMessages + 1
+    
+    def _startWriter(self):
+        '''
         
-        if len(self.messageBuffer) > 500:
-            
-            t = threading.Thread(target=self.writeToFile, args=(self.messageBuffer, "write"))
-            t.daemon = True
-            t.start()
-            self.messageBuffer = ""
+        Start the thread which writes the log.
+        
+        '''
+        with self.startLock:
+            if self.writeQueue is not None:
+                return                      #another thread started it first
+            writeQueue = Queue.Queue(self.queueSize)
+            self.writer = threading.Thread(target=self._writeLog, args=(writeQueue,))
+            self.writer.daemon = True
+            self.writer.start()
+            self.writeQueue = writeQueue
+            atexit.register(self.close)
     
-    def writeToFile(self, toWrite, *args):
+    def close(self):
         '''
         
-        Write to the log file
+        Write everything which is waiting and stop the writing thread. Called when Ground Control
+        exits.
         
+        '''
+        if self.writer is not None and self.writer.is_alive():
+            self.writeQueue.put(None)
+            self.writer.join(2)
+    
+    def _writeLog(self, writeQueue):
         '''
         
-        with open("log.txt", "a") as logFile:
-            logFile.write(toWrite)
+        The body of the writing thread. It sleeps until a message arrives and then gathers messages
+        until there are enough to write or the oldest has waited flushInterval seconds.
         
-        return
+        '''
         
+        self._rotate()
+        logFile = self._open()
+        
+        waiting     = []
+        waitingSize = 0
+        flushTime   = None                  #when the oldest waiting message must be written
+        stopping    = False
+        
+        while not stopping:
+            try:
+                if flushTime is None:
+                    message = writeQueue.get()
+                else:
+                    message = writeQueue.get(timeout = max(flushTime - time.time(), 0))
+            except Queue.Empty:
+                message = ""
+            else:
+                if message is None:
+                    stopping = True
+                    message  = ""
+            
+            if message:
+                waiting.append(message)
+                waitingSize = waitingSize + len(message)
+                if flushTime is None:
+                    flushTime = time.time() + self.flushInterval
+            
+            if waiting and (stopping or waitingSize >= self.flushSize or time.time() >= flushTime):
+                if self.droppedMessages:
+                    waiting.append("\n[" + str(self.droppedMessages) + " messages were not logged]\n")
+                    self.droppedMessages = 0
+                if logFile is not None:
+                    try:
+                        logFile.write("".join(waiting))
+                        logFile.flush()
+                        if logFile.tell() > self.maxLogSize:
+                            logFile.close()
+                            self._rotate()
+                            logFile = self._open()
+                    except (IOError, OSError):
+                        pass
+                waiting     = []
+                waitingSize = 0
+                flushTime   = None
+        
+        if logFile is not None:
+            logFile.close()
+    
+    def _open(self):
+        '''
+        
+        Open the log file to add to it. Returns None if it can't be opened, in which case messages
+        are thrown away.
+        
+        '''
+        try:
+            return open(self.logFileName, "a")
+        except IOError:
+            print "Unable to open " + self.logFileName
+            return None
+    
+    def _rotate(self):
+        '''
+        
+        Move the log file to log.txt.1, and each older log up by one, so that a new log is started.
+        
+        '''
+        try:
+            if not os.path.exists(self.logFileName) or os.path.getsize(self.logFileName) == 0:
+                return
+            for number in range(self.logBackups, 0, -1):
+                older = self.logFileName + "." + str(number)
+                newer = self.logFileName + "." + str(number - 1) if number > 1 else self.logFileName
+                if os.path.exists(newer):
+                    if os.path.exists(older):
+                        os.remove(older)            #rename will not replace a file on Windows
+                    os.rename(newer, older)
+        except OSError:
+            pass                            #the old log is kept growing if it can't be moved
+    
     def writeErrorValueToLog(self, error):
         '''
         
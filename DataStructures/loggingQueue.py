@@ -14,6 +14,6 @@ class LoggingQueue(Queue, object):
         super(LoggingQueue, self).__init__()
     
     def put(self, msg):
-        self.logger.writeToLog(msg)
+        self.logger.writeToLog(getattr(msg, 'line', msg))         #a MachineMessage is logged as the line it was read from
         return super(LoggingQueue, self).put(msg)
     
\ No newline at end of file
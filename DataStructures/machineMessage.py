@@ -0,0 +1,141 @@
+'''
+
+This module provides MachineMessage and parseMachineMessage which turn a line from the machine into
+a message whose values have already been read out of the text, so that the interface only has to
+act on it.
+
+'''
+
+import json
+import re
+
+
+#the kinds of message
+POSITION     = 'position'                     #<...MPos:x,y,z,WPos:...>          values are (x, y, z)
+ERROR        = 'error'                        #[PE:left,right,...]               values are (left, right)
+MEASUREMENT  = 'measurement'                  #[Measure: distance]               values are (distance,)
+REPORT       = 'report'                       #any other [...] report
+SETTING      = 'setting'                      #$parameter=value                  values are (parameter, value)
+NOTIFICATION = 'notification'                 #Message: text                     text is the text after Message:
+ALARM        = 'alarm'                        #ALARM: text                       text is the text after ALARM:
+PAUSED       = 'paused'                       #Maslow Paused
+FIRMWARE     = 'firmware'                     #Firmware Version x.xx             values are (version,)
+ACK          = 'ack'                          #ok
+TEXT         = 'text'                         #anything else, shown in the console
+
+floatPattern = re.compile("[-+]?(\d+(\.\d*)?|\.\d+)([eE][-+]?\d+)?")
+
+
+class MachineMessage(object):
+    '''
+
+    MachineMessage is one line from the machine, or a message for the user from Ground Control
+    itself. line is the whole line as it was received, text is the part of it which is shown to the
+    user and values holds the numbers read from it, or is None if the line could not be read.
+
+    '''
+
+    def __init__(self, kind, line, text = None, values = ()):
+        self.kind   = kind
+        self.line   = line
+        self.text   = line if text is None else text
+        self.values = values
+
+    def __str__(self):
+        return self.line
+
+    def pack(self):
+        '''
+
+        Returns the message as a string which unpack() turns back into a MachineMessage, to pass it
+        between processes. The line and text are passed byte for byte, since the machine can send
+        bytes which are not UTF-8, such as the noise of an Arduino resetting.
+
+        '''
+        return json.dumps((self.kind, toLatin1(self.line), toLatin1(self.text), self.values))
+
+    @staticmethod
+    def unpack(packed):
+        kind, line, text, values = json.loads(packed)
+        return MachineMessage(str(kind), line.encode('latin-1'), text.encode('latin-1'), values)
+
+
+def toLatin1(text):
+    '''
+
+    Returns text as unicode holding one character for each of its bytes, which json can always
+    write and encode('latin-1') turns back into the same bytes. Unicode text is written as UTF-8.
+
+    '''
+    if isinstance(text, unicode):
+        text = text.encode('utf-8')
+    return text.decode('latin-1')
+
+
+def parseMachineMessage(line):
+    '''
+
+    Returns a MachineMessage for line.
+
+    '''
+
+    if line[:1] == "<":
+        try:
+            start  = line.find('MPos:') + 5
+            end    = line.find('WPos:')
+            values = line[start:end].split(",")
+            return MachineMessage(POSITION, line, values = (float(values[0]), float(values[1]), float(values[2])))
+        except (ValueError, IndexError):
+            return MachineMessage(POSITION, line, values = None)
+    elif line[:1] == "$":
+        parameter, position = parseFloat(line, 0)
+        value, position     = parseFloat(line, position)
+        if parameter is None or value is None:
+            return MachineMessage(SETTING, line, values = None)
+        return MachineMessage(SETTING, line, values = (int(parameter), value))
+    elif line[:1] == "[":
+        if line[1:4] == "PE:":
+            try:
+                start = line.find(':') + 1
+                end   = line.find(',', start)
+                left  = float(line[start:end])
+                start = end + 1
+                end   = line.find(',', start)
+                right = float(line[start:end])
+                return MachineMessage(ERROR, line, values = (left, right))
+            except ValueError:
+                return MachineMessage(ERROR, line, values = None)
+        elif line[1:8] == "Measure":
+            try:
+                return MachineMessage(MEASUREMENT, line, values = (float(line[9:len(line)-3]),))
+            except ValueError:
+                return MachineMessage(MEASUREMENT, line, values = None)
+        return MachineMessage(REPORT, line)
+    elif line[0:13] == "Maslow Paused":
+        return MachineMessage(PAUSED, line)
+    elif line[0:8] == "Message:":
+        return MachineMessage(NOTIFICATION, line, line[9:])
+    elif line[0:6] == "ALARM:":
+        return MachineMessage(ALARM, line, line[7:])
+    elif line[0:8] == "Firmware":
+        try:
+            return MachineMessage(FIRMWARE, line, values = (float(line[-7:]),))
+        except ValueError:
+            return MachineMessage(FIRMWARE, line, values = None)
+    elif line == "ok\r\n":
+        return MachineMessage(ACK, line)
+    return MachineMessage(TEXT, line)
+
+
+def parseFloat(text, position = 0):
+    '''
+
+    Takes a string and parses out the float found at position default to 0 returning a list of the
+    matched float and the ending position of the float
+
+    '''
+    match = floatPattern.search(text[position:])
+    if match:
+        return (float(match.group(0)), match.end(0))
+    else:
+        return (None, position)
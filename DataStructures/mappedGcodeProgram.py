@@ -0,0 +1,374 @@
+'''
+
+This module provides MappedGcodeProgram which gives access to gcode files which are too large to
+hold in memory. The file is memory mapped and only the lines which are asked for are read, cleaned
+up and parsed.
+
+'''
+
+from DataStructures.gcodeProgram             import GcodeProgram, stripComments, tokenizeLine, unitsOfState, modalCommandsOfState, nextModalState
+from DataStructures.gcodeProgram             import NO_COMMAND, PASS_THROUGH, HAS_X, HAS_Y, STATE_RELATIVE
+from array                                   import array
+from bisect                                  import bisect_right
+from itertools                               import islice
+import mmap
+import os
+import re
+
+#finds the words which may change the units or distance mode, each line found is tokenized to be sure
+MODAL_WORD = re.compile(r'[Gg]\s*0*(20|21|90|91)(?![0-9.])')
+
+
+class MappedColumn(object):
+    '''
+
+    One column of a MappedGcodeProgram. It can be indexed like the columns of a GcodeProgram, the
+    line is parsed when its value is asked for.
+
+    '''
+
+    def __init__(self, program, position):
+        self.program  = program
+        self.position = position
+
+    def __len__(self):
+        return len(self.program)
+
+    def __getitem__(self, index):
+        return self.program.parsedLine(index)[self.position]
+
+
+class MappedGcodeProgram(object):
+    '''
+
+    MappedGcodeProgram can be used in place of a GcodeProgram for very large files.
+
+    Opening the file reads it once on the loading thread to build two small indexes:
+
+        blockLines, blockStarts  -  the number and start of the first line in each blockSize bytes
+                                    of the file, so finding line n only means counting the lines
+                                    from the start of its block
+        stateLines, states       -  the lines which change the units or distance mode and the
+                                    modal state after each of them
+
+    Streaming the file to the machine reads each line once, since the end of the line last read is
+    kept. Each line is filtered on its own, so comments which span several lines are not removed
+    and blank lines are kept (as "") so that line numbers match the file. The position columns
+    only hold the values given on each line itself, the modal state column is the true state of
+    the file. The first previewLines lines are also parsed into a GcodeProgram, preview, which the
+    canvas draws, numbered like the program itself. The number of lines in the preview is the
+    'largeFilePreviewLines' setting.
+
+    '''
+
+    isMapped     = True
+    blockSize    = 1 << 16       #bytes of the file for each entry in the line index
+    previewLines = 300000        #lines parsed into the preview
+    positionSearchLines = 10000  #lines looked back through by positionAt() to find a position
+
+    def __init__(self):
+        '''
+
+        Create an empty program.
+
+        '''
+        self.fileObject    = None
+        self.mappedFile    = None
+        self.fileSize      = 0
+        self.lineCount     = 0
+        self.digits        = None
+        self.blockLines    = array('L', [0])
+        self.blockStarts   = array('L', [0])
+        self.stateLines    = array('L')
+        self.states        = array('B')
+        self.lastLine      = (-1, 0, 0)         #the index, start and end of the line last found
+        self.cache         = (-1, None)         #the most recently parsed line
+        self.boundingBox   = None               #finding it would mean reading the whole file
+        self.preview       = GcodeProgram()
+
+        self.command = MappedColumn(self, 1)
+        self.x       = MappedColumn(self, 2)
+        self.y       = MappedColumn(self, 3)
+        self.z       = MappedColumn(self, 4)
+        self.i       = MappedColumn(self, 5)
+        self.j       = MappedColumn(self, 6)
+        self.f       = MappedColumn(self, 7)
+        self.flags   = MappedColumn(self, 8)
+        self.offset  = MappedColumn(self, 9)
+
+        self.absoluteX  = self.x
+        self.absoluteY  = self.y
+        self.absoluteZ  = self.z
+        self.feedRate   = self.f
+        self.modalState = MappedColumn(self, 10)
+
+    def open(self, filename, digits = None, progress = None, previewLines = None):
+        '''
+
+        Map a file and build its line and modal state indexes, then parse the preview. Works like
+        GcodeProgram.load, returning False if progress returned False to stop early. previewLines
+        replaces the number of lines in the preview if it is given.
+
+        '''
+
+        if previewLines is not None:
+            self.previewLines = int(previewLines)
+        self._map(filename, digits)
+        if self.fileSize == 0:
+            return True
+        mappedFile = self.mappedFile
+
+        #the first line starting in each block
+        lineCount  = 0
+        lineStart  = 0
+        for blockStart in xrange(self.blockSize, self.fileSize, self.blockSize):
+            if progress is not None and blockStart % (self.blockSize*64) == 0:
+                if progress(.5*blockStart/self.fileSize) is False:
+                    return False
+            nextStart = mappedFile.find('\n', blockStart - 1) + 1
+            if nextStart == 0:
+                break                         #the rest of the file is one line
+            if nextStart == lineStart:
+                continue                      #no line starts in this block
+            lineCount = lineCount + mappedFile[lineStart:nextStart].count('\n')
+            lineStart = nextStart
+            self.blockLines.append(lineCount)
+            self.blockStarts.append(lineStart)
+
+        lineCount = lineCount + mappedFile[lineStart:self.fileSize].count('\n')
+        if mappedFile[self.fileSize - 1] != '\n':
+            lineCount = lineCount + 1         #the last line does not end in a newline
+        self.lineCount = lineCount
+
+        #the lines which change the modal state
+        modalState = 0
+        lastLine   = -1
+        for blockStart in xrange(0, self.fileSize, self.blockSize):
+            if progress is not None and blockStart % (self.blockSize*64) == 0:
+                if progress(.5 + .4*blockStart/self.fileSize) is False:
+                    return False
+            blockEnd = min(blockStart + self.blockSize, self.fileSize)
+            for match in MODAL_WORD.finditer(mappedFile, blockStart, min(blockEnd + 16, self.fileSize)):
+                if match.start() >= blockEnd:
+                    break                     #found again by the next block
+                index = self.lineAt(match.start())
+                if index == lastLine:
+                    continue
+                lastLine = index
+
+                line, inComment = stripComments(self.rawLine(index))
+                tokens = tokenizeLine(line)
+                if tokens is None:
+                    continue
+                newState = nextModalState(modalState, tokens[3])
+                if newState != modalState:
+                    modalState = newState
+                    self.stateLines.append(index)
+                    self.states.append(modalState)
+
+        #the start of the file is drawn
+        mappedFile.seek(0)
+        previewProgress = None
+        if progress is not None:
+            previewProgress = lambda fraction: progress(.9 + .1*fraction)
+        previewSize = self.fileSize
+        if self.lineCount > self.previewLines:
+            previewSize = self.lineStart(self.previewLines)
+        rawLines = islice(iter(mappedFile.readline, ''), self.previewLines)
+        if self.preview.parse(rawLines, digits, previewProgress, previewSize, keepEveryLine = True) is False:
+            return False
+
+        return True
+
+    def indexes(self):
+        '''
+
+        Returns the indexes built by open(), so that another process can open the same file with
+        openIndexed() without reading it again.
+
+        '''
+        return (self.lineCount, self.blockLines, self.blockStarts, self.stateLines, self.states)
+
+    def openIndexed(self, filename, digits, indexes):
+        '''
+
+        Map a file using the indexes returned by indexes() of a program which opened it. There is
+        no preview.
+
+        '''
+        self._map(filename, digits)
+        self.lineCount, self.blockLines, self.blockStarts, self.stateLines, self.states = indexes
+
+    def _map(self, filename, digits):
+        if digits is not None:
+            digits = int(digits)
+        self.digits = digits
+
+        self.fileObject = open(filename, 'rb')
+        self.fileSize   = os.fstat(self.fileObject.fileno()).st_size
+        if self.fileSize > 0:
+            self.mappedFile = mmap.mmap(self.fileObject.fileno(), 0, access = mmap.ACCESS_READ)
+
+    def __len__(self):
+        return self.lineCount
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[lineNumber] for lineNumber in xrange(*index.indices(len(self)))]
+
+        if index < 0:
+            index = index + len(self)
+
+        return self.parsedLine(index)[0]
+
+    def __iter__(self):
+        for index in xrange(len(self)):
+            yield self[index]
+
+    def lineAt(self, position):
+        '''
+
+        Returns the number of the line which contains position in the file.
+
+        '''
+
+        block = bisect_right(self.blockStarts, position) - 1
+        return self.blockLines[block] + self.mappedFile[self.blockStarts[block]:position].count('\n')
+
+    def lineStart(self, index):
+        '''
+
+        Returns the position in the file where line index starts.
+
+        '''
+
+        return self._findLine(index)[0]
+
+    def rawLine(self, index):
+        '''
+
+        Returns line index exactly as it is in the file.
+
+        '''
+
+        if index < 0 or index >= self.lineCount:
+            raise IndexError("gcode line index out of range")
+
+        start, end = self._findLine(index)
+        return self.mappedFile[start:end]
+
+    def parsedLine(self, index):
+        '''
+
+        Returns (text, command, x, y, z, i, j, f, flags, offset, modalState) for a line. The last line parsed
+        is kept because the columns of the same line are usually read one after another.
+
+        '''
+
+        if index < 0:
+            index = index + len(self)
+
+        cachedIndex, cachedLine = self.cache
+        if index == cachedIndex:
+            return cachedLine
+
+        if index < 0 or index >= self.lineCount:
+            raise IndexError("gcode line index out of range")
+
+        start, end = self._findLine(index)
+        state      = self.stateAt(index)
+
+        line, inComment = stripComments(self.mappedFile[start:end])
+        tokens = tokenizeLine(line, self.digits)
+        if tokens is None:
+            parsed = ("", NO_COMMAND, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0, start, state)
+        else:
+            text, command, values, flags = tokens
+            if flags & PASS_THROUGH:
+                command = NO_COMMAND
+            parsed = (text, command) + tuple(values) + (flags, start, state)
+
+        self.cache = (index, parsed)
+        return parsed
+
+    def stateAt(self, index):
+        '''
+
+        Returns the modal state after line index.
+
+        '''
+
+        change = bisect_right(self.stateLines, index) - 1
+        if change < 0:
+            return 0
+        return self.states[change]
+
+    def unitsAt(self, index):
+        return unitsOfState(self.stateAt(index))
+
+    def positionAt(self, index):
+        '''
+
+        Returns the (x, y) the program has moved to after line index, or None if it can not be
+        found. The preview gives the position of its lines, past it the last X and Y words given
+        before the line are used, which is only the position while the file is in absolute mode.
+
+        '''
+
+        if index < len(self.preview):
+            return self.preview.absoluteX[index], self.preview.absoluteY[index]
+        if index < 0 or index >= self.lineCount:
+            return None
+
+        firstLine = max(index - self.positionSearchLines, 0)
+        end       = self._findLine(index)[1]
+        rawLines  = self.mappedFile[self.lineStart(firstLine):end].split('\n')[:index - firstLine + 1]
+
+        x = y = None
+        for lineNumber in xrange(index, firstLine - 1, -1):
+            if self.stateAt(lineNumber) & STATE_RELATIVE:
+                return None
+            line, inComment = stripComments(rawLines[lineNumber - firstLine])
+            tokens = tokenizeLine(line, self.digits)
+            if tokens is None or tokens[3] & PASS_THROUGH:
+                continue
+            text, command, values, flags = tokens
+            if x is None and flags & HAS_X:
+                x = values[0]
+            if y is None and flags & HAS_Y:
+                y = values[1]
+            if x is not None and y is not None:
+                return x, y
+
+        if firstLine > 0:
+            return None
+        return x or 0.0, y or 0.0             #the file starts at (0, 0)
+
+    def modalCommandsBefore(self, index):
+        if index <= 0 or index > len(self):
+            return ''
+        return modalCommandsOfState(self.stateAt(index-1))
+
+    def _findLine(self, index):
+        '''
+
+        Returns the start and end of line index, counting lines from the line last found if it is
+        in the same block, otherwise from the start of the block.
+
+        '''
+
+        block = bisect_right(self.blockLines, index) - 1
+        lastIndex, start, end = self.lastLine
+        if not (self.blockLines[block] <= lastIndex <= index):
+            lastIndex = self.blockLines[block]
+            start     = self.blockStarts[block]
+            end       = self.mappedFile.find('\n', start) + 1 or self.fileSize
+
+        find = self.mappedFile.find
+        while lastIndex < index:
+            start = end
+            end   = find('\n', start) + 1 or self.fileSize
+            lastIndex = lastIndex + 1
+
+        self.lastLine = (index, start, end)
+        return start, end
@@ -0,0 +1,201 @@
+'''
+
+This module provides SerialTelemetry which keeps statistics about the serial link to the machine
+so that a slow job can be traced to Ground Control, the USB link or the firmware.
+
+'''
+
+from array                                   import array
+import time
+
+
+class SerialTelemetry(object):
+    '''
+
+    SerialTelemetry is filled in by the serial thread. Counting a line or an ack only adds to a few
+    totals. Every sampleInterval seconds the totals are turned into one sample which is stored in a
+    ring of fixed size arrays, so the last capacity samples are kept without the memory growing.
+
+    The time from sending each line to its ok is also counted into a histogram with bins which
+    double in size. The interface counts how it handles the messages from the machine here too.
+
+    '''
+
+    sampleInterval  = .25                      #seconds between samples
+    capacity        = 2400                     #samples kept, ten minutes at the default interval
+
+    #the upper edge of each bin of the latency histogram in milliseconds, the last bin holds everything slower
+    latencyBins     = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024, 2048)
+
+    columns         = ('time', 'bufferUsed', 'gcodeQueue', 'quickQueue', 'messageQueue', 'linesPerSecond', 'bytesSentPerSecond', 'bytesReceivedPerSecond', 'averageLatency')
+
+    def __init__(self):
+        '''
+
+        Create empty statistics.
+
+        '''
+        self.samples    = [array('d', [0.0])*self.capacity for column in self.columns]
+        self.onSample   = None                 #called with each new sample when the statistics are kept in another process
+
+        #counted by the interface since Ground Control started
+        self.messagesHandled          = 0
+        self.positionReportsCoalesced = 0      #position reports skipped because a newer one was waiting
+        self.errorReportsCoalesced    = 0      #position error reports skipped because a newer one was waiting
+        self.framesOverBudget         = 0      #frames which left messages waiting for the next frame
+
+        self.reset()
+
+    def reset(self):
+        '''
+
+        Throw away all of the statistics, done each time the machine connects.
+
+        '''
+        self.nextSample   = 0                  #where the next sample goes in the ring
+        self.sampleCount  = 0
+        self.histogram    = [0]*(len(self.latencyBins) + 1)
+        self.totalLines   = 0
+        self.totalBytesSent     = 0
+        self.totalBytesReceived = 0
+        self.lastSampleTime = time.time()
+        self._clearInterval()
+
+    def _clearInterval(self):
+        self.linesSent      = 0
+        self.bytesSent      = 0
+        self.bytesReceived  = 0
+        self.acks           = 0
+        self.latencyTotal   = 0.0
+
+    def lineSent(self, byteCount):
+        self.linesSent = self.linesSent + 1
+        self.bytesSent = self.bytesSent + byteCount
+
+    def bytesRead(self, byteCount):
+        self.bytesReceived = self.bytesReceived + byteCount
+
+    def lineAcknowledged(self, latency):
+        '''
+
+        Count the time in seconds between sending a line and the machine acknowledging it.
+
+        '''
+        self.acks         = self.acks + 1
+        self.latencyTotal = self.latencyTotal + latency
+
+        milliseconds = latency*1000
+        for binNumber, upperEdge in enumerate(self.latencyBins):
+            if milliseconds < upperEdge:
+                self.histogram[binNumber] = self.histogram[binNumber] + 1
+                return
+        self.histogram[-1] = self.histogram[-1] + 1
+
+    def sample(self, bufferUsed, gcodeQueue, quickQueue, messageQueue):
+        '''
+
+        Store a sample if sampleInterval has passed since the last one. The serial thread calls
+        this on every pass with the current buffer use and queue lengths.
+
+        '''
+
+        now     = time.time()
+        elapsed = now - self.lastSampleTime
+        if elapsed < self.sampleInterval:
+            return
+
+        if self.acks:
+            averageLatency = self.latencyTotal/self.acks
+        else:
+            averageLatency = 0.0
+
+        values = (now, bufferUsed, gcodeQueue, quickQueue, messageQueue, self.linesSent/elapsed,
+                  self.bytesSent/elapsed, self.bytesReceived/elapsed, averageLatency)
+        self.storeSample(values)
+
+        self.totalLines         = self.totalLines + self.linesSent
+        self.totalBytesSent     = self.totalBytesSent + self.bytesSent
+        self.totalBytesReceived = self.totalBytesReceived + self.bytesReceived
+        self.lastSampleTime = now
+        self._clearInterval()
+
+        if self.onSample is not None:
+            self.onSample(self, values)
+
+    def storeSample(self, values):
+        '''
+
+        Add one sample, a tuple in the order of columns, to the ring.
+
+        '''
+        for column, value in zip(self.samples, values):
+            column[self.nextSample] = value
+
+        self.nextSample  = (self.nextSample + 1) % self.capacity
+        self.sampleCount = min(self.sampleCount + 1, self.capacity)
+
+    def rows(self):
+        '''
+
+        Returns the stored samples from oldest to newest as tuples in the order of columns.
+
+        '''
+
+        first = (self.nextSample - self.sampleCount) % self.capacity
+        rows  = []
+        for count in xrange(self.sampleCount):
+            position = (first + count) % self.capacity
+            rows.append(tuple(column[position] for column in self.samples))
+        return rows
+
+    def summary(self):
+        '''
+
+        Returns a description of the statistics to show to the user.
+
+        '''
+
+        rows = self.rows()
+        if not rows:
+            return "No serial statistics have been recorded yet. Connect to the machine first.\n" + self.interfaceSummary()
+
+        recent = rows[-40:]                    #about the last ten seconds
+        def average(position):
+            return sum(row[position] for row in recent)/len(recent)
+
+        text = "Over the last %.0f seconds:\n" % (recent[-1][0] - recent[0][0] + self.sampleInterval)
+        text = text + "    %.1f lines/s, %.0f bytes/s sent, %.0f bytes/s received\n" % (average(5), average(6), average(7))
+        text = text + "    %.1f bytes of the machine's buffer in use on average\n" % average(1)
+        text = text + "    queues waiting: %.1f gcode, %.1f quick, %.1f messages\n" % (average(2), average(3), average(4))
+        text = text + "\nSince connecting: %i lines, %i bytes sent, %i bytes received\n" % (self.totalLines, self.totalBytesSent, self.totalBytesReceived)
+
+        text = text + "\nTime from sending a line to its ok:\n"
+        acks = sum(self.histogram)
+        lowerEdge = 0
+        for binNumber, count in enumerate(self.histogram):
+            if binNumber < len(self.latencyBins):
+                label = "%i - %i ms" % (lowerEdge, self.latencyBins[binNumber])
+                lowerEdge = self.latencyBins[binNumber]
+            else:
+                label = "over %i ms" % lowerEdge
+            if count:
+                text = text + "    %-16s %8i  (%.1f%%)\n" % (label, count, 100.0*count/acks)
+        return text + self.interfaceSummary()
+
+    def interfaceSummary(self):
+        text = "\nMessages handled by the interface: %i\n" % self.messagesHandled
+        text = text + "    %i position reports and %i position error reports skipped for newer ones\n" % (self.positionReportsCoalesced, self.errorReportsCoalesced)
+        text = text + "    %i frames left messages for the next frame\n" % self.framesOverBudget
+        return text
+
+    def writeCSV(self, fileName):
+        '''
+
+        Write every stored sample to a CSV file, oldest first.
+
+        '''
+
+        with open(fileName, "w") as csvFile:
+            csvFile.write(",".join(self.columns) + "\n")
+            for row in self.rows():
+                csvFile.write(",".join("%.6f" % value for value in row) + "\n")
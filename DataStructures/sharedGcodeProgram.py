@@ -0,0 +1,111 @@
+'''
+
+This module provides SharedGcodeProgram which lets another process read a parsed GcodeProgram
+straight from memory, without copying or parsing it again.
+
+'''
+
+from DataStructures.gcodeProgram             import GcodeProgram, WordColumn, unitsOfState, modalCommandsOfState
+import ctypes
+import json
+import mmap
+
+
+class SharedGcodeProgram(object):
+    '''
+
+    SharedGcodeProgram is a read only view of a program which was written to a file by write().
+    The file is memory mapped, so the processes which open it share one copy of it, and each
+    column is a ctypes array laid over the mapped memory so reading a value does not copy anything.
+    It can be used in place of a GcodeProgram by code which only reads the program, like the serial
+    link.
+
+    '''
+
+    isMapped    = False
+    columnNames = GcodeProgram.columnNames
+
+    #the ctypes type which matches each array typecode used by GcodeProgram
+    ctypeOfTypecode = {'b': ctypes.c_byte, 'B': ctypes.c_ubyte, 'H': ctypes.c_ushort,
+                       'I': ctypes.c_uint, 'L': ctypes.c_ulong, 'f': ctypes.c_float, 'd': ctypes.c_double}
+
+    @staticmethod
+    def write(program, path):
+        '''
+
+        Write a GcodeProgram to path in the layout which SharedGcodeProgram reads: a one line JSON
+        header followed by the text and then each column, with every column starting on a multiple
+        of eight bytes.
+
+        '''
+
+        columns  = []
+        position = len(program.text)
+        for name in program.columnNames:
+            column   = getattr(program, name)
+            position = (position + 7) & ~7
+            columns.append((name, column.typecode, len(column), position))
+            position = position + len(column)*column.itemsize
+
+        header = json.dumps({'textSize': len(program.text), 'columns': columns}) + '\n'
+
+        with open(path, 'wb') as sharedFile:
+            sharedFile.write(header)
+            sharedFile.write(program.text)
+            for name, typecode, length, start in columns:
+                sharedFile.write('\0'*(len(header) + start - sharedFile.tell()))
+                sharedFile.write(getattr(program, name).tostring())
+
+    def __init__(self, path):
+        '''
+
+        Map a file written by write(). The file can be deleted once it has been opened.
+
+        '''
+
+        with open(path, 'rb') as sharedFile:
+            header = sharedFile.readline()
+            self.mappedFile = mmap.mmap(sharedFile.fileno(), 0, access = mmap.ACCESS_COPY)   #ctypes needs a writable buffer, nothing is written
+
+        layout = json.loads(header)
+        self.textStart = len(header)
+
+        for name, typecode, length, start in layout['columns']:
+            columnType = self.ctypeOfTypecode[str(typecode)]*length
+            setattr(self, name, columnType.from_buffer(self.mappedFile, self.textStart + start))
+
+        self.wordCache = (-1, None)
+        self.x         = WordColumn(self, 0)
+        self.y         = WordColumn(self, 1)
+        self.z         = WordColumn(self, 2)
+        self.i         = WordColumn(self, 3)
+        self.j         = WordColumn(self, 4)
+        self.f         = WordColumn(self, 5)
+
+        self.boundingBox = None
+
+    def __len__(self):
+        return len(self.lineStarts) - 1
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[lineNumber] for lineNumber in xrange(*index.indices(len(self)))]
+
+        if index < 0:
+            index = index + len(self)
+        if index < 0 or index >= len(self):
+            raise IndexError("gcode line index out of range")
+
+        return self.mappedFile[self.textStart + self.lineStarts[index]:self.textStart + self.lineStarts[index+1]]
+
+    def __iter__(self):
+        for index in xrange(len(self)):
+            yield self[index]
+
+    def unitsAt(self, index):
+        return unitsOfState(self.modalState[index])
+
+    def modalCommandsBefore(self, index):
+        if index <= 0 or index > len(self):
+            return ''
+        return modalCommandsOfState(self.modalState[index-1])
@@ -0,0 +1,106 @@
+'''
+
+This module provides SharedRing which passes messages from one process to another through shared
+memory without taking a lock for each message.
+
+'''
+
+import ctypes
+import multiprocessing
+import struct
+
+
+class SharedRing(object):
+    '''
+
+    SharedRing is a ring buffer in shared memory for a single writing process and a single reading
+    process. Each record is a string with its length in front of it. head counts every byte ever
+    written and tail every byte ever read, and only the writer changes head and only the reader
+    changes tail, so neither side needs a lock: the writer copies a record in before moving head
+    past it and the reader copies it out before moving tail.
+
+    When the ring is full the writer blocks on the roomMade event, which the reader sets each time
+    it takes records out.
+
+    The ring must be created before the reading or writing process is started so that both share
+    the same memory.
+
+    '''
+
+    lengthFormat = '<I'
+    lengthSize   = struct.calcsize(lengthFormat)
+
+    def __init__(self, size = 1 << 20):
+        '''
+
+        Create a ring holding size bytes.
+
+        '''
+        self.size   = size
+        self.buffer = multiprocessing.RawArray(ctypes.c_char, size)
+        self.head   = multiprocessing.RawValue(ctypes.c_ulonglong, 0)
+        self.tail   = multiprocessing.RawValue(ctypes.c_ulonglong, 0)
+        self.roomMade = multiprocessing.Event()
+
+    def put(self, record):
+        '''
+
+        Add a record. If the ring is full the writer waits for the reader to make room.
+
+        '''
+
+        data = struct.pack(self.lengthFormat, len(record)) + record
+        if len(data) > self.size:
+            raise ValueError("record is larger than the ring")
+
+        head = self.head.value
+        while self.size - (head - self.tail.value) < len(data):
+            #clear the event before looking again so that room made after the look still wakes the writer
+            self.roomMade.clear()
+            if self.size - (head - self.tail.value) >= len(data):
+                break
+            self.roomMade.wait()
+
+        self._copyIn(head, data)
+        self.head.value = head + len(data)
+
+    def get(self):
+        '''
+
+        Returns a list of every record which has been added since the last call.
+
+        '''
+
+        head = self.head.value
+        tail = self.tail.value
+        if head == tail:
+            return []
+
+        data = self._copyOut(tail, head - tail)
+
+        records  = []
+        position = 0
+        while position < len(data):
+            length,  = struct.unpack_from(self.lengthFormat, data, position)
+            position = position + self.lengthSize
+            records.append(data[position:position + length])
+            position = position + length
+
+        self.tail.value = head
+        self.roomMade.set()
+        return records
+
+    def _copyIn(self, start, data):
+        position = start % self.size
+        first    = min(len(data), self.size - position)
+        self.buffer[position:position + first] = data[:first]
+        if first < len(data):
+            self.buffer[0:len(data) - first] = data[first:]        #the record wraps around the end
+
+    def _copyOut(self, start, length):
+        position = start % self.size
+        first    = min(length, self.size - position)
+        data     = self.buffer[position:position + first]
+        if first < length:
+            data = data + self.buffer[0:length - first]
+        return data
@@ -0,0 +1,149 @@
+'''
+
+This module provides StreamCheckpoint which records how far a program has got on the machine so
+that a job can carry on from the right line if the connection to the machine is lost.
+
+'''
+
+from DataStructures.gcodeProgram             import modalCommandsOfState, STATE_INCHES, STATE_UNITS_SET
+from DataStructures.gcodeTransform           import formatValue
+import json
+import os
+import time
+
+
+class StreamCheckpoint(object):
+    '''
+
+    StreamCheckpoint is kept up to date by the serial thread with the last program line the machine
+    acknowledged, the modal state after it and the last position the machine reported. Recording
+    these only stores a value, and every flushInterval seconds the checkpoint is written to the disk
+    if it has changed so the last state of a job survives Ground Control closing.
+
+    '''
+
+    flushInterval = 2.0                        #seconds between writes to the disk
+
+    def __init__(self, path = None):
+        '''
+
+        Create an empty checkpoint which is written to path.
+
+        '''
+        if path is None:
+            path = os.path.join(os.path.expanduser('~'), '.groundcontrol', 'checkpoint.json')
+        self.path = path
+
+        self.lastAckedIndex  = -1              #the last program line the machine acknowledged
+        self.modalState      = 0               #the modal state after that line
+        self.position        = None            #the last (x, y, z) the machine reported
+        self.fileName        = ""
+        self.changed         = False
+        self.lastFlushTime   = time.time()
+
+    def lineAcknowledged(self, index, modalState):
+        self.lastAckedIndex = index
+        self.modalState     = modalState
+        self.changed        = True
+
+    def positionReported(self, position):
+        self.position = position
+
+    def clear(self):
+        '''
+
+        Forget the job, done when it is stopped or finishes.
+
+        '''
+        self.lastAckedIndex = -1
+        self.modalState     = 0
+        self.changed        = True
+
+    def resumeIndex(self):
+        '''
+
+        Returns the first line which the machine has not acknowledged.
+
+        '''
+        return self.lastAckedIndex + 1
+
+    def flushIfDue(self):
+        '''
+
+        Write the checkpoint to the disk if it has changed and flushInterval has passed.
+
+        '''
+
+        now = time.time()
+        if not self.changed or now - self.lastFlushTime < self.flushInterval:
+            return
+
+        state = {
+                    'fileName':       self.fileName,
+                    'lastAckedIndex': self.lastAckedIndex,
+                    'modalCommands':  modalCommandsOfState(self.modalState),
+                    'position':       self.position,
+                    'time':           now
+                }
+
+        temporaryPath = self.path + '.tmp'
+        try:
+            if not os.path.isdir(os.path.dirname(self.path)):
+                os.makedirs(os.path.dirname(self.path))
+            with open(temporaryPath, 'w') as checkpointFile:
+                json.dump(state, checkpointFile)
+            if os.path.exists(self.path):
+                os.remove(self.path)          #rename will not replace a file on Windows
+            os.rename(temporaryPath, self.path)
+        except (IOError, OSError):
+            pass
+
+        self.changed       = False
+        self.lastFlushTime = now
+
+
+def resumeCommands(program, transform, index):
+    '''
+
+    Returns the lines which put the machine back in the state it was in just before line index of
+    program so that sending can carry on from there: the units if the program has set them, then
+    raising the z-axis to the highest point of the program, moving to where line index starts,
+    going back down to the depth and feed rate in effect, and finally the units and distance mode
+    the program has set. A program read from the disk as it is sent does not know where each line
+    starts, so None is returned for it and the machine must be put back in place by the operator.
+
+    '''
+
+    if index <= 0 or index > len(program):
+        return []
+
+    if program.isMapped:
+        return None
+
+    before = index - 1
+    state  = program.modalState[before]
+
+    if not state & STATE_UNITS_SET:
+        lines = ['G90 ']
+    elif state & STATE_INCHES:
+        lines = ['G20 G90 ']
+    else:
+        lines = ['G21 G90 ']
+
+    safeZ = max(program.absoluteZ)
+    depth = program.absoluteZ[before]
+    x, y  = transform.point(program.absoluteX[before], program.absoluteY[before])
+
+    if safeZ > depth:
+        lines.append('G0 Z' + formatValue(safeZ) + ' ')
+    lines.append('G0 X' + formatValue(x) + ' Y' + formatValue(y) + ' ')
+    if safeZ > depth:
+        feed = program.feedRate[before]
+        if feed > 0:
+            lines.append('G1 Z' + formatValue(depth) + ' F' + formatValue(feed) + ' ')
+        else:
+            lines.append('G1 Z' + formatValue(depth) + ' ')
+
+    if modalCommandsOfState(state):
+        lines.append(modalCommandsOfState(state))
+    return lines
@@ -0,0 +1,533 @@
+'''
+
+This module turns the parsed columns of a GcodeProgram into the vertex and index arrays which the
+gcode canvas draws as Kivy Mesh instructions.
+
+'''
+
+from DataStructures.gcodeProgram             import HAS_X, HAS_Y, HAS_Z, SETS_INCHES, SETS_MM, SETS_XZ_PLANE, STATE_INCHES, NO_COMMAND
+from DataStructures.arcGeometry              import arcPoints
+from array                                   import array
+import math
+
+
+class MeshBatch(object):
+    '''
+
+    The vertices and indices of one Mesh instruction drawn in 'lines' mode. Each vertex is four
+    floats (x, y, and two unused texture coordinates) which is the default Mesh vertex format.
+
+    '''
+
+    def __init__(self):
+        self.vertices = array('f')
+        self.indices  = array('H')
+
+    def vertexCount(self):
+        return len(self.vertices)//4
+
+
+class ToolpathCell(object):
+    '''
+
+    ToolpathCell holds the segments of one group which start inside one square of the grid. The
+    segments are kept as polylines, flat arrays of x, y pairs, so that they can be simplified.
+
+    The full detail batches are extended as segments are added so that drawing a cell while the
+    toolpath is being built only costs as much as the segments added since it was last drawn.
+
+    '''
+
+    def __init__(self):
+        self.polylines  = []
+        self.lastPoint  = None         #the end of the last polyline, a segment starting here continues it
+        self.bounds     = [float('inf'), float('inf'), float('-inf'), float('-inf')]
+        self.simplified = {}           #level : polylines, filled in once the whole program has been added
+        self.batches    = {}           #level : list of MeshBatch, built when the level is first drawn
+        self.fullDetail = [MeshBatch()]
+        self.drawnUpTo  = (0, 0)       #the polyline and point which the full detail batches have reached
+
+    def intersects(self, minX, minY, maxX, maxY):
+        bounds = self.bounds
+        return bounds[0] <= maxX and bounds[2] >= minX and bounds[1] <= maxY and bounds[3] >= minY
+
+    def batchesFor(self, level, verticesPerMesh):
+        '''
+
+        Returns a list of MeshBatches drawing the cell at level, or at full detail if the cell has
+        not been simplified yet.
+
+        '''
+
+        if level != 0 and level in self.simplified:
+            batches = self.batches.get(level)
+            if batches is None:
+                batches = [MeshBatch()]
+                for polyline in self.simplified[level]:
+                    appendPolyline(batches, polyline, 0, verticesPerMesh)
+                self.batches[level] = batches
+            return batches
+
+        polylineIndex, pointIndex = self.drawnUpTo
+        while polylineIndex < len(self.polylines):
+            pointIndex = appendPolyline(self.fullDetail, self.polylines[polylineIndex], pointIndex, verticesPerMesh)
+            if polylineIndex == len(self.polylines) - 1:
+                break                      #the last polyline can still grow
+            polylineIndex = polylineIndex + 1
+            pointIndex    = 0
+        self.drawnUpTo = (polylineIndex, pointIndex)
+
+        return self.fullDetail
+
+
+class ToolpathGroup(object):
+    '''
+
+    ToolpathGroup holds every segment of one kind (feed moves, rapid moves, ...) sorted into the
+    squares of a uniform grid so that the canvas only needs to draw the squares which are on the
+    screen.
+
+    '''
+
+    pointsPerPolyline = 4096      #long polylines are split so that simplifying one stays quick
+
+    def __init__(self, grid):
+        self.grid  = grid
+        self.cells = {}           #(column, row) : ToolpathCell
+
+    def cellAt(self, x, y):
+        key  = self.grid.keyOf(x, y)
+        cell = self.cells.get(key)
+        if cell is None:
+            cell = ToolpathCell()
+            self.cells[key] = cell
+        return cell
+
+    def addSegment(self, x1, y1, x2, y2):
+        '''
+
+        Add a straight segment from (x1, y1) to (x2, y2). The segment belongs to the cell it
+        starts in.
+
+        '''
+
+        cell = self.cellAt(x1, y1)
+        if cell.lastPoint == (x1, y1) and len(cell.polylines[-1]) < 2*self.pointsPerPolyline:
+            cell.polylines[-1].extend((x2, y2))
+        else:
+            cell.polylines.append(array('f', (x1, y1, x2, y2)))
+
+        #this is called for every segment so the bounds are updated without calling min and max
+        bounds = cell.bounds
+        if x1 < bounds[0]: bounds[0] = x1
+        if x1 > bounds[2]: bounds[2] = x1
+        if y1 < bounds[1]: bounds[1] = y1
+        if y1 > bounds[3]: bounds[3] = y1
+        if x2 < bounds[0]: bounds[0] = x2
+        if x2 > bounds[2]: bounds[2] = x2
+        if y2 < bounds[1]: bounds[1] = y2
+        if y2 > bounds[3]: bounds[3] = y2
+
+        cell.lastPoint = (x2, y2)
+
+    def addPolyline(self, points):
+        '''
+
+        Add segments joining a list of (x, y) points.
+
+        '''
+
+        for index in xrange(1, len(points)):
+            x1, y1 = points[index - 1]
+            x2, y2 = points[index]
+            self.addSegment(x1, y1, x2, y2)
+
+
+class ToolpathGrid(object):
+    '''
+
+    The squares which the toolpath is divided into. The grid covers the area the program moves
+    through, positions outside it belong to the nearest square on the edge.
+
+    '''
+
+    def __init__(self, minX, minY, maxX, maxY, cellsAcross = 64):
+        self.minX        = minX
+        self.minY        = minY
+        self.cellsAcross = cellsAcross
+        self.cellSize    = max(maxX - minX, maxY - minY, 1.0)/cellsAcross
+
+    def keyOf(self, x, y):
+        column = int((x - self.minX)/self.cellSize)
+        row    = int((y - self.minY)/self.cellSize)
+        last   = self.cellsAcross - 1
+        if column < 0:
+            column = 0
+        elif column > last:
+            column = last
+        if row < 0:
+            row = 0
+        elif row > last:
+            row = last
+        return (column, row)
+
+
+class Toolpath(object):
+    '''
+
+    Toolpath builds the drawing of a program a few lines at a time so that the canvas can spread
+    the work over several frames. The segments are sorted into groups which are drawn in different
+    colors:
+
+        feed    -  G1, G2 and G3 moves
+        rapid   -  G0 moves
+        raise   -  a small circle where the z-axis moves up
+        plunge  -  a larger circle where the z-axis moves down
+
+    Each group is divided into the cells of a ToolpathGrid. Once every line has been added, the
+    polylines of each cell are simplified with the Douglas-Peucker algorithm at each of the
+    levelTolerances, so that when the view is zoomed out there are not many more vertices drawn
+    than there are pixels.
+
+    All positions are in millimeters in the coordinates of the file. The home position, rotation
+    and scale are applied by the canvas when the toolpath is drawn.
+
+    '''
+
+    zTolerance      = 0.05                    #z moves smaller than this (in mm) are not marked
+    markerSides     = 12                      #the number of sides of the circles marking z moves
+    markerShape     = [(math.cos(2*math.pi*side/markerSides), math.sin(2*math.pi*side/markerSides)) for side in xrange(markerSides + 1)]
+    levelTolerances = (0, .25, 1, 4, 16)      #the largest error (in mm) of each level of detail
+    verticesPerMesh = 16384                   #a Mesh can address at most 65536 vertices
+
+    def __init__(self, program, arcTolerance = 0.05, grid = None):
+        '''
+
+        Create an empty drawing of program. Arcs are drawn with segments which are no further than
+        arcTolerance (in mm) from the true arc. By default the grid covers the positions the
+        program moves through.
+
+        '''
+        self.program      = program
+        self.arcTolerance = arcTolerance
+
+        if grid is None:
+            scale = 1.0
+            if len(program) > 0 and program.unitsAt(len(program) - 1) == "INCHES":
+                scale = 25.4
+            boundingBox = program.boundingBox
+            if boundingBox is None and len(program) > 0:
+                boundingBox = [min(program.absoluteX), min(program.absoluteY), max(program.absoluteX), max(program.absoluteY)]
+            if boundingBox is not None:
+                grid = ToolpathGrid(min(boundingBox[0]*scale, 0), min(boundingBox[1]*scale, 0),
+                                    max(boundingBox[2]*scale, 0), max(boundingBox[3]*scale, 0))
+            else:
+                grid = ToolpathGrid(0, 0, 0, 0)
+        self.grid = grid
+
+        self.groups  = {
+                        'feed':   ToolpathGroup(self.grid),
+                        'rapid':  ToolpathGroup(self.grid),
+                        'raise':  ToolpathGroup(self.grid),
+                        'plunge': ToolpathGroup(self.grid)
+                       }
+
+        self.linesAdded    = 0         #the lines before this have been added
+        self.cellsToSimplify = None    #the cells still to be simplified once all of the lines are added
+        self.units         = None      #the units last set by the file, if any
+        self.usesXZPlane   = False     #True once a G18 has been found, its arcs are drawn in the XY plane
+        self.xPosition     = 0.0
+        self.yPosition     = 0.0
+        self.zPosition     = 0.0
+
+    def isComplete(self):
+        return self.linesAdded >= len(self.program) and self.cellsToSimplify == []
+
+    def levelFor(self, sizeOfPixel):
+        '''
+
+        Returns the coarsest level of detail whose error is no larger than one pixel.
+
+        '''
+
+        level = 0
+        for index, tolerance in enumerate(self.levelTolerances):
+            if tolerance <= sizeOfPixel:
+                level = index
+        return level
+
+    def addLines(self, count):
+        '''
+
+        Add the next count lines of the program to the drawing.
+
+        '''
+
+        program    = self.program
+        end        = min(self.linesAdded + count, len(program))
+        commands   = program.command
+        flagColumn = program.flags
+        absoluteX  = program.absoluteX
+        absoluteY  = program.absoluteY
+        absoluteZ  = program.absoluteZ
+        modalState = program.modalState
+        feed       = self.groups['feed']
+        rapid      = self.groups['rapid']
+
+        xPosition  = self.xPosition
+        yPosition  = self.yPosition
+        zPosition  = self.zPosition
+
+        for index in xrange(self.linesAdded, end):
+            flags   = flagColumn[index]
+            command = commands[index]
+
+            if flags & (SETS_INCHES | SETS_MM | SETS_XZ_PLANE):
+                if flags & SETS_XZ_PLANE:
+                    self.usesXZPlane = True
+                if flags & SETS_INCHES:
+                    self.units = "INCHES"
+                if flags & SETS_MM:
+                    self.units = "MM"
+
+            if command == NO_COMMAND:
+                continue
+
+            if modalState[index] & STATE_INCHES:
+                scale = 25.4
+            else:
+                scale = 1.0
+
+            xTarget = xPosition
+            yTarget = yPosition
+            zTarget = zPosition
+            if flags & (HAS_X | HAS_Y):
+                xTarget = absoluteX[index]*scale
+                yTarget = absoluteY[index]*scale
+            if flags & HAS_Z:
+                zTarget = absoluteZ[index]*scale
+
+            if command == 0 or command == 1:
+                if xTarget != xPosition or yTarget != yPosition:
+                    if command == 0:
+                        rapid.addSegment(xPosition, yPosition, xTarget, yTarget)
+                    else:
+                        feed.addSegment(xPosition, yPosition, xTarget, yTarget)
+            else:
+                centerX = xPosition + program.i[index]*scale
+                centerY = yPosition + program.j[index]*scale
+                feed.addPolyline(arcPoints(xPosition, yPosition, xTarget, yTarget, centerX, centerY, command == 2, self.arcTolerance))
+
+            #If the z position has changed, mark where it happened
+            if abs(zTarget - zPosition) >= self.zTolerance:
+                if zTarget > zPosition:
+                    self._addMarker(self.groups['raise'], xPosition, yPosition, 1)
+                else:
+                    self._addMarker(self.groups['plunge'], xPosition, yPosition, 2)
+
+            xPosition = xTarget
+            yPosition = yTarget
+            zPosition = zTarget
+
+        self.xPosition  = xPosition
+        self.yPosition  = yPosition
+        self.zPosition  = zPosition
+        self.linesAdded = end
+
+        if self.linesAdded >= len(program) and self.cellsToSimplify is None:
+            self.cellsToSimplify = [cell for group in self.groups.itervalues() for cell in group.cells.itervalues()]
+
+    def simplifyCells(self, count):
+        '''
+
+        Build the simplified levels of detail of the next count cells. Returns the number of
+        points which were simplified.
+
+        '''
+
+        if not self.cellsToSimplify:
+            return 0
+
+        pointCount = 0
+        for _ in xrange(min(count, len(self.cellsToSimplify))):
+            cell      = self.cellsToSimplify.pop()
+            polylines = cell.polylines
+            for level in xrange(1, len(self.levelTolerances)):
+                tolerance = self.levelTolerances[level]
+                pointCount = pointCount + sum(len(polyline) for polyline in polylines)//2
+                polylines  = [simplify(polyline, tolerance) for polyline in polylines]
+                polylines  = [polyline for polyline in polylines if len(polyline) >= 4]
+                cell.simplified[level] = polylines  #each level is simplified from the one before it
+        return pointCount
+
+    def _addMarker(self, group, x, y, radius):
+        '''
+
+        Add a circle around (x, y) to group.
+
+        '''
+
+        group.addPolyline([(x + radius*cosine, y + radius*sine) for cosine, sine in self.markerShape])
+
+
+class CutPath(Toolpath):
+    '''
+
+    CutPath draws the part of a program which has already been sent to the machine, starting from
+    the line the job was started on. Lines are only ever added to the end, so keeping it up to date
+    as the job runs costs as much as the lines sent since the last update. Everything is kept in a
+    single cell and z moves are not marked.
+
+    '''
+
+    def __init__(self, program, startIndex, arcTolerance = 0.05):
+        '''
+
+        Create an empty drawing of program which starts at line startIndex.
+
+        '''
+        Toolpath.__init__(self, program, arcTolerance, ToolpathGrid(0, 0, 0, 0, cellsAcross = 1))
+
+        #start from where the machine is when it reaches startIndex
+        self.linesAdded = min(startIndex, len(program))
+        if self.linesAdded > 0:
+            index = self.linesAdded - 1
+            scale = 25.4 if program.modalState[index] & STATE_INCHES else 1.0
+            self.xPosition = program.absoluteX[index]*scale
+            self.yPosition = program.absoluteY[index]*scale
+            self.zPosition = program.absoluteZ[index]*scale
+
+    def addLinesTo(self, index):
+        '''
+
+        Add the lines up to (not including) index.
+
+        '''
+        if index > self.linesAdded:
+            self.addLines(index - self.linesAdded)
+
+    def batchesFor(self, name):
+        '''
+
+        Returns the MeshBatches of one group.
+
+        '''
+        cell = self.groups[name].cells.get((0, 0))
+        if cell is None:
+            return []
+        return cell.batchesFor(0, self.verticesPerMesh)
+
+    def _addMarker(self, group, x, y, radius):
+        pass
+
+
+def appendPolyline(batches, polyline, start, verticesPerMesh):
+    '''
+
+    Add the points of a polyline from point start onwards to the last of a list of MeshBatches,
+    starting new batches as they fill. If start is not 0, point start - 1 must be the last vertex
+    added. Returns the number of points in the polyline.
+
+    '''
+
+    pointCount = len(polyline)//2
+    point  = start
+    batch  = batches[-1]
+    joined = start > 0                     #the previous point is the last vertex of the batch
+
+    while point < pointCount:
+        if batch.vertexCount() + (1 if joined else 2) > verticesPerMesh:
+            batch  = MeshBatch()
+            batches.append(batch)
+            joined = False
+
+        vertices = batch.vertices
+        if not joined:
+            if point == 0:
+                vertices.extend((polyline[0], polyline[1], 0.0, 0.0))
+                point = 1
+            else:
+                vertices.extend((polyline[2*point - 2], polyline[2*point - 1], 0.0, 0.0))
+
+        previous = batch.vertexCount() - 1
+        count    = min(pointCount - point, verticesPerMesh - batch.vertexCount())
+        indices  = batch.indices
+        for offset in xrange(count):
+            vertices.extend((polyline[2*(point + offset)], polyline[2*(point + offset) + 1], 0.0, 0.0))
+            indices.extend((previous + offset, previous + offset + 1))
+
+        point  = point + count
+        joined = True
+
+    return pointCount
+
+
+def simplify(polyline, tolerance):
+    '''
+
+    Returns a simplified copy of a polyline (a flat array of x, y pairs) which stays within
+    tolerance of the original. Points closer than tolerance to the last point kept are dropped
+    first, which is cheap and removes most points, then the Douglas-Peucker algorithm removes the
+    points which lie close to the line between the points either side of them.
+
+    '''
+
+    pointCount = len(polyline)//2
+    if pointCount <= 2:
+        return polyline
+
+    #radial distance pass
+    squaredTolerance = tolerance*tolerance
+    xs = [polyline[0]]
+    ys = [polyline[1]]
+    lastX = polyline[0]
+    lastY = polyline[1]
+    for point in xrange(1, pointCount - 1):
+        x = polyline[2*point]
+        y = polyline[2*point + 1]
+        if (x - lastX)**2 + (y - lastY)**2 > squaredTolerance:
+            xs.append(x)
+            ys.append(y)
+            lastX = x
+            lastY = y
+    xs.append(polyline[2*pointCount - 2])
+    ys.append(polyline[2*pointCount - 1])
+
+    #Douglas-Peucker pass
+    keep  = [False]*len(xs)
+    keep[0]  = True
+    keep[-1] = True
+    stack = [(0, len(xs) - 1)]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+
+        x1 = xs[first]
+        y1 = ys[first]
+        dx = xs[last] - x1
+        dy = ys[last] - y1
+        lengthSquared = dx*dx + dy*dy
+
+        furthest = first
+        furthestDistance = squaredTolerance
+        for point in xrange(first + 1, last):
+            if lengthSquared == 0:
+                distance = (xs[point] - x1)**2 + (ys[point] - y1)**2
+            else:
+                cross    = (xs[point] - x1)*dy - (ys[point] - y1)*dx
+                distance = cross*cross/lengthSquared
+            if distance > furthestDistance:
+                furthest = point
+                furthestDistance = distance
+
+        if furthest != first:
+            keep[furthest] = True
+            stack.append((first, furthest))
+            stack.append((furthest, last))
+
+    simplified = array('f')
+    for point in xrange(len(xs)):
+        if keep[point]:
+            simplified.extend((xs[point], ys[point]))
+    return simplified
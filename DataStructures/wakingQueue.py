@@ -0,0 +1,21 @@
+'''
+
+This module provides a simple addition to the Queue, which is that it calls a wake up function
+after each put so that a thread which is blocked waiting on something else (like the serial port)
+notices the new item straight away instead of polling the queue.
+
+'''
+
+from Queue import Queue
+
+
+class WakingQueue(Queue, object):
+    def __init__(self):
+        self.wakeUp = None          #set by the thread which reads from the queue
+        super(WakingQueue, self).__init__()
+    
+    def put(self, item, block = True, timeout = None):
+        super(WakingQueue, self).put(item, block, timeout)
+        wakeUp = self.wakeUp
+        if wakeUp is not None:
+            wakeUp()
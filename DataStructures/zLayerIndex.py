@@ -0,0 +1,131 @@
+'''
+
+This module provides ZLayerIndex which records where each z-axis pass of a gcode program starts
+so that the gcode index can be moved from pass to pass without searching the program.
+
+'''
+
+from DataStructures.gcodeProgram             import HAS_Z
+from array                                   import array
+from bisect                                  import bisect_right
+
+
+class ZLayerIndex(object):
+    '''
+
+    ZLayerIndex divides a program into passes at each line where the z-axis depth changes by more
+    than a tolerance. Each pass begins one line before its z move, so that starting from a pass
+    also runs the move which positions the machine above it, and runs to the line before the next
+    pass. The first pass always begins at line 0.
+
+    The passes are kept in two arrays sorted by their first line, so the pass holding any line is
+    found with a binary search.
+
+    '''
+
+    def __init__(self, starts = None, depths = None, lineCount = 0):
+        '''
+
+        Create an index from the first line and depth of each pass. With no passes the whole
+        program is one pass at a depth of 0.
+
+        '''
+        if not starts:
+            starts = [0]
+            depths = [0.0]
+
+        self.starts    = array('L', starts)     #the first line of each pass
+        self.depths    = array('d', depths)     #the z-axis depth of each pass
+        self.lineCount = lineCount
+
+    @classmethod
+    def fromProgram(cls, program, tolerance):
+        '''
+
+        Build the index for a parsed GcodeProgram. The depths come from the absoluteZ column so
+        relative moves are handled.
+
+        '''
+
+        starts = [0]
+        depths = [0.0]
+        lastZ  = None
+        flags     = program.flags
+        absoluteZ = program.absoluteZ
+        for index in xrange(len(program)):
+            if flags[index] & HAS_Z:
+                z = absoluteZ[index]
+                if lastZ is None:
+                    depths[0] = z                       #the first z move sets the depth of the first pass
+                elif abs(z - lastZ) > tolerance:
+                    start = max(index - 1, 0)
+                    if start == starts[-1]:
+                        depths[-1] = z                  #two z moves in a row, the second one sets the depth
+                    else:
+                        starts.append(start)
+                        depths.append(z)
+                lastZ = z
+
+        return cls(starts, depths, len(program))
+
+    def __len__(self):
+        return len(self.starts)
+
+    def layerAt(self, index):
+        '''
+
+        Returns the number of the pass which line index is part of.
+
+        '''
+        return max(bisect_right(self.starts, index) - 1, 0)
+
+    def startOf(self, layer):
+        '''
+
+        Returns the first line of a pass. Pass numbers past either end are clamped.
+
+        '''
+        layer = min(max(layer, 0), len(self.starts) - 1)
+        return self.starts[layer]
+
+    def depthOf(self, layer):
+        '''
+
+        Returns the z-axis depth of a pass.
+
+        '''
+        layer = min(max(layer, 0), len(self.starts) - 1)
+        return self.depths[layer]
+
+    def moveFrom(self, index, moves):
+        '''
+
+        Returns the first line of the pass moves passes after (or before if moves is negative) the
+        pass holding line index. Moving back from part way through a pass counts going to the start
+        of that pass as the first move. Moving forward from the last pass stays at index.
+
+        '''
+
+        layer = self.layerAt(index)
+        if moves < 0 and index > self.starts[layer]:
+            layer = layer + 1
+        target = self.startOf(layer + moves)
+        if moves > 0 and target <= index:
+            return index
+        return target
+
+    def layers(self):
+        '''
+
+        Returns a list of (depth, firstLine, lastLine) for every pass.
+
+        '''
+
+        layers = []
+        for layer in xrange(len(self.starts)):
+            if layer + 1 < len(self.starts):
+                lastLine = self.starts[layer + 1] - 1
+            else:
+                lastLine = max(self.lineCount - 1, self.starts[layer])
+            layers.append((self.depths[layer], self.starts[layer], lastLine))
+        return layers
@@ -169,6 +169,20 @@ settings = {
                 "desc": "Buffer gcode on arduino to increase execution speed. Requres restart to take effect. Experimental.",
                 "key": "bufferOn",
                 "default": 0
+            },
+            {
+                "type": "bool",
+                "title": "Serial Connection In Separate Process",
+                "desc": "Run the connection to the machine in its own process so that a busy screen can not delay the gcode being sent. Not available on Windows. Requires restart to take effect. Experimental.",
+                "key": "serialProcess",
+                "default": 0
+            },
+            {
+                "type": "bool",
+                "title": "Record Job Telemetry",
+                "desc": "Record the position, the position error and the timing of each job to a compact file in the jobTelemetry folder, for studying long jobs. Takes effect when the machine next connects.",
+                "key": "jobTelemetry",
+                "default": 0
             }
         ],
     "Advanced Settings":
@@ -281,6 +295,20 @@ settings = {
                 "key": "homeY",
                 "default": 0.0
             },
+            {
+                "type": "string",
+                "title": "Rotation",
+                "desc": "The angle in degrees to rotate the gcode counter-clockwise about its origin",
+                "key": "rotation",
+                "default": 0.0
+            },
+            {
+                "type": "string",
+                "title": "Scale",
+                "desc": "The amount to scale the X and Y coordinates of the gcode by",
+                "key": "scale",
+                "default": 1.0
+            },
             {
                 "type": "bool",
                 "title": "Truncate Floating Point Numbers",
@@ -478,6 +506,41 @@ settings = {
                 "key": "validExtensions",
                 "default": ".nc, .ngc, .text, .gcode"
             },
+            {
+                "type": "string",
+                "title": "Large File Size in MB",
+                "desc": "Gcode files larger than this are read from the disk one line at a time as they are needed instead of being loaded into memory. Large files open quickly but only the number of lines set by Lines Drawn From Large Files are drawn on the screen.",
+                "key": "largeFileSize",
+                "default": 100
+            },
+            {
+                "type": "string",
+                "title": "Lines Drawn From Large Files",
+                "desc": "The number of lines at the start of a large file which are drawn on the screen. Drawing more lines uses more memory and takes longer when the file is opened.",
+                "key": "largeFilePreviewLines",
+                "default": 300000
+            },
+            {
+                "type": "string",
+                "title": "Gcode Cache Size in MB",
+                "desc": "Parsed gcode files are saved in a cache in your home directory so that they open quickly the next time. When the cache is larger than this the files used longest ago are removed. Set to 0 to turn the cache off.",
+                "key": "gcodeCacheSize",
+                "default": 200
+            },
+            {
+                "type": "string",
+                "title": "Arc Drawing Tolerance",
+                "desc": "Arcs are drawn on the screen as straight segments which stray at most this far from the true arc, in mm. Smaller values draw smoother arcs but take longer.",
+                "key": "arcTolerance",
+                "default": 0.05
+            },
+            {
+                "type": "string",
+                "title": "Drawing Time Per Frame in ms",
+                "desc": "How long to spend drawing gcode between screen updates while a file is being drawn. Larger values draw files sooner but make the screen less responsive while drawing. The number of lines drawn per second is written to the log when drawing finishes.",
+                "key": "frameBudget",
+                "default": 8
+            },
             {
                 "type": "string",
                 "title": "Reset View Scale",
@@ -177,6 +177,40 @@ class Diagnostics(FloatLayout, MakesmithInitFuncs):
                             size_hint=(0.85, 0.95), auto_dismiss = False)
         self._popup.open()
     
+    def showSerialStatistics(self):
+        '''
+        
+        Show the statistics which the serial thread keeps about the link to the machine
+        
+        '''
+        
+        content = ScrollableTextPopup(cancel = self.dismiss_popup, text = self.data.serialTelemetry.summary())
+        if sys.platform.startswith('darwin'):
+            self._popup = Popup(title="Serial Link Statistics", content=content, size=(520,400), size_hint=(.6, .6))
+        else:
+            self._popup = Popup(title="Serial Link Statistics", content=content, size=(520,400), size_hint=(None, None))
+        self._popup.open()
+    
+    def exportSerialStatistics(self):
+        '''
+        
+        Write the recorded serial link statistics to serialStatistics.csv next to the log file
+        
+        '''
+        
+        fileName = os.path.abspath("serialStatistics.csv")
+        try:
+            self.data.serialTelemetry.writeCSV(fileName)
+        except IOError:
+            popupText = "Unable to write " + fileName
+        else:
+            popupText = "The serial link statistics were written to " + fileName
+        
+        #a Message: would pause a running program, so the result is shown here instead
+        content = ScrollableTextPopup(cancel = self.dismiss_popup, text = popupText)
+        self._popup = Popup(title="Export Serial Statistics", content=content, size=(520,200), size_hint=(None, None))
+        self._popup.open()
+    
     def advancedOptionsFunctions(self, text):
         
         if   text == "Test Feedback System":
@@ -195,3 +229,7 @@ class Diagnostics(FloatLayout, MakesmithInitFuncs):
             self.resetAllSettings()
         elif text == "Compute chain calibration factors":
             self.measureChainTolerances()
+        elif text == "Serial Link Statistics":
+            self.showSerialStatistics()
+        elif text == "Export Serial Statistics":
+            self.exportSerialStatistics()
@@ -12,10 +12,10 @@ from DataStructures.makesmithInitFuncs         import MakesmithInitFuncs
 from kivy.uix.popup                            import Popup
 from UIElements.touchNumberInput               import TouchNumberInput
 from UIElements.zAxisPopupContent              import ZAxisPopupContent
+from UIElements.zLayerPopupContent             import ZLayerPopupContent
 from DataStructures.data                       import Data
 from math                                      import sqrt
 from time                                      import time
-import re
 import global_variables
 
 class FrontPage(Screen, MakesmithInitFuncs):
@@ -36,9 +36,6 @@ class FrontPage(Screen, MakesmithInitFuncs):
     numericalPosX  = 0.0
     numericalPosY  = 0.0
 
-    previousPosX = 0.0
-    previousPosY = 0.0   
-
     lastpos=(0,0,0)
     lasttime=0.0
     tick=0
@@ -83,6 +80,8 @@ class FrontPage(Screen, MakesmithInitFuncs):
         self.zRight.textColor                   = self.data.fontColor
         self.zLeft.btnBackground                = self.data.iconPath + 'Generic.png'
         self.zLeft.textColor                    = self.data.fontColor
+        self.zLayerBtn.btnBackground            = self.data.iconPath + 'Generic.png'
+        self.zLayerBtn.textColor                = self.data.fontColor
         self.oneLeft.btnBackground              = self.data.iconPath + 'Generic.png'
         self.oneLeft.textColor                  = self.data.fontColor
         self.oneRight.btnBackground             = self.data.iconPath + 'Generic.png'
@@ -151,6 +150,8 @@ class FrontPage(Screen, MakesmithInitFuncs):
         self.data.bind(gcodeIndex       = self.onIndexMove)
         self.data.bind(gcodeFile        = self.onGcodeFileChange)
         self.data.bind(uploadFlag       = self.onUploadFlagChange)
+        self.data.bind(gcodeLoadProgress = self.onGcodeLoadProgress)
+        self.data.bind(gcodeLoading     = self.onGcodeLoadingChange)
         self.update_macro_titles()
     
     def updateConnectionStatus(self, callback, connected):
@@ -183,14 +184,26 @@ class FrontPage(Screen, MakesmithInitFuncs):
         self.gcodeLineNumber = str(newIndex)
         self.percentComplete = '%.1f' %(100* (float(newIndex) / (len(self.data.gcode)-1))) + "%"
         if newIndex >=1:
-            gCodeLine = self.data.gcode[newIndex-1] #We're executing newIndex-1... about to send newIndex
-            F = re.search("F(?=.)(([ ]*)?[+-]?([0-9]*)(\.([0-9]+))?)", gCodeLine)
-            if F:
-                self.gcodeVel = F.groups()[0]   #Otherwise, it stays what it was...
+            program = self.data.gcode
+            executingIndex = newIndex-1 #We're executing newIndex-1... about to send newIndex
+            if executingIndex < len(program) and program.feedRate[executingIndex] > 0:
+                self.gcodeVel = '%g' % program.feedRate[executingIndex]   #the feed rate in effect, from the modal state table
             
     def onGcodeFileChange(self, callback, newGcode):
         pass
     
+    def onGcodeLoadProgress(self, callback, progress):
+        if self.data.gcodeLoading:
+            self.percentComplete = 'Loading %d%%' % progress
+    
+    def onGcodeLoadingChange(self, callback, loading):
+        if loading:
+            self.percentComplete = 'Loading 0%'
+        elif len(self.data.gcode) > 1:
+            self.onIndexMove(callback, self.data.gcodeIndex)
+        else:
+            self.percentComplete = '0.0%'
+    
     def onUploadFlagChange(self, callback, newFlagValue):
         if self.data.uploadFlag is 0 and self.data.gcodeIndex > 1: #if the machine is stopped partway through a file
             self.holdBtn.secretText = "CONTINUE"
@@ -204,21 +217,20 @@ class FrontPage(Screen, MakesmithInitFuncs):
         Move the gcode index by z moves
         '''
 
-        dist = 0
+        if self.data.gcodeLoading:   #the z layers belong to the program which is being replaced
+            return
 
-        for index,zMove in enumerate(self.data.zMoves):
-            if moves > 0 and zMove > self.data.gcodeIndex:
-                dist = self.data.zMoves[index+moves-1]-self.data.gcodeIndex
-                break
-            if moves < 0 and zMove < self.data.gcodeIndex:
-                dist = self.data.zMoves[index+moves+1]-self.data.gcodeIndex
+        targetIndex = self.data.zLayers.moveFrom(self.data.gcodeIndex, moves)
 
-        self.moveGcodeIndex(dist)
+        self.moveGcodeIndex(targetIndex - self.data.gcodeIndex)
     
     def moveGcodeIndex(self, dist):
         '''
         Move the gcode index by a dist number of lines
         '''
+        if self.data.gcodeLoading:
+            return
+        
         maxIndex = len(self.data.gcode)-1
         targetIndex = self.data.gcodeIndex + dist
         
@@ -232,27 +244,28 @@ class FrontPage(Screen, MakesmithInitFuncs):
         else:
             self.data.gcodeIndex = targetIndex
         
-        gCodeLine = self.data.gcode[self.data.gcodeIndex]
-        
-        xTarget = 0
-        yTarget = 0
+        self.showGcodeIndexPosition()
+    
+    def showGcodeIndexPosition(self):
+        '''
+        Move the position indicator to where the machine will be after the line at the gcode index
+        has run. The position comes from the modal state table so it is correct for relative moves
+        and for lines which do not give X or Y. A file read from the disk as it is cut carries the
+        last X and Y forward, and the indicator stays where it is if they can not be found.
+        '''
+        program = self.data.gcode
+        index   = self.data.gcodeIndex
         
         try:
-            x = re.search("X(?=.)([+-]?([0-9]*)(\.([0-9]+))?)", gCodeLine)
-            if x:
-                xTarget = float(x.groups()[0])
-                self.previousPosX = xTarget
-            else:
-                xTarget = self.previousPosX
-            
-            y = re.search("Y(?=.)([+-]?([0-9]*)(\.([0-9]+))?)", gCodeLine)
-            if y:
-                yTarget = float(y.groups()[0])
-                self.previousPosY = yTarget
+            if program.isMapped:
+                position = program.positionAt(index)
+                if position is None:
+                    return
             else:
-                yTarget = self.previousPosY
+                position = (program.absoluteX[index], program.absoluteY[index])
+            xTarget, yTarget = self.data.gcodeTransform.point(*position)
             
-            self.gcodecanvas.positionIndicator.setPos(xTarget,yTarget,self.data.units)
+            self.gcodecanvas.positionIndicator.setPos(xTarget,yTarget,program.unitsAt(index))
         except:
             print "Unable to update position for new gcode line"
     
@@ -260,6 +273,8 @@ class FrontPage(Screen, MakesmithInitFuncs):
         if  self.holdBtn.secretText == "HOLD":
             self.data.uploadFlag = 0
             print("Run Paused")
+        elif self.data.gcodeLoading:
+            self.data.message_queue.put("Message: The file is still loading. Wait for it to finish loading before continuing the run.")
         else:
             self.data.uploadFlag = 1
             self.data.quick_queue.put("~") #send cycle resume command to unpause the machine
@@ -364,6 +379,16 @@ class FrontPage(Screen, MakesmithInitFuncs):
     
     def startRun(self):
         
+        if self.data.gcodeLoading:
+            self.data.message_queue.put("Message: The file is still loading. Wait for it to finish loading before starting the run.")
+            return
+        
+        if self.data.gcodeIndex > 0:
+            #starting part way through the file, restore the units and distance mode the file has set by this line
+            modalCommands = self.data.gcode.modalCommandsBefore(self.data.gcodeIndex)
+            if modalCommands:
+                self.data.gcode_queue.put(modalCommands)
+        
         self.data.uploadFlag = 1
         self.sendLine()
     
@@ -464,17 +489,50 @@ class FrontPage(Screen, MakesmithInitFuncs):
         '''
         try:
             line = int(float(self.popupContent.textInput.text))
-            if line < 0:
-                self.data.gcodeIndex = 0
-            elif line > len(self.data.gcode):
-                self.data.gcodeIndex = len(self.data.gcode)
-            else:
-                self.data.gcodeIndex = line
+            if not self.data.gcodeLoading:                                   #the line numbers would belong to the program which is being replaced
+                if line < 0:
+                    self.data.gcodeIndex = 0
+                elif line > len(self.data.gcode):
+                    self.data.gcodeIndex = len(self.data.gcode)
+                else:
+                    self.data.gcodeIndex = line
+                
+                if self.data.gcodeIndex < len(self.data.gcode):
+                    self.showGcodeIndexPosition()
            
         except:
             pass                                                             #If what was entered cannot be converted to a number, leave the value the same
         self._popup.dismiss()
     
+    def zLayerPopup(self):
+        '''
+        
+        Open a list of the z-axis passes of the program to move the gcode index to the start of one
+        
+        '''
+        if self.data.gcodeLoading:
+            return
+        
+        zLayers = self.data.zLayers
+        layer   = zLayers.layerAt(self.data.gcodeIndex)
+        
+        self.popupContent = ZLayerPopupContent(done=self.dismiss_zLayerPopup)
+        self.popupContent.initialize(zLayers, self.data.gcode, self.data.gcodeIndex)
+        self._popup = Popup(title="Go to z-axis pass (now on pass %d of %d at Z %g)" % (layer + 1, len(zLayers), zLayers.depthOf(layer)),
+                            content=self.popupContent, size_hint=(0.6, 0.9))
+        self._popup.open()
+    
+    def dismiss_zLayerPopup(self, firstLine):
+        '''
+        
+        Close The Pop-up, moving the gcode index to firstLine unless it is None
+        
+        '''
+        if firstLine is not None and not self.data.gcodeLoading:
+            self.data.gcodeIndex = min(firstLine, max(len(self.data.gcode) - 1, 0))
+            self.showGcodeIndexPosition()
+        self._popup.dismiss()
+    
     def macro(self,index):
         '''
         Execute user defined macro
@@ -7,9 +7,13 @@ and zooming features. It was not originally written as a stand alone module whic
 
 from kivy.uix.floatlayout                    import FloatLayout
 from kivy.properties                         import NumericProperty, ObjectProperty
-from kivy.graphics                           import Color, Ellipse, Line, Point
+from kivy.graphics                           import Color, Line, Mesh, InstructionGroup
+from kivy.graphics                           import PushMatrix, PopMatrix, Translate, Rotate, Scale
 from kivy.clock                              import Clock
 from DataStructures.makesmithInitFuncs       import MakesmithInitFuncs
+from DataStructures.gcodeLoader              import GcodeLoader
+from DataStructures.gcodeTransform           import GcodeTransform
+from DataStructures.toolpath                 import Toolpath, CutPath
 from UIElements.positionIndicator            import PositionIndicator
 from UIElements.viewMenu                     import ViewMenu
 from kivy.graphics.transformation            import Matrix
@@ -19,28 +23,30 @@ from kivy.metrics                            import dp
 from kivy.graphics.texture                   import Texture
 from kivy.graphics                           import Rectangle
 
-import re
 import math
+import time
 import global_variables
 import sys
 
 class GcodeCanvas(FloatLayout, MakesmithInitFuncs):
     
-    canvasScaleFactor = 1 #scale from mm to pixels
     INCHES            = 25.4
     MILLIMETERS       = 1 
     
-    xPosition = 0
-    yPosition = 0
-    zPosition = 0
+    lineNumber    = 0      #the line number currently being processed
+    frameBudget   = .008   #the time (in seconds) spent building the toolpath each frame
+    linesPerSlice = 200    #the toolpath is built in slices of this many lines, resized to take about sliceTime each
+    cellsPerSlice = 5      #once the lines are added, the cells are simplified in slices of this many cells
+    sliceTime     = .002
+    buildTime     = 0      #the time spent building the current toolpath so far
+    buildStarted  = 0
     
-    lineNumber = 0  #the line number currently being processed
-    
-    absoluteFlag = 0
-    
-    prependString = "G01 "
-    
-    maxNumberOfLinesToRead = 300000
+    toolpath       = None  #the drawing of the current program
+    cutPath        = None  #the drawing of the lines which have been sent to the machine
+    cutMeshes      = []
+    meshes         = {}    #(group name, cell key) : (batches, [(Mesh, vertex count)]) for the cells on the canvas
+    gcodeTranslate = None  #the instructions which apply data.gcodeTransform to the toolpath
+    transformUnitScale = 1
     
     
     
@@ -50,29 +56,35 @@ class GcodeCanvas(FloatLayout, MakesmithInitFuncs):
         self.positionIndicator.color = self.data.posIndicatorColor
         
         self.drawWorkspace()
+        
+        self.gcodeLoader = GcodeLoader()
+        self.gcodeLoader.setUpData(self.data)
 
         if self.data.config.getboolean('Ground Control Settings', 'centerCanvasOnResize'):
             Window.bind(on_resize = self.centerCanvas)
+        
+        #only the part of the toolpath which is on the screen is drawn, so redraw when the view changes
+        self.scheduleVisibleMeshes = Clock.create_trigger(self.updateVisibleMeshes)
+        self.scatterInstance.bind(transform = self.scheduleVisibleMeshes)
+        self.bind(size = self.scheduleVisibleMeshes)
+        
+        #gcodeIndex is changed by the serial thread so the cut path is updated on the next frame
+        self.scheduleCutPath = Clock.create_trigger(self.updateCutPath)
+        self.data.bind(gcodeIndex = self.scheduleCutPath)
+        self.data.bind(uploadFlag = self.startCutPath)
 
         self.data.bind(gcode = self.updateGcode)
         self.data.bind(backgroundRedraw = self.reloadGcode)
-        self.data.bind(gcodeShift = self.reloadGcode)              #No need to reload if the origin is changed, just clear and redraw
+        self.data.bind(gcodeShift = self.updateTransform)
+        self.data.bind(gcodeTransform = self.applyTransform)       #No need to reload or redraw if the origin is changed, just move the drawing
         self.data.bind(gcodeFile = self.centerCanvasAndReloadGcode)
         
         global_variables._keyboard = Window.request_keyboard(self._keyboard_closed, self)
         global_variables._keyboard.bind(on_key_down=self._on_keyboard_down)
         
+        self.updateTransform()
         self.centerCanvasAndReloadGcode()
     
-    def addPoint(self, x, y):
-        '''
-        
-        Add a point to the line currently being plotted
-        
-        '''
-
-        self.line.points.extend((x,y))
-    
     def _keyboard_closed(self):
         '''
         
@@ -139,60 +151,35 @@ class GcodeCanvas(FloatLayout, MakesmithInitFuncs):
     def reloadGcode(self, *args):
         '''
         
-        This reloads the gcode from the hard drive in case it has been updated. 
+        This reloads the gcode from the hard drive in case it has been updated. Starting a reload
+        cancels any load which is still in progress.
         
         '''
         
         filename = self.data.gcodeFile
-        if filename is "": #Blank the g-code if we're loading "nothing"
-            self.data.gcode = " "
-            self.data.gcode = ""
-            return
-
+        
+        digits = None
+        if filename != "" and self.data.config.getint('Advanced Settings','truncate'):
+            digits = self.data.config.get('Advanced Settings','digits') #truncates all long floats to this many decimal places, leaves shorter floats
+        
+        self.gcodeLoader.load(filename, digits) #the file is read and parsed in the background, the result is put in data.gcode
+    
+    def updateTransform(self, *args):
+        '''
+        
+        Build a new transform from the home position and the rotation and scale settings. The
+        transform is applied to each line as it is drawn and sent, so the file is not reloaded.
+        
+        '''
+        
         try:
-            filterfile = open(filename, 'r')
-            rawfilters = filterfile.read()
-
-            filtersparsed = re.sub(r'\(([^)]*)\)','\n',rawfilters) #replace mach3 style gcode comments with newline
-            filtersparsed = re.sub(r';([^\n]*)\n','\n',filtersparsed) #replace standard ; initiated gcode comments with newline
-            filtersparsed = re.sub(r'\n\n','\n',filtersparsed) #removes blank lines
-            filtersparsed = re.sub(r'([0-9])([GXYZIJFTM]) *', '\\1 \\2',filtersparsed) #put spaces between gcodes
-            filtersparsed = re.sub(r'  +',' ',filtersparsed) #condense space runs
-
-            if self.data.config.getint('Advanced Settings','truncate'):
-                digits = self.data.config.get('Advanced Settings','digits')
-                filtersparsed = re.sub(r'([+-]?\d*\.\d{1,'+digits+'})(\d*)',r'\g<1>',filtersparsed) #truncates all long floats to 4 decimal places, leaves shorter floats
-
-            filtersparsed = re.split('\n', filtersparsed) #splits the gcode into elements to be added to the list
-            filtersparsed = [x + ' ' for x in filtersparsed] #adds a space to the end of each line
-            filtersparsed = [x.lstrip() for x in filtersparsed]
-            filtersparsed = [x.replace('X ','X') for x in filtersparsed]
-            filtersparsed = [x.replace('Y ','Y') for x in filtersparsed]
-            filtersparsed = [x.replace('Z ','Z') for x in filtersparsed]
-            filtersparsed = [x.replace('I ','I') for x in filtersparsed]
-            filtersparsed = [x.replace('J ','J') for x in filtersparsed]
-            filtersparsed = [x.replace('F ','F') for x in filtersparsed]
-            
-            self.data.gcode = "[]"
-            self.data.gcode = filtersparsed
-            
-            filterfile.close() #closes the filter save file
-
-            #Find gcode indicies of z moves
-            self.data.zMoves = [0]
-            zList = []
-            for index, line in enumerate(self.data.gcode):
-                z = re.search("Z(?=.)([+-]?([0-9]*)(\.([0-9]+))?)",line)
-                if z:
-                    zList.append(z)
-                    if len(zList) > 1:
-                        if not self.isClose(float(zList[-1].groups()[0]),float(zList[-2].groups()[0])):
-                            self.data.zMoves.append(index-1)
-                    else:
-                        self.data.zMoves.append(index)
+            rotation = float(self.data.config.get('Advanced Settings', 'rotation'))
+            scale    = float(self.data.config.get('Advanced Settings', 'scale'))
         except:
-            self.data.message_queue.put("Message: Cannot reopen gcode file. It may have been moved or deleted. To locate it or open a different file use Actions > Open G-code")
-            self.data.gcodeFile = ""
+            rotation = 0.0
+            scale    = 1.0
+        
+        self.data.gcodeTransform = GcodeTransform(self.data.gcodeShift[0], self.data.gcodeShift[1], rotation, scale)
     
     def centerCanvas(self, *args):
         '''
@@ -252,141 +239,6 @@ class GcodeCanvas(FloatLayout, MakesmithInitFuncs):
                           size=(width, height),
                           tex_coords=self.data.backgroundManualReg)
 
-    def drawLine(self,gCodeLine,command):
-        '''
-        
-        drawLine draws a line using the previous command as the start point and the xy coordinates
-        from the current command as the end point. The line is styled based on the command to allow
-        visually differentiating between normal and rapid moves. If the z-axis depth is changed a
-        circle is placed at the location of the depth change to alert the user. 
-    
-        '''
-        
-        try:
-            xTarget = self.xPosition
-            yTarget = self.yPosition
-            zTarget = self.zPosition
-            
-            x = re.search("X(?=.)(([ ]*)?[+-]?([0-9]*)(\.([0-9]+))?)", gCodeLine)
-            if x:
-                xTarget = float(x.groups()[0])*self.canvasScaleFactor
-                if self.absoluteFlag == 1:
-                    xTarget = self.xPosition + xTarget
-            
-            y = re.search("Y(?=.)(([ ]*)?[+-]?([0-9]*)(\.([0-9]+))?)", gCodeLine)
-            if y:
-                yTarget = float(y.groups()[0])*self.canvasScaleFactor
-                if self.absoluteFlag == 1:
-                    yTarget = self.yPosition + yTarget
-            z = re.search("Z(?=.)(([ ]*)?[+-]?([0-9]*)(\.([0-9]+))?)", gCodeLine)
-            if z:
-                zTarget = float(z.groups()[0])*self.canvasScaleFactor
-            
-            
-            #Draw lines for G1 and G0
-            with self.scatterObject.canvas:
-                Color(self.data.drawingColor[0], self.data.drawingColor[1], self.data.drawingColor[2])
-                
-                if command == 'G00':
-                    #draw a dashed line
-                    Line(points = (self.xPosition , self.yPosition , xTarget, yTarget), width = 1, group = 'gcode', dash_length = 4, dash_offset = 2)
-                    
-                    #start a new straight line from the end of the dashed line
-                    self.line = Line(points = (), width = 1, group = 'gcode')
-                    self.addPoint(xTarget , yTarget)
-                else:
-                    self.addPoint(xTarget , yTarget)
-                
-            #If the zposition has changed, add indicators
-            tol = 0.05 #Acceptable error in mm
-            if abs(zTarget - self.zPosition) >= tol:
-                with self.scatterObject.canvas:
-                    if zTarget - self.zPosition > 0:
-                        Color(0, 1, 0)
-                        radius = 1
-                    else:
-                        Color(1, 0, 0)
-                        radius = 2
-                    Line(circle=(self.xPosition , self.yPosition, radius), group = 'gcode')
-                    Color(self.data.drawingColor[0], self.data.drawingColor[1], self.data.drawingColor[2])
-            
-            self.xPosition = xTarget
-            self.yPosition = yTarget
-            self.zPosition = zTarget
-        except:
-            print "Unable to draw line on screen: " + gCodeLine
-    
-    def drawArc(self,gCodeLine,command):
-        '''
-        
-        drawArc draws an arc using the previous command as the start point, the xy coordinates from
-        the current command as the end point, and the ij coordinates from the current command as the
-        circle center. Clockwise or counter-clockwise travel is based on the command. 
-    
-        '''
-        
-        try:
-            xTarget = self.xPosition
-            yTarget = self.yPosition
-            iTarget = 0
-            jTarget = 0
-            
-            x = re.search("X(?=.)(([ ]*)?[+-]?([0-9]*)(\.([0-9]+))?)", gCodeLine)
-            if x:
-                xTarget = float(x.groups()[0])*self.canvasScaleFactor
-            y = re.search("Y(?=.)(([ ]*)?[+-]?([0-9]*)(\.([0-9]+))?)", gCodeLine)
-            if y:
-                yTarget = float(y.groups()[0])*self.canvasScaleFactor
-            i = re.search("I(?=.)(([ ]*)?[+-]?([0-9]*)(\.([0-9]+))?)", gCodeLine)
-            if i:
-                iTarget = float(i.groups()[0])*self.canvasScaleFactor
-            j = re.search("J(?=.)(([ ]*)?[+-]?([0-9]*)(\.([0-9]+))?)", gCodeLine)
-            if j:
-                jTarget = float(j.groups()[0])*self.canvasScaleFactor
-            
-            radius = math.sqrt(iTarget**2 + jTarget**2)
-            centerX = self.xPosition + iTarget
-            centerY = self.yPosition + jTarget
-            
-            angle1 = math.atan2(self.yPosition - centerY, self.xPosition - centerX)
-            angle2 = math.atan2(yTarget - centerY, xTarget - centerX)
-            
-            
-            #atan2 returns results from -pi to +pi and we want results from 0 - 2pi
-            if angle1 < 0:
-                angle1 = angle1 + 2*math.pi
-            if angle2 < 0:
-                angle2 = angle2 + 2*math.pi
-            
-            
-            #take into account command G1 or G2
-            if int(command[1:]) == 2:
-                if angle1 < angle2:
-                    angle1 = angle1 + 2*math.pi
-                direction = -1
-            else:
-                if angle2 < angle1:
-                    angle2 = angle2 + 2*math.pi
-                direction = 1
-            
-            arcLen = abs(angle1 - angle2)
-            if abs(angle1 - angle2) == 0:
-                arcLen = 6.28313530718
-            
-            i = 0
-            while abs(i) < arcLen:
-                xPosOnLine = centerX + radius*math.cos(angle1 + i)
-                yPosOnLine = centerY + radius*math.sin(angle1 + i)
-                self.addPoint(xPosOnLine , yPosOnLine)
-                i = i+.1*direction #this is going to need to be a direction 
-            
-            self.addPoint(xTarget , yTarget)
-            
-            self.xPosition = xTarget
-            self.yPosition = yTarget
-        except:
-            print "Unable to draw arc on screen: " + gCodeLine
-
     def clearGcode(self):
         '''
         
@@ -461,162 +313,329 @@ class GcodeCanvas(FloatLayout, MakesmithInitFuncs):
         '''
         pass
     
-    def moveLine(self, gCodeLine):
+    def callBackMechanism(self, *args):
+        '''
         
-        originalLine = gCodeLine
+        Add the next few lines of the toolpath periodically in a non-blocking way and redraw the
+        part of it which is on the screen. Once every line has been added the cells of the
+        toolpath are simplified a few at a time in the same way.
         
-        try:
-            gCodeLine = gCodeLine.upper() + " "
-            x = re.search("X(?=.)(([ ]*)?[+-]?([0-9]*)(\.([0-9]+))?)", gCodeLine)
-            if x:
-#                 xTarget = '%f' % (float(x.groups()[0]) + self.data.gcodeShift[0]) # not used any more...
-                eNtnX = re.sub('\-?\d\.|\d*e-','',str(abs(float(x.groups()[0]) + self.data.gcodeShift[0]))) # strip off everything but the decimal part or e-notation exponent
-                e = re.search(".*e-", str(abs(float(x.groups()[0]) + self.data.gcodeShift[0])))
-                if e:
-                    fmtX = "%0%.%sf" % eNtnX  # if e-notation, use the exponent from the e notation
-                else:
-                    fmtX = "%0%.%sf" % len(eNtnX) # use the number of digits after the decimal place
-                gCodeLine = gCodeLine[0:x.start()+1] + (fmtX % (float(x.groups()[0]) + self.data.gcodeShift[0])) + gCodeLine[x.end():]
-            
-            y = re.search("Y(?=.)(([ ]*)?[+-]?([0-9]*)(\.([0-9]+))?)", gCodeLine)
-            if y:
-#                 yTarget = '%f' % (float(y.groups()[0]) + self.data.gcodeShift[1]) # not used any more...
-                eNtnY = re.sub('\-?\d\.|\d*e-','',str(abs(float(y.groups()[0]) + self.data.gcodeShift[1])))
-                e = re.search(".*e-", str(abs(float(y.groups()[0]) + self.data.gcodeShift[1])))
-                if e:
-                    fmtY = "%0%.%sf" % eNtnY
-                else:
-                    fmtY = "%0%.%sf" % len(eNtnY)
-                gCodeLine = gCodeLine[0:y.start()+1] + (fmtY % (float(y.groups()[0]) + self.data.gcodeShift[1])) + gCodeLine[y.end():]
-            
-            return gCodeLine
-        except ValueError:
-            print "line could not be moved:"
-            print originalLine
-            return originalLine
+        '''
+        
+        toolpath = self.toolpath
+        if toolpath is None or toolpath.program is not self.drawnProgram():
+            return #a newer program has replaced this one
+        
+        #work in small slices until the time for this frame is used up
+        frameStart = time.time()
+        while not toolpath.isComplete() and time.time() - frameStart < self.frameBudget:
+            sliceStart = time.time()
+            if toolpath.linesAdded < len(toolpath.program):
+                toolpath.addLines(self.linesPerSlice)
+                self.linesPerSlice = self.nextSliceSize(self.linesPerSlice, sliceStart)
+            else:
+                toolpath.simplifyCells(self.cellsPerSlice)
+                self.cellsPerSlice = self.nextSliceSize(self.cellsPerSlice, sliceStart)
+        
+        self.lineNumber = toolpath.linesAdded
+        self.updateVisibleMeshes()
+        self.buildTime = self.buildTime + time.time() - frameStart
+        
+        if toolpath.units is not None:
+            self.data.units = toolpath.units
+        
+        #Repeat until end of file
+        if not toolpath.isComplete():
+            Clock.schedule_once(self.callBackMechanism)
+        else:
+            self.reportDrawingRate()
+            if toolpath.usesXZPlane:
+                self.data.message_queue.put("Message: This program uses G18 (arcs in the XZ plane) which is not supported. Its arcs are drawn as if they were in the XY plane.")
     
-    def loadNextLine(self):
+    def nextSliceSize(self, sliceSize, sliceStart):
         '''
         
-        Load the next line of gcode
+        Returns the size of the next slice of work so that it takes about sliceTime, based on how
+        long a slice of sliceSize which started at sliceStart took.
         
         '''
         
-        try:
-            self.data.gcode[self.lineNumber] = self.moveLine(self.data.gcode[self.lineNumber])    #move the line if the gcode has been moved
-            fullString = self.data.gcode[self.lineNumber]
-            self.lineNumber = self.lineNumber + 1
-        except:
-            return #we have reached the end of the file
+        sliceLength = max(time.time() - sliceStart, .0001)
+        return int(min(max(sliceSize*self.sliceTime/sliceLength, 1), 100000))
+    
+    def reportDrawingRate(self):
+        '''
         
-        #if the line contains multiple gcode commands split them and execute them individually
-        listOfLines = fullString.split('G')
+        Write how quickly the toolpath was built to the log so that the speed of different
+        computers can be compared. The rate counts only the time spent building, the elapsed time
+        includes the time between frames.
         
-        if len(listOfLines) > 1:                              #if the line contains at least one 'G'
-            for line in listOfLines:
-                if len(line) > 0:                                   #If the line is not blank
-                    self.updateOneLine('G' + line)                     #Draw it
-        else:
-            self.updateOneLine(fullString)
+        '''
         
-    def updateOneLine(self, fullString):
+        lineCount = len(self.toolpath.program)
+        elapsed   = time.time() - self.buildStarted
+        rate      = lineCount/max(self.buildTime, .001)
+        self.drawingRate = rate
+        self.data.logger.writeToLog("Drew " + str(lineCount) + " lines of gcode in %.2f seconds (%.2f seconds elapsed), %d lines per second\n" % (self.buildTime, elapsed, rate))
+    
+    def visibleArea(self):
         '''
         
-        Draw the next line on the gcode canvas
+        Returns the area of the toolpath which is on the screen as [minX, minY, maxX, maxY] and the
+        size of one pixel, both in the millimeters of the toolpath.
         
         '''
         
-        validPrefixList = ['G00','G0 ','G1 ','G01','G2 ','G02','G3 ','G03', 'G17']
+        transform = self.data.gcodeTransform
+        unitScale = self.transformUnitScale
+        angle     = math.radians(transform.rotation)
+        cosine    = math.cos(angle)
+        sine      = math.sin(angle)
         
-        fullString = fullString + " " #ensures that there is a space at the end of the line
+        xs = []
+        ys = []
+        for cornerX, cornerY in ((self.x, self.y), (self.right, self.y), (self.x, self.top), (self.right, self.top)):
+            #undo the scatter and then the gcode transform
+            x, y = self.scatterInstance.to_local(cornerX, cornerY)
+            x = x - transform.xShift*unitScale
+            y = y - transform.yShift*unitScale
+            xs.append(( cosine*x + sine*y)/transform.scale)
+            ys.append((-sine*x + cosine*y)/transform.scale)
         
-        #find 'G' anywhere in string
-        gString = fullString[fullString.find('G'):fullString.find('G') + 3]
+        sizeOfPixel = 1.0/(self.scatterInstance.scale*transform.scale)
         
-        if gString in validPrefixList:
-            self.prependString = gString
+        return [min(xs), min(ys), max(xs), max(ys)], sizeOfPixel
+    
+    def updateVisibleMeshes(self, *args):
+        '''
         
-        if fullString.find('G') == -1: #this adds the gcode operator if it is omitted by the program
-            fullString = self.prependString + ' ' + fullString
-            gString = self.prependString
+        Make the Mesh instructions on the canvas match the cells of the toolpath which are on the
+        screen, at the level of detail which suits the zoom. Cells which go off the screen are
+        taken off the canvas and cells which have changed are redrawn.
         
-        if gString == 'G00' or gString == 'G0 ':
-            self.drawLine(fullString, 'G00')
-
-        if gString == 'G01' or gString == 'G1 ':
-            self.drawLine(fullString, 'G01')
-                    
-        if gString == 'G02' or gString == 'G2 ':
-            self.drawArc(fullString, 'G02')
-                           
-        if gString == 'G03' or gString == 'G3 ':
-            self.drawArc(fullString, 'G03')
-        
-        if gString == 'G17':
-            #Take no action, XY coordinate plane is the default
-            pass
+        '''
         
-        if gString == 'G18':
-            print "G18 not supported"
+        toolpath = self.toolpath
+        if toolpath is None:
+            return
         
-        if gString == 'G20':
-            self.canvasScaleFactor = self.INCHES
-            self.data.units = "INCHES"
-            
-        if gString == 'G21':
-            self.canvasScaleFactor = self.MILLIMETERS
-            self.data.units = "MM"
+        (minX, minY, maxX, maxY), sizeOfPixel = self.visibleArea()
+        level = toolpath.levelFor(sizeOfPixel)
         
-        if gString == 'G90':
-            self.absoluteFlag = 0
-            
-        if gString == 'G91':
-            self.absoluteFlag = 1
+        visible = set()
+        for name, group in toolpath.groups.iteritems():
+            instructions = self.toolpathInstructions[name]
+            for key, cell in group.cells.iteritems():
+                if not cell.intersects(minX, minY, maxX, maxY):
+                    continue
+                visible.add((name, key))
+                
+                batches = cell.batchesFor(level, toolpath.verticesPerMesh)
+                shown   = self.meshes.get((name, key))
+                if shown is not None and shown[0] is not batches:
+                    for mesh, vertexCount in shown[1]:
+                        instructions.remove(mesh)
+                    shown = None
+                if shown is None:
+                    shown = (batches, [])
+                    self.meshes[(name, key)] = shown
+                
+                self.updateMeshList(instructions, shown[1], batches)
         
-    def callBackMechanism(self, callback) :
+        for name, key in self.meshes.keys():
+            if (name, key) not in visible:
+                for mesh, vertexCount in self.meshes.pop((name, key))[1]:
+                    self.toolpathInstructions[name].remove(mesh)
+    
+    def updateMeshList(self, instructions, meshes, batches):
         '''
         
-        Call the loadNextLine function periodically in a non-blocking way to
-        update the gcode.
+        Bring a list of (Mesh, vertex count) up to date with a list of MeshBatches. The batches only
+        ever grow, so only the meshes of batches which have grown are sent again and new batches
+        get new meshes.
         
         '''
         
-        with self.scatterObject.canvas:
-            self.line = Line(points = (), width = 1, group = 'gcode')
+        for index, batch in enumerate(batches):
+            if index < len(meshes):
+                mesh, vertexCount = meshes[index]
+                if vertexCount != batch.vertexCount():
+                    mesh.vertices = batch.vertices
+                    mesh.indices  = batch.indices
+                    meshes[index] = (mesh, batch.vertexCount())
+            else:
+                mesh = Mesh(vertices = batch.vertices, indices = batch.indices, mode = 'lines')
+                instructions.add(mesh)
+                meshes.append((mesh, batch.vertexCount()))
+    
+    def updateCutPath(self, *args):
+        '''
         
-        #Draw numberOfTimesToCall lines on the canvas
-        numberOfTimesToCall = 500
-        for _ in range(numberOfTimesToCall):
-            self.loadNextLine()
+        Draw the lines which have been sent since the last update over the toolpath in the cut
+        path color. While the program is not running (it has ended, been stopped or paused, or the
+        index was moved by hand) what has been cut stays drawn. The cut path only starts again
+        when a new program is drawn or a new run starts.
         
-        #Repeat until end of file
-        if self.lineNumber < min(len(self.data.gcode),self.maxNumberOfLinesToRead):
-            Clock.schedule_once(self.callBackMechanism)
+        '''
+        
+        program = self.drawnProgram()
+        if self.toolpath is None or self.toolpath.program is not program:
+            return
+        
+        index   = min(self.data.gcodeIndex, len(program))
+        cutPath = self.cutPath
+        
+        if cutPath is None or cutPath.program is not program:
+            self.resetCutPath(program, index)
+            return
+        
+        if not self.data.uploadFlag or index < cutPath.linesAdded:
+            return
+        
+        cutPath.addLinesTo(index)
+        self.updateMeshList(self.cutPathInstructions, self.cutMeshes, cutPath.batchesFor('feed'))
+    
+    def startCutPath(self, instance, uploadFlag):
+        '''
+        
+        Called when the program starts or stops running. A run which does not carry on from where
+        the cut path ends (continuing after a pause does) starts a new cut path at the current line.
+        A program which has been sent to the end (the index is moved past its last line before the
+        run stops) is drawn as cut to the end.
+        
+        '''
+        
+        program = self.drawnProgram()
+        if self.toolpath is None or self.toolpath.program is not program:
+            return
+        
+        if not uploadFlag:
+            cutPath = self.cutPath
+            if cutPath is not None and cutPath.program is program and self.data.gcodeIndex >= len(self.data.gcode):
+                cutPath.addLinesTo(len(program))
+                self.updateMeshList(self.cutPathInstructions, self.cutMeshes, cutPath.batchesFor('feed'))
+            return
+        
+        index = min(self.data.gcodeIndex, len(program))
+        if self.cutPath is None or self.cutPath.program is not program or index != self.cutPath.linesAdded:
+            self.resetCutPath(program, index)
+    
+    def resetCutPath(self, program, index):
+        '''
+        
+        Take the cut path off the canvas and start a new one at line index.
+        
+        '''
+        
+        for mesh, vertexCount in self.cutMeshes:
+            self.cutPathInstructions.remove(mesh)
+        self.cutMeshes = []
+        self.cutPath   = CutPath(program, index, self.toolpath.arcTolerance)
+    
+    def applyTransform(self, *args):
+        '''
+        
+        Move, rotate and scale the drawing of the toolpath to match data.gcodeTransform. Only the
+        matrix in front of the meshes changes, the toolpath itself is not rebuilt.
+        
+        '''
+        
+        if self.gcodeTranslate is None:
+            return
+        
+        transform = self.data.gcodeTransform
+        unitScale = self.MILLIMETERS
+        program   = self.drawnProgram()
+        if len(program) > 0 and program.unitsAt(len(program) - 1) == "INCHES":
+            unitScale = self.INCHES        #the home position is in the units of the file
+        self.transformUnitScale = unitScale
+        
+        self.gcodeTranslate.xy   = (transform.xShift*unitScale, transform.yShift*unitScale)
+        self.gcodeRotate.angle   = transform.rotation
+        self.gcodeScale.xyz      = (transform.scale, transform.scale, 1)
+        
+        self.scheduleVisibleMeshes()
+    
+    def drawnProgram(self):
+        '''
+        
+        Returns the program which is drawn. Only the start of a file which is read from the disk as
+        it is sent is drawn, from the preview parsed when it was opened.
+        
+        '''
+        
+        program = self.data.gcode
+        if program.isMapped:
+            return program.preview
+        return program
     
     def updateGcode(self, *args):
         '''
         
-        updateGcode parses the gcode commands and calls the appropriate drawing function for the 
-        specified command. 
+        updateGcode starts drawing the toolpath of the current program. The toolpath is built from
+        the parsed columns of the program and drawn as a few large Mesh instructions for each cell
+        of the toolpath which is on the screen.
     
         '''
         
         #reset variables 
         self.data.backgroundRedraw = False
-        self.xPosition = self.data.gcodeShift[0]*self.canvasScaleFactor
-        self.yPosition = self.data.gcodeShift[1]*self.canvasScaleFactor
-        self.zPosition = 0
-
-        self.prependString = "G00 "
         self.lineNumber = 0
+        self.toolpath   = None
+        self.meshes     = {}
+        self.cutPath    = None
+        self.cutMeshes  = []
+        self.gcodeTranslate = None
         
         self.clearGcode()
         
-        #Check to see if file is too large to load
-        if len(self.data.gcode) > self.maxNumberOfLinesToRead:
-            errorText = "The current file contains " + str(len(self.data.gcode)) + " lines of gcode.\nrendering all " +  str(len(self.data.gcode)) + " lines simultaneously may crash the\n program, only the first " + self.maxNumberOfLinesToRead + "lines are shown here.\nThe complete program will cut if you choose to do so unless the home position is moved from (0,0)."
-            print errorText
-            self.data.message_queue.put("Message: " + errorText)
+        program = self.drawnProgram()
+        if len(program) < len(self.data.gcode):
+            self.data.message_queue.put("Message: The current file contains " + str(len(self.data.gcode)) + " lines of gcode and is larger than the Large File Size setting. It will be read from the disk as it is cut and only the first " + str(len(program)) + " lines are shown here. More lines can be shown by raising the Lines Drawn From Large Files setting.")
+        
+        try:
+            arcTolerance = float(self.data.config.get('Ground Control Settings', 'arcTolerance'))
+        except:
+            arcTolerance = 0.05
         
-        self.callBackMechanism(self.updateGcode)
+        self.toolpath = Toolpath(program, max(arcTolerance, 0.001))
+        
+        try:
+            self.frameBudget = float(self.data.config.get('Ground Control Settings', 'frameBudget'))/1000
+        except:
+            pass
+        self.buildTime    = 0
+        self.buildStarted = time.time()
+        
+        color = self.data.drawingColor
+        groupColors = {
+                        'feed':   (color[0], color[1], color[2], 1),
+                        'rapid':  (color[0], color[1], color[2], .5),
+                        'raise':  (0, 1, 0, 1),
+                        'plunge': (1, 0, 0, 1)
+                      }
+        
+        with self.scatterObject.canvas:
+            PushMatrix()
+            self.gcodeTranslate = Translate()
+            self.gcodeRotate    = Rotate(angle = 0, axis = (0, 0, 1))
+            self.gcodeScale     = Scale(1, 1, 1)
+        
+        self.toolpathInstructions = {}
+        for name in ('rapid', 'feed', 'raise', 'plunge'):
+            instructions = InstructionGroup()
+            instructions.add(Color(*groupColors[name]))
+            self.toolpathInstructions[name] = instructions
+            self.scatterObject.canvas.add(instructions)
+        
+        #the cut path is drawn over the rest of the toolpath
+        self.cutPathInstructions = InstructionGroup()
+        self.cutPathInstructions.add(Color(*self.data.cutPathColor))
+        self.scatterObject.canvas.add(self.cutPathInstructions)
+        
+        with self.scatterObject.canvas:
+            PopMatrix()
         
+        self.applyTransform()
+        self.updateCutPath()
+        self.callBackMechanism()
@@ -143,12 +143,13 @@ class ViewMenu(GridLayout, MakesmithInitFuncs):
             if line>len(self.data.gcode):
                 line = len(self.data.gcode)-447
 
-            for lineNum, gcodeLine in enumerate(self.data.gcode):
-                if lineNum>=line and lineNum<line+447:
-                    popupText = popupText + str(lineNum+1) + ': ' + gcodeLine + "\n"
-                elif lineNum>=line+447:
-                    popupText = popupText + "...\n...\n...\n"
-                    break
+            pageLines = self.data.gcode[line:line+447]     #only the lines on this page are read
+            for lineNum, gcodeLine in enumerate(pageLines, line):
+                popupText = popupText + str(lineNum+1) + ': ' + gcodeLine + "\n"
+            
+            lineNum = line + len(pageLines)
+            if lineNum < len(self.data.gcode):
+                popupText = popupText + "...\n...\n...\n"
                 
             titleString += ': ' + self.data.gcodeFile +'\nLines: '+str(line+1)+' - '+str(lineNum)+' of '+str(len(self.data.gcode))
 
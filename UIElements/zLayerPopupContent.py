@@ -0,0 +1,70 @@
+'''
+
+This lets the user pick a z-axis pass of the current program to move the gcode index to when it is
+the content of a popup
+
+'''
+from   kivy.uix.boxlayout                        import   BoxLayout
+from   kivy.uix.button                           import   Button
+from   kivy.properties                           import   ObjectProperty, NumericProperty, StringProperty
+from   kivy.metrics                              import   dp
+from   functools                                 import   partial
+
+class ZLayerPopupContent(BoxLayout):
+    done          = ObjectProperty(None)
+    firstLayer    = NumericProperty(0)
+    layerCount    = NumericProperty(0)
+    layersPerPage = NumericProperty(50)       #a carved file can have a pass for every line, so only a page of them is listed
+    pageText      = StringProperty("")
+
+    def initialize(self, zLayers, program, gcodeIndex):
+        '''
+
+        Show the page of passes of zLayers which holds gcodeIndex, that pass is marked.
+
+        '''
+
+        self.zLayers      = zLayers
+        self.program      = program
+        self.currentLayer = zLayers.layerAt(gcodeIndex)
+        self.layerCount   = len(zLayers)
+
+        self.showPage(self.currentLayer - self.currentLayer % self.layersPerPage)
+
+    def showPage(self, firstLayer):
+        '''
+
+        Fill in a button for each pass of the page starting at firstLayer.
+
+        '''
+
+        zLayers         = self.zLayers
+        program         = self.program
+        firstLayer      = min(max(firstLayer, 0), max(self.layerCount - 1, 0))
+        self.firstLayer = firstLayer
+        lastLayer       = min(firstLayer + self.layersPerPage, self.layerCount)
+        self.pageText   = 'Passes %d - %d of %d' % (firstLayer + 1, lastLayer, self.layerCount)
+
+        self.layerList.clear_widgets()
+        for layer in xrange(firstLayer, lastLayer):
+            depth     = zLayers.depthOf(layer)
+            firstLine = zLayers.startOf(layer)
+            if layer + 1 < self.layerCount:
+                lastLine = zLayers.startOf(layer + 1) - 1
+            else:
+                lastLine = max(zLayers.lineCount - 1, firstLine)
+            units = 'mm'
+            if firstLine < len(program) and program.unitsAt(firstLine) == "INCHES":
+                units = 'in'
+            text = 'Pass %d:  Z %g %s,  lines %d - %d' % (layer + 1, depth, units, firstLine, lastLine)
+            if layer == self.currentLayer:
+                text = '> ' + text + ' <'
+            button = Button(text = text, size_hint_y = None, height = dp(40))
+            button.bind(on_release = partial(self.pick, firstLine))
+            self.layerList.add_widget(button)
+
+    def pick(self, firstLine, *args):
+        self.done(firstLine)
+
+    def cancel(self):
+        self.done(None)
@@ -20,8 +20,8 @@ from kivy.uix.popup             import Popup
 import math
 import global_variables
 import sys
-import re
 import json
+import time
 
 '''
 
@@ -40,6 +40,8 @@ from UIElements.connectMenu       import   ConnectMenu
 from UIElements.diagnosticsMenu   import   Diagnostics
 from UIElements.manualControls    import   ManualControl
 from DataStructures.data          import   Data
+from DataStructures.machineMessage import   MachineMessage, parseMachineMessage
+from DataStructures               import   machineMessage
 from Connection.nonVisibleWidgets import   NonVisibleWidgets
 from UIElements.notificationPopup import   NotificationPopup
 from Settings                     import   maslowSettings
@@ -52,6 +54,8 @@ Main UI Program
 
 class GroundControlApp(App):
 
+    messageTimeBudget = .005    #the longest runPeriodically spends handling messages in one frame
+    
     def get_application_config(self):
         return super(GroundControlApp, self).get_application_config(
             '~/%(appname)s.ini')
@@ -65,6 +69,7 @@ class GroundControlApp(App):
             self.data.iconPath               = './Images/Icons/normal/'
             self.data.fontColor              = '[color=7a7a7a]'
             self.data.drawingColor           = [.47,.47,.47]
+            self.data.cutPathColor           = [0,.6,.2]
             Window.clearcolor                = (1, 1, 1, 1)
             self.data.posIndicatorColor      =  [0,0,0]
             self.data.targetInicatorColor    =  [1,0,0]
@@ -72,6 +77,7 @@ class GroundControlApp(App):
             self.data.iconPath               = './Images/Icons/highvis/'
             self.data.fontColor              = '[color=000000]'
             self.data.drawingColor           = [1,1,1]
+            self.data.cutPathColor           = [.2,.8,1]
             Window.clearcolor                = (0, 0, 0, 1)
             self.data.posIndicatorColor      =  [1,1,1]
             self.data.targetInicatorColor    =  [1,0,0]
@@ -79,6 +85,7 @@ class GroundControlApp(App):
             self.data.iconPath               = './Images/Icons/darkgreyblue/'
             self.data.fontColor              = '[color=000000]'
             self.data.drawingColor           = [1,1,1]
+            self.data.cutPathColor           = [1,.6,.2]
             Window.clearcolor                = (0.06, 0.10, 0.2, 1)
             self.data.posIndicatorColor      =  [0.51,0.93,0.97]
             self.data.targetInicatorColor = [1,0,0]
@@ -248,6 +255,8 @@ class GroundControlApp(App):
         if section == "Advanced Settings":
             if (key == "truncate") or (key == "digits"):
                 self.frontpage.gcodecanvas.reloadGcode()
+            if (key == "rotation") or (key == "scale"):
+                self.frontpage.gcodecanvas.updateTransform()
             if (key == "spindleAutomate"):
                 if (value == "Servo"):
                     value = 1
@@ -257,6 +266,10 @@ class GroundControlApp(App):
                     value = 3
                 else:
                     value = 0
+        
+        if section == "Ground Control Settings":
+            if key == "arcTolerance":
+                self.frontpage.gcodecanvas.updateGcode()
     
         
         # Update Computed Settings
@@ -286,28 +299,13 @@ class GroundControlApp(App):
     
     def receivedSetting(self, message):
         '''
-        This parses a settings report from the machine, usually received in 
+        This acts on a settings report from the machine, usually received in 
         response to a $$ request.  If the value received does not match the 
         expected value.
         '''
-        parameter, position = self.parseFloat(message, 0)
-        value, position = self.parseFloat(message, position)
-        if (parameter is not None and value is not None):
-            maslowSettings.syncFirmwareKey(int(parameter), value, self.data)
-    
-    def parseFloat(self, text, position=0):
-        '''
-        Takes a string and parses out the float found at position default to 0
-        returning a list of the matched float and the ending
-        position of the float
-        '''
-        # This regex comes from a python docs recommended 
-        regex = re.compile("[-+]?(\d+(\.\d*)?|\.\d+)([eE][-+]?\d+)?")
-        match = regex.search(text[position:])
-        if match:
-            return (float(match.group(0)), match.end(0))
-        else:
-            return (None, position)
+        if message.values is not None:
+            parameter, value = message.values
+            maslowSettings.syncFirmwareKey(parameter, value, self.data)
     
     '''
     
@@ -326,28 +324,52 @@ class GroundControlApp(App):
     def runPeriodically(self, *args):
         '''
         this block should be handled within the appropriate widget
+        
+        Messages are handled for up to messageTimeBudget seconds, the rest wait for the next frame.
+        Only the newest of the position reports and of the position error reports which were
+        waiting is shown, since each one replaces the one before it.
         '''
+        telemetry      = self.data.serialTelemetry
+        deadline       = time.time() + self.messageTimeBudget
+        positionReport = None
+        errorReport    = None
+        handled        = 0
+        
         while not self.data.message_queue.empty(): #if there is new data to be read
+            if time.time() > deadline:
+                telemetry.framesOverBudget = telemetry.framesOverBudget + 1
+                break
             message = self.data.message_queue.get()
+            handled = handled + 1
+            
+            #lines from the machine are parsed by the serial thread, messages put by Ground Control itself are parsed here
+            if not isinstance(message, MachineMessage):
+                message = parseMachineMessage(message)
+            kind = message.kind
             
-            if message[0] == "<":
-                self.setPosOnScreen(message)
-            elif message[0] == "$":
+            if kind == machineMessage.POSITION:
+                if positionReport is not None:
+                    telemetry.positionReportsCoalesced = telemetry.positionReportsCoalesced + 1
+                positionReport = message
+            elif kind == machineMessage.SETTING:
                 self.receivedSetting(message)
-            elif message[0] == "[":
-                if message[1:4] == "PE:":
-                    self.setErrorOnScreen(message)
-                elif message[1:8] == "Measure":
-                    measuredDist = float(message[9:len(message)-3])
+            elif kind == machineMessage.ERROR:
+                if errorReport is not None:
+                    telemetry.errorReportsCoalesced = telemetry.errorReportsCoalesced + 1
+                errorReport = message
+            elif kind == machineMessage.MEASUREMENT:
+                if message.values is not None:
                     try:
-                        self.data.measureRequest(measuredDist)
+                        self.data.measureRequest(message.values[0])
                     except:
                         print "No function has requested a measurement"
-            elif message[0:13] == "Maslow Paused":
+            elif kind == machineMessage.REPORT:
+                pass
+            elif kind == machineMessage.PAUSED:
                 self.data.uploadFlag = 0
-                self.writeToTextConsole(message)
-            elif message[0:8] == "Message:":
-                if self.data.calibrationInProcess and message[0:15] == "Message: Unable":   #this suppresses the annoying messages about invalid chain lengths during the calibration process
+                self.writeToTextConsole(message.line)
+            elif kind == machineMessage.NOTIFICATION:
+                if self.data.calibrationInProcess and message.line[0:15] == "Message: Unable":   #this suppresses the annoying messages about invalid chain lengths during the calibration process
                     break
                 self.previousUploadStatus = self.data.uploadFlag 
                 self.data.uploadFlag = 0
@@ -355,7 +377,7 @@ class GroundControlApp(App):
                     self._popup.dismiss()                                           #close any open popup
                 except:
                     pass                                                            #there wasn't a popup to close
-                content = NotificationPopup(continueOn = self.dismiss_popup_continue, text = message[9:])
+                content = NotificationPopup(continueOn = self.dismiss_popup_continue, text = message.text)
                 if sys.platform.startswith('darwin'):
                     self._popup = Popup(title="Notification: ", content=content,
                             auto_dismiss=False, size=(360,240), size_hint=(.3, .3))
@@ -366,14 +388,14 @@ class GroundControlApp(App):
                 if global_variables._keyboard:
                     global_variables._keyboard.bind(on_key_down=self.keydown_popup)
                     self._popup.bind(on_dismiss=self.ondismiss_popup)
-            elif message[0:6] == "ALARM:":
+            elif kind == machineMessage.ALARM:
                 self.previousUploadStatus = self.data.uploadFlag 
                 self.data.uploadFlag = 0
                 try:
                     self._popup.dismiss()                                           #close any open popup
                 except:
                     pass                                                            #there wasn't a popup to close
-                content = NotificationPopup(continueOn = self.dismiss_popup_continue, text = message[7:])
+                content = NotificationPopup(continueOn = self.dismiss_popup_continue, text = message.text)
                 if sys.platform.startswith('darwin'):
                     self._popup = Popup(title="Alarm Notification: ", content=content,
                             auto_dismiss=False, size=(360,240), size_hint=(.3, .3))
@@ -384,19 +406,27 @@ class GroundControlApp(App):
                 if global_variables._keyboard:
                     global_variables._keyboard.bind(on_key_down=self.keydown_popup)
                     self._popup.bind(on_dismiss=self.ondismiss_popup)
-            elif message[0:8] == "Firmware":
+            elif kind == machineMessage.FIRMWARE:
                 self.data.logger.writeToLog("Ground Control Version " + str(self.data.version) + "\n")
-                self.writeToTextConsole("Ground Control " + str(self.data.version) + "\r\n" + message + "\r\n")
+                self.writeToTextConsole("Ground Control " + str(self.data.version) + "\r\n" + message.line + "\r\n")
                 
                 #Check that version numbers match
-                if float(message[-7:]) < float(self.data.version):
-                    self.data.message_queue.put("Message: Warning, your firmware is out of date and may not work correctly with this version of Ground Control\n\n" + "Ground Control Version " + str(self.data.version) + "\r\n" + message)
-                if float(message[-7:]) > float(self.data.version):
-                    self.data.message_queue.put("Message: Warning, your version of Ground Control is out of date and may not work with this firmware version\n\n" + "Ground Control Version " + str(self.data.version) + "\r\n" + message)
-            elif message == "ok\r\n":
+                if message.values is not None:
+                    firmwareVersion = message.values[0]
+                    if firmwareVersion < float(self.data.version):
+                        self.data.message_queue.put("Message: Warning, your firmware is out of date and may not work correctly with this version of Ground Control\n\n" + "Ground Control Version " + str(self.data.version) + "\r\n" + message.line)
+                    if firmwareVersion > float(self.data.version):
+                        self.data.message_queue.put("Message: Warning, your version of Ground Control is out of date and may not work with this firmware version\n\n" + "Ground Control Version " + str(self.data.version) + "\r\n" + message.line)
+            elif kind == machineMessage.ACK:
                 pass #displaying all the 'ok' messages clutters up the display
             else:
-                self.writeToTextConsole(message)
+                self.writeToTextConsole(message.line)
+        
+        if positionReport is not None:
+            self.setPosOnScreen(positionReport)
+        if errorReport is not None:
+            self.setErrorOnScreen(errorReport)
+        telemetry.messagesHandled = telemetry.messagesHandled + handled
 
     def ondismiss_popup(self, event):
         if global_variables._keyboard:
@@ -434,32 +464,21 @@ class GroundControlApp(App):
         
         '''
         
-        try:
-            startpt = message.find('MPos:') + 5
-            
-            endpt = message.find('WPos:')
-            
-            numz  = message[startpt:endpt]
-            units = "mm" #message[endpt+1:endpt+3]
-            
-            valz = numz.split(",")
-            
-            self.xval  = float(valz[0])
-            self.yval  = float(valz[1])
-            self.zval  = float(valz[2])
-
-            if math.isnan(self.xval):
-                self.writeToTextConsole("Unable to resolve x Kinematics.")
-                self.xval = 0
-            if math.isnan(self.yval):
-                self.writeToTextConsole("Unable to resolve y Kinematics.")
-                self.yval = 0
-            if math.isnan(self.zval):
-                self.writeToTextConsole("Unable to resolve z Kinematics.")
-                self.zval = 0
-        except:
+        if message.values is None:
             print "One Machine Position Report Command Misread"
             return
+        
+        self.xval, self.yval, self.zval = message.values
+
+        if math.isnan(self.xval):
+            self.writeToTextConsole("Unable to resolve x Kinematics.")
+            self.xval = 0
+        if math.isnan(self.yval):
+            self.writeToTextConsole("Unable to resolve y Kinematics.")
+            self.yval = 0
+        if math.isnan(self.zval):
+            self.writeToTextConsole("Unable to resolve z Kinematics.")
+            self.zval = 0
 
         self.frontpage.setPosReadout(self.xval, self.yval, self.zval)
         self.frontpage.gcodecanvas.positionIndicator.setPos(self.xval,self.yval,self.data.units)
@@ -467,16 +486,7 @@ class GroundControlApp(App):
     def setErrorOnScreen(self, message):
         
         try:
-            startpt = message.find(':')+1 
-            endpt = message.find(',', startpt)
-            leftErrorValueAsString = message[startpt:endpt]
-            leftErrorValueAsFloat  = float(leftErrorValueAsString)
-            
-            startpt = endpt + 1
-            endpt = message.find(',', startpt)
-            rightErrorValueAsString = message[startpt:endpt]
-            
-            rightErrorValueAsFloat  = float(rightErrorValueAsString)
+            leftErrorValueAsFloat, rightErrorValueAsFloat = message.values
             
             if self.data.units == "INCHES":
                 rightErrorValueAsFloat = rightErrorValueAsFloat/25.4
@@ -0,0 +1,55 @@
+'''
+
+Tests of the arc geometry shared by drawing and the bounding box.
+
+'''
+
+from DataStructures.arcGeometry              import arcSweep, arcBounds, arcPoints, segmentsForArc
+import math
+import unittest
+
+
+class ArcGeometryTest(unittest.TestCase):
+
+    def testSweep(self):
+        radius, startAngle, sweep = arcSweep(1, 0, 0, 1, 0, 0, False)
+        self.assertAlmostEqual(radius, 1)
+        self.assertAlmostEqual(startAngle, 0)
+        self.assertAlmostEqual(sweep, math.pi/2)
+
+        radius, startAngle, sweep = arcSweep(1, 0, 0, 1, 0, 0, True)
+        self.assertAlmostEqual(sweep, -3*math.pi/2)
+
+    def testFullCircle(self):
+        self.assertAlmostEqual(arcSweep(1, 0, 1, 0, 0, 0, False)[2], 2*math.pi)
+        self.assertAlmostEqual(arcSweep(1, 0, 1, 0, 0, 0, True)[2], -2*math.pi)
+        self.assertEqual(arcBounds(1, 0, 1, 0, 0, 0, True), [-1, -1, 1, 1])
+
+    def testBounds(self):
+        bounds = arcBounds(1, 0, -1, 0, 0, 0, False)            #the top half of a circle
+        self.assertEqual([round(value, 9) for value in bounds], [-1, 0, 1, 1])
+
+        bounds = arcBounds(1, 0, -1, 0, 0, 0, True)             #the bottom half
+        self.assertEqual([round(value, 9) for value in bounds], [-1, -1, 1, 0])
+
+    def testBoundsAcrossTheNegativeXAxis(self):
+        bounds = arcBounds(-1, 1, -1, -1, 0, 0, False)
+        self.assertAlmostEqual(bounds[0], -math.sqrt(2))
+
+    def testPointsStayWithinTolerance(self):
+        tolerance = .01
+        points    = arcPoints(10, 0, 0, 10, 0, 0, False, tolerance)
+        self.assertEqual(points[0], (10, 0))
+        self.assertEqual(points[-1], (0, 10))
+        for (x1, y1), (x2, y2) in zip(points, points[1:]):
+            self.assertAlmostEqual(math.hypot(x1, y1), 10)
+            middle = math.hypot((x1 + x2)/2, (y1 + y2)/2)
+            self.assertTrue(10 - middle <= tolerance + 1e-9)
+
+    def testSegments(self):
+        self.assertEqual(segmentsForArc(.001, math.pi, .01), 2)
+        self.assertTrue(segmentsForArc(100.0, 2*math.pi, .01) > segmentsForArc(100.0, 2*math.pi, 1.0))
+
+
+if __name__ == '__main__':
+    unittest.main()
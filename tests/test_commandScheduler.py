@@ -0,0 +1,141 @@
+'''
+
+Tests of the order in which CommandScheduler sends commands and program lines, and of resuming a
+program after the connection was lost.
+
+'''
+
+from Connection.commandScheduler             import CommandScheduler
+from DataStructures.gcodeProgram             import GcodeProgram
+from DataStructures.gcodeTransform           import GcodeTransform
+from DataStructures.mappedGcodeProgram       import MappedGcodeProgram
+from Queue                                   import Queue
+import os
+import tempfile
+import unittest
+
+
+def parseLines(lines):
+    program = GcodeProgram()
+    program.parse(line + '\n' for line in lines)
+    return program
+
+
+class SchedulerData(object):
+    '''
+
+    Stands in for the data object, recording the changes made to uploadFlag and gcodeIndex in order.
+
+    '''
+
+    def __init__(self, gcode):
+        self.changes        = []
+        self.quick_queue    = Queue()
+        self.gcode_queue    = Queue()
+        self.gcode          = gcode
+        self.gcodeTransform = GcodeTransform()
+        self.uploadFlag     = 0
+        self.gcodeIndex     = 0
+
+    def __setattr__(self, name, value):
+        if name in ('uploadFlag', 'gcodeIndex'):
+            self.changes.append((name, value))
+        object.__setattr__(self, name, value)
+
+
+class CommandSchedulerTest(unittest.TestCase):
+
+    program = ['G21 G90', 'G0 Z5', 'G0 X10 Y10', 'G1 Z-1 F100', 'G1 X20', 'G1 Y20', 'G0 Z5']
+
+    def setUp(self):
+        self.data      = SchedulerData(parseLines(self.program))
+        self.scheduler = CommandScheduler(self.data, True)
+
+    def texts(self, lines):
+        return [line for line, index in lines]
+
+    def testQuickCommands(self):
+        self.data.quick_queue.put('~')
+        self.data.quick_queue.put('!')
+        self.assertEqual(self.scheduler.takeQuickCommands(), ['~', '!'])
+        self.assertEqual(self.scheduler.takeQuickCommands(), [])
+
+    def testManualCommandsGoAheadOfTheProgram(self):
+        self.data.uploadFlag = 1
+        self.data.gcode_queue.put('G91 G0 X1')
+        lines = self.scheduler.takeLines(1000, True)
+        self.assertEqual(lines[0], ('G91 G0 X1 ', None))
+        self.assertEqual([index for line, index in lines[1:]], range(len(self.program)))
+
+    def testWaitingManualCommandHoldsBackTheProgram(self):
+        self.data.uploadFlag = 1
+        self.data.gcode_queue.put('G0 X1 Y1 Z1 F1000')
+        self.assertEqual(self.scheduler.takeLines(5, True), [])
+        self.assertEqual(self.scheduler.waitingCommand, 'G0 X1 Y1 Z1 F1000 ')
+        lines = self.scheduler.takeLines(40, True)
+        self.assertEqual(lines[0], ('G0 X1 Y1 Z1 F1000 ', None))
+        self.assertEqual(lines[1][1], 0)
+
+    def testStopThrowsAwayTheWaitingCommand(self):
+        self.data.gcode_queue.put('G0 X1 Y1 Z1 F1000')
+        self.scheduler.takeLines(5, True)
+        self.scheduler.resumePending = True
+        self.data.quick_queue.put('!')
+        self.scheduler.takeQuickCommands()
+        self.assertEqual(self.scheduler.waitingCommand, None)
+        self.assertFalse(self.scheduler.resumePending)
+
+    def testProgramLinesFillTheBuffer(self):
+        self.data.uploadFlag = 1
+        lines = self.scheduler.takeLines(30, True)
+        self.assertEqual(self.texts(lines), ['G21 G90 ', 'G0 Z5 ', 'G0 X10 Y10 '])
+        self.assertEqual(self.data.gcodeIndex, 3)
+        lines = self.scheduler.takeLines(30, True)
+        self.assertEqual(lines[0], ('G1 Z-1 F100 ', 3))
+
+    def testWithoutBufferingOneLineIsSent(self):
+        scheduler = CommandScheduler(self.data, False)
+        self.data.uploadFlag = 1
+        self.assertEqual(scheduler.takeLines(1000, False), [])
+        self.assertEqual(self.texts(scheduler.takeLines(1000, True)), ['G21 G90 '])
+
+    def testNothingIsSentWhilePaused(self):
+        self.assertEqual(self.scheduler.takeLines(1000, True), [])
+
+    def testEndOfProgram(self):
+        self.data.uploadFlag = 1
+        self.data.changes    = []
+        lines = self.scheduler.takeLines(1000, True)
+        self.assertEqual(len(lines), len(self.program))
+        self.assertEqual(self.data.changes, [('gcodeIndex', len(self.program)), ('uploadFlag', 0), ('gcodeIndex', 0)])
+
+    def testResumeLinesComeFirst(self):
+        self.data.uploadFlag = 1
+        self.data.gcodeIndex = 5
+        self.scheduler.resumePending = True
+        lines = self.scheduler.takeLines(1000, True)
+        self.assertEqual(self.texts(lines[:5]), ['G21 G90 ', 'G0 Z5 ', 'G0 X20 Y10 ', 'G1 Z-1 F100 ', 'G21 G90 '])
+        self.assertEqual(lines[5], ('G1 Y20 ', 5))
+        self.assertFalse(self.scheduler.resumePending)
+
+    def testMappedProgramOnlyRestoresTheModalState(self):
+        handle, path = tempfile.mkstemp(suffix = '.nc')
+        os.write(handle, '\n'.join(self.program) + '\n')
+        os.close(handle)
+        try:
+            program = MappedGcodeProgram()
+            program.open(path)
+            self.data.gcode      = program
+            self.data.uploadFlag = 1
+            self.data.gcodeIndex = 5
+            self.scheduler.resumePending = True
+            lines = self.scheduler.takeLines(1000, True)
+            self.assertEqual(lines[:2], [('G21 G90 ', None), ('G1 Y20 ', 5)])
+            program.mappedFile.close()
+            program.fileObject.close()
+        finally:
+            os.remove(path)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,145 @@
+'''
+
+Tests of the gcode tokenizer and of the modal state table of GcodeProgram.
+
+'''
+
+from DataStructures.gcodeProgram             import GcodeProgram, tokenizeLine, stripComments, modalCommandsOfState
+from DataStructures.gcodeProgram             import NO_COMMAND, PASS_THROUGH, HAS_X, HAS_Y, HAS_Z, HAS_F
+from DataStructures.gcodeProgram             import STATE_INCHES, STATE_RELATIVE, STATE_UNITS_SET, STATE_MODE_SET
+import glob
+import os
+import re
+import unittest
+
+testFiles = glob.glob(os.path.join(os.path.dirname(__file__), '..', 'gcodeForTesting', '*.nc'))
+
+
+def parseLines(lines):
+    program = GcodeProgram()
+    program.parse(line + '\n' for line in lines)
+    return program
+
+def regexFilter(rawText):
+    '''
+
+    The regular expression filter which was used to clean up gcode files before the tokenizer.
+
+    '''
+
+    filtered = re.sub(r'\(([^)]*)\)', '\n', rawText)
+    filtered = re.sub(r';([^\n]*)\n', '\n', filtered)
+    filtered = re.sub(r'\n\n', '\n', filtered)
+    filtered = re.sub(r'([0-9])([GXYZIJFTM]) *', '\\1 \\2', filtered)
+    filtered = re.sub(r'  +', ' ', filtered)
+    lines    = [line.replace('\r', '') + ' ' for line in re.split('\n', filtered)]
+    lines    = [line.lstrip() for line in lines]
+    for letter in 'XYZIJF':
+        lines = [line.replace(letter + ' ', letter) for line in lines]
+    return [line for line in lines if line.strip()]
+
+
+class TokenizerTest(unittest.TestCase):
+
+    def testWordsAreSeparated(self):
+        text, command, values, flags = tokenizeLine('g1x1.5 y-2z .25f100')
+        self.assertEqual(text, 'G1 X1.5 Y-2 Z.25 F100 ')
+        self.assertEqual(command, 1)
+        self.assertEqual(values, [1.5, -2.0, .25, 0.0, 0.0, 100.0])
+        self.assertEqual(flags, HAS_X | HAS_Y | HAS_Z | HAS_F)
+
+    def testBlankLine(self):
+        self.assertEqual(tokenizeLine('   \r\n'), None)
+
+    def testComments(self):
+        self.assertEqual(stripComments('G0 X1 (move) Y2 ; done\n'), ('G0 X1   Y2 ', False))
+        self.assertEqual(stripComments('G0 X1 (a comment\n'), ('G0 X1 ', True))
+        self.assertEqual(stripComments('still a comment) G1 X2\n', True), ('  G1 X2\n', False))
+
+    def testExponents(self):
+        text, command, values, flags = tokenizeLine('G1 X1.5e3 Y1E-2')
+        self.assertEqual(text, 'G1 X1500 Y0.01 ')
+        self.assertEqual(values[:2], [1500.0, .01])
+        self.assertEqual(flags, HAS_X | HAS_Y)
+
+    def testLetterAfterNumberIsNotAnExponent(self):
+        text, command, values, flags = tokenizeLine('G0 X1 E')
+        self.assertEqual(text, 'G0 X1 E ')
+
+    def testDigits(self):
+        text, command, values, flags = tokenizeLine('G1 X1.123456 Y2', 3)
+        self.assertEqual(text, 'G1 X1.123 Y2 ')
+
+    def testMessageTextIsKept(self):
+        text, command, values, flags = tokenizeLine('M117 Change to bit 2 x0.5')
+        self.assertEqual(text, 'M117 Change to bit 2 x0.5 ')
+        self.assertEqual(flags, 0)
+
+    def testPassThroughCommands(self):
+        for line in ('G28 X0 Y0', 'G92 X10 Y10 Z0', 'G4 P1', 'G53 G0 Z0'):
+            text, command, values, flags = tokenizeLine(line)
+            self.assertTrue(flags & PASS_THROUGH, line)
+
+
+class GcodeProgramTest(unittest.TestCase):
+
+    def testMatchesRegexFilter(self):
+        self.assertTrue(testFiles)
+        for filename in testFiles:
+            with open(filename, 'rb') as gcodeFile:
+                expected = regexFilter(gcodeFile.read())
+            program = GcodeProgram()
+            program.load(filename)
+            self.assertEqual(list(program), expected, filename)
+
+    def testBlankAndCommentLinesAreRemoved(self):
+        program = parseLines(['(header', 'still header)', '', 'G0 X1', '; note', 'G1 Y2'])
+        self.assertEqual(list(program), ['G0 X1 ', 'G1 Y2 '])
+
+    def testEveryLineIsKept(self):
+        lines   = ['(header', 'G0 X1', '', '; note', 'G1 Y2']
+        program = GcodeProgram()
+        program.parse((line + '\n' for line in lines), keepEveryLine = True)
+        self.assertEqual(list(program), ['', 'G0 X1 ', '', '', 'G1 Y2 '])
+        self.assertEqual(program.absoluteX[3], 1.0)
+        self.assertEqual(program.command[2], NO_COMMAND)
+
+    def testModalStateTable(self):
+        program = parseLines(['G0 X1 Y1', 'G20', 'G91', 'G1 X1 F10', 'Y2', 'G90 X5', 'Z-1'])
+        self.assertEqual(list(program.absoluteX), [1, 1, 1, 2, 2, 5, 5])
+        self.assertEqual(list(program.absoluteY), [1, 1, 1, 1, 3, 3, 3])
+        self.assertEqual(list(program.feedRate),  [0, 0, 0, 10, 10, 10, 10])
+        self.assertEqual(program.command[4], 1)                 #the motion command carries on
+        self.assertEqual(program.unitsAt(0), "MM")
+        self.assertEqual(program.unitsAt(1), "INCHES")
+        self.assertEqual(program.modalState[0], 0)
+        self.assertEqual(program.modalState[1], STATE_INCHES | STATE_UNITS_SET)
+        self.assertEqual(program.modalState[2], STATE_INCHES | STATE_UNITS_SET | STATE_RELATIVE | STATE_MODE_SET)
+        self.assertEqual(program.modalCommandsBefore(4), 'G20 G91 ')
+        self.assertEqual(program.modalCommandsBefore(0), '')
+
+    def testModalCommandsOnlyForWhatWasSet(self):
+        self.assertEqual(modalCommandsOfState(0), '')
+        self.assertEqual(modalCommandsOfState(STATE_RELATIVE | STATE_MODE_SET), 'G91 ')
+        self.assertEqual(modalCommandsOfState(STATE_UNITS_SET), 'G21 ')
+
+    def testPassThroughDoesNotMove(self):
+        program = parseLines(['G1 X1 Y1', 'G92 X10 Y10', 'G28 X0 Y0', 'G1 X2'])
+        self.assertEqual(program.command[1], NO_COMMAND)
+        self.assertEqual(program.command[2], NO_COMMAND)
+        self.assertEqual(list(program.absoluteX), [1, 1, 1, 2])
+        self.assertEqual(program.findBoundingBox(), [1, 1, 2, 1])
+
+    def testWordColumns(self):
+        program = parseLines(['G2 X1 Y2 I3 J4 F5'])
+        self.assertEqual((program.x[0], program.y[0], program.i[0], program.j[0], program.f[0]), (1, 2, 3, 4, 5))
+
+    def testArcBoundingBox(self):
+        program = parseLines(['G0 X1 Y0', 'G3 X-1 Y0 I-1 J0'])
+        minX, minY, maxX, maxY = program.findBoundingBox()
+        self.assertAlmostEqual(maxY, 1.0)
+        self.assertAlmostEqual(minY, 0.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+'''
+
+Tests of JobRecorder and of reading its recordings back.
+
+'''
+
+from DataStructures.jobRecorder              import JobRecorder, readRecords
+import os
+import shutil
+import tempfile
+import unittest
+
+
+class JobRecorderTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.recorder  = JobRecorder()
+        self.recorder.directory = os.path.join(self.directory, 'jobTelemetry')
+
+    def tearDown(self):
+        self.recorder.stop()
+        shutil.rmtree(self.directory)
+
+    def testRecordsAreReadBack(self):
+        path = self.recorder.start('/gcode/part.nc')
+        self.assertTrue(self.recorder.isRecording())
+        self.assertTrue(os.path.basename(path).startswith('part-'))
+
+        self.recorder.position(1.5, 2.5, -1, 10)
+        self.recorder.error(.25, -.5, 11)
+        self.recorder.index(12)
+        self.recorder.ack(-1, .125)
+        self.recorder.stop()
+        self.assertFalse(self.recorder.isRecording())
+
+        header, records = readRecords(path)
+        self.assertEqual(header['gcodeFile'], '/gcode/part.nc')
+        self.assertEqual(os.path.getsize(path), JobRecorder.headerSize + 4*self.recorder.record.size)
+        self.assertEqual([record[1:] for record in records], [
+                            (JobRecorder.POSITION, 10, 1.5, 2.5, -1.0),
+                            (JobRecorder.ERROR, 11, .25, -.5, 0.0),
+                            (JobRecorder.INDEX, 12, 0.0, 0.0, 0.0),
+                            (JobRecorder.ACK, -1, .125, 0.0, 0.0),
+                         ])
+
+    def testFullChunkIsWritten(self):
+        path = self.recorder.start('part.nc')
+        for line in xrange(JobRecorder.chunkRecords + 1):
+            self.recorder.index(line)
+        self.assertEqual(os.path.getsize(path), JobRecorder.headerSize + JobRecorder.chunkRecords*self.recorder.record.size)
+        self.recorder.flush()
+        header, records = readRecords(path)
+        self.assertEqual([record[2] for record in records], range(JobRecorder.chunkRecords + 1))
+
+    def testLongPathFitsInTheHeader(self):
+        gcodeFile = '/' + 'folder/'*200 + 'part.nc'
+        path = self.recorder.start(gcodeFile)
+        self.recorder.stop()
+        header, records = readRecords(path)
+        self.assertTrue(gcodeFile.endswith(header['gcodeFile']))
+        self.assertEqual(records, [])
+
+    def testNothingIsRecordedWhenStopped(self):
+        self.recorder.index(1)
+        self.assertEqual(self.recorder.count, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
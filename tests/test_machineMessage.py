@@ -0,0 +1,78 @@
+'''
+
+Tests of reading lines from the machine and of passing them between processes.
+
+'''
+
+from DataStructures.machineMessage           import MachineMessage, parseMachineMessage, parseFloat
+from DataStructures                          import machineMessage
+import unittest
+
+
+class ParseMachineMessageTest(unittest.TestCase):
+
+    def testKinds(self):
+        cases = [
+                    ('<Idle,MPos:1.5,-2,3,WPos:0,0,0>\r\n', machineMessage.POSITION, (1.5, -2.0, 3.0)),
+                    ('[PE:0.12,-0.34,127]\r\n',              machineMessage.ERROR,    (.12, -.34)),
+                    ('[Measure: 12.5]\r\n',                  machineMessage.MEASUREMENT, (12.5,)),
+                    ('$17=1.25\r\n',                         machineMessage.SETTING,  (17, 1.25)),
+                    ('Firmware Version 1.26\r\n',            machineMessage.FIRMWARE, (1.26,)),
+                    ('ok\r\n',                               machineMessage.ACK,      ()),
+                    ('Maslow Paused\r\n',                    machineMessage.PAUSED,   ()),
+                    ('[anything]\r\n',                       machineMessage.REPORT,   ()),
+                    ('hello\r\n',                            machineMessage.TEXT,     ()),
+                ]
+        for line, kind, values in cases:
+            message = parseMachineMessage(line)
+            self.assertEqual(message.kind, kind, line)
+            self.assertEqual(message.values, values, line)
+            self.assertEqual(message.line, line)
+
+    def testNotificationText(self):
+        message = parseMachineMessage('Message: Change the bit\r\n')
+        self.assertEqual(message.kind, machineMessage.NOTIFICATION)
+        self.assertEqual(message.text, 'Change the bit\r\n')
+        self.assertEqual(parseMachineMessage('ALARM: Stopped\r\n').text, 'Stopped\r\n')
+
+    def testValuesWhichCanNotBeRead(self):
+        self.assertEqual(parseMachineMessage('<Idle,MPos:x,y,z,WPos:>\r\n').values, None)
+        self.assertEqual(parseMachineMessage('[PE:a,b]\r\n').values, None)
+        self.assertEqual(parseMachineMessage('$x=y\r\n').values, None)
+
+    def testParseFloat(self):
+        self.assertEqual(parseFloat('$12=-1.5e2'), (12.0, 3))
+        self.assertEqual(parseFloat('=-1.5e2'), (-150.0, 7))
+        self.assertEqual(parseFloat('none'), (None, 0))
+
+
+class PackTest(unittest.TestCase):
+
+    def roundTrip(self, message):
+        return MachineMessage.unpack(message.pack())
+
+    def testValuesSurvive(self):
+        message  = parseMachineMessage('<Idle,MPos:1,2,3,WPos:0,0,0>\n')
+        unpacked = self.roundTrip(message)
+        self.assertEqual((unpacked.kind, unpacked.line, unpacked.text), (message.kind, message.line, message.text))
+        self.assertEqual(tuple(unpacked.values), message.values)
+
+    def testBytesWhichAreNotUtf8(self):
+        line     = '\xff\xfe\x00ok\r\n'                     #the noise of an Arduino resetting
+        unpacked = self.roundTrip(parseMachineMessage(line))
+        self.assertEqual(unpacked.line, line)
+        self.assertTrue(isinstance(unpacked.line, str))
+
+    def testUtf8Text(self):
+        line     = 'Message: caf\xc3\xa9\r\n'
+        unpacked = self.roundTrip(parseMachineMessage(line))
+        self.assertEqual(unpacked.line, line)
+        self.assertEqual(unpacked.text, 'caf\xc3\xa9\r\n')
+
+    def testUnicodeText(self):
+        unpacked = self.roundTrip(MachineMessage(machineMessage.TEXT, u'caf\xe9'))
+        self.assertEqual(unpacked.line, 'caf\xc3\xa9')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+'''
+
+Tests of MappedGcodeProgram, checked against a GcodeProgram which keeps every line of the same
+file.
+
+'''
+
+from DataStructures.gcodeProgram             import GcodeProgram, STATE_INCHES, STATE_UNITS_SET
+from DataStructures.mappedGcodeProgram       import MappedGcodeProgram
+import os
+import shutil
+import tempfile
+import unittest
+
+
+class MappedGcodeProgramTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def writeFile(self, lines):
+        path = os.path.join(self.directory, 'test.nc')
+        with open(path, 'wb') as gcodeFile:
+            gcodeFile.write('\n'.join(lines) + '\n')
+        return path
+
+    def openMapped(self, path, blockSize = 64, previewLines = None):
+        program = MappedGcodeProgram()
+        program.blockSize = blockSize                  #small blocks so that the line index has many entries
+        program.open(path, previewLines = previewLines)
+        return program
+
+    def testLinesMatchTheFile(self):
+        lines   = ['(start)', 'G21 G90', '', 'G0 Z5', 'G0 X1 Y2'] + ['G1 X%d Y%d F100 ; cut' % (n, n) for n in xrange(200)]
+        program = self.openMapped(self.writeFile(lines))
+        self.assertEqual(len(program), len(lines))
+        self.assertEqual(program[0], '')
+        self.assertEqual(program[4], 'G0 X1 Y2 ')
+        self.assertEqual(program[-1], 'G1 X199 Y199 F100 ')
+        self.assertEqual(program.rawLine(2), '\n')
+        for index in (150, 7, 204, 6):                #out of order so the line search starts from the block
+            self.assertEqual(program[index], 'G1 X%d Y%d F100 ' % (index - 5, index - 5))
+
+    def testModalStateChanges(self):
+        lines   = ['G1 X1'] + ['G1 X2'] * 100 + ['G20'] + ['G1 X3'] * 100
+        program = self.openMapped(self.writeFile(lines))
+        self.assertEqual(program.modalState[50], 0)
+        self.assertEqual(program.modalState[101], STATE_INCHES | STATE_UNITS_SET)
+        self.assertEqual(program.unitsAt(200), "INCHES")
+        self.assertEqual(program.modalCommandsBefore(102), 'G20 ')
+
+    def testPreviewIsNumberedLikeTheFile(self):
+        lines   = ['(a comment', 'which spans lines)', '', 'G21 G90', '; note', 'G0 Z5', 'G1 X1 Y2 F100', '', 'G1 Z-1', 'G1 X3']
+        path    = self.writeFile(lines)
+        program = self.openMapped(path)
+        self.assertEqual(len(program.preview), len(program))
+        for index in xrange(len(program)):
+            self.assertEqual(program.preview[index], program[index])
+            self.assertEqual(program.preview.modalState[index], program.modalState[index])
+
+    def testPreviewLines(self):
+        program = self.openMapped(self.writeFile(['G1 X%d' % n for n in xrange(100)]), previewLines = 10)
+        self.assertEqual(len(program.preview), 10)
+        self.assertEqual(len(program), 100)
+
+    def testPositionAt(self):
+        lines   = ['G0 X1 Y2'] + ['G1 X%d F100' % n for n in xrange(50)] + ['G1 Z-1', 'F200', 'G92 X0 Y0', 'G1 Y7']
+        path    = self.writeFile(lines)
+        program = self.openMapped(path, previewLines = 5)
+        whole   = GcodeProgram()
+        whole.parse(open(path, 'rb'), keepEveryLine = True)
+        for index in xrange(len(program)):
+            self.assertEqual(program.positionAt(index), (whole.absoluteX[index], whole.absoluteY[index]))
+
+    def testPositionIsNotKnownInRelativeMode(self):
+        lines   = ['G1 X1 Y1', 'G91', 'G1 X1', 'G1 Z1']
+        program = self.openMapped(self.writeFile(lines), previewLines = 1)
+        self.assertEqual(program.positionAt(3), None)
+
+    def testIndexesOpenTheSameFile(self):
+        lines   = ['G1 X%d' % n for n in xrange(100)] + ['G20', 'G1 X1']
+        path    = self.writeFile(lines)
+        program = self.openMapped(path)
+        copy    = MappedGcodeProgram()
+        copy.openIndexed(path, None, program.indexes())
+        self.assertEqual(list(copy), list(program))
+        self.assertEqual(copy.modalState[101], program.modalState[101])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+'''
+
+Tests of SharedRing. Both ends are used from one process, or from two threads to check that a
+full ring blocks the writer until the reader makes room.
+
+'''
+
+from DataStructures.sharedRing               import SharedRing
+import threading
+import time
+import unittest
+
+
+class SharedRingTest(unittest.TestCase):
+
+    def testRecordsComeOutInOrder(self):
+        ring = SharedRing(256)
+        self.assertEqual(ring.get(), [])
+        for record in ('a', '', 'bcd', '\x00\xff'):
+            ring.put(record)
+        self.assertEqual(ring.get(), ['a', '', 'bcd', '\x00\xff'])
+        self.assertEqual(ring.get(), [])
+
+    def testWrapAround(self):
+        ring = SharedRing(32)
+        sent = []
+        for count in xrange(50):
+            record = chr(ord('a') + count % 26)*(count % 11)
+            ring.put(record)
+            sent.append(record)
+            if count % 2:
+                self.assertEqual(ring.get(), sent)
+                sent = []
+        self.assertEqual(ring.get(), sent)
+        self.assertTrue(ring.head.value > ring.size)              #the records have gone around the ring
+
+    def testRecordLargerThanTheRing(self):
+        ring = SharedRing(16)
+        self.assertRaises(ValueError, ring.put, 'x'*16)
+
+    def testFullRingWaitsForTheReader(self):
+        ring    = SharedRing(64)
+        records = ['%02d' % count + 'x'*(count % 20) for count in xrange(200)]
+
+        def write():
+            for record in records:
+                ring.put(record)
+
+        writer = threading.Thread(target = write)
+        writer.daemon = True
+        writer.start()
+
+        received = []
+        deadline = time.time() + 5
+        while len(received) < len(records) and time.time() < deadline:
+            newRecords = ring.get()
+            if not newRecords:
+                time.sleep(.001)
+            received.extend(newRecords)
+        writer.join(5)
+
+        self.assertFalse(writer.is_alive())
+        self.assertEqual(received, records)
+
+
+if __name__ == '__main__':
+    unittest.main()
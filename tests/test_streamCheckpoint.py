@@ -0,0 +1,72 @@
+'''
+
+Tests of StreamCheckpoint and of the lines which resume a program.
+
+'''
+
+from DataStructures.gcodeProgram             import GcodeProgram, STATE_INCHES, STATE_UNITS_SET
+from DataStructures.gcodeTransform           import GcodeTransform
+from DataStructures.streamCheckpoint         import StreamCheckpoint, resumeCommands
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+
+def parseLines(lines):
+    program = GcodeProgram()
+    program.parse(line + '\n' for line in lines)
+    return program
+
+
+class ResumeCommandsTest(unittest.TestCase):
+
+    def testUnitsAreOnlySetIfTheFileSetThem(self):
+        program = parseLines(['G0 Z5', 'G1 X1 Y2 F100', 'G1 Z-1', 'G1 X3', 'G91', 'G1 X1'])
+        self.assertEqual(resumeCommands(program, GcodeTransform(), 4), ['G90 ', 'G0 Z5 ', 'G0 X3 Y2 ', 'G1 Z-1 F100 '])
+        self.assertEqual(resumeCommands(program, GcodeTransform(), 6)[-1], 'G91 ')
+
+    def testInches(self):
+        program = parseLines(['G20', 'G0 Z1', 'G1 X1 Z-.1 F10', 'G1 X2'])
+        self.assertEqual(resumeCommands(program, GcodeTransform(), 3), ['G20 G90 ', 'G0 Z1 ', 'G0 X1 Y0 ', 'G1 Z-0.1 F10 ', 'G20 '])
+
+    def testTransformIsApplied(self):
+        program = parseLines(['G1 X1 Y0 F10', 'G1 X2'])
+        self.assertEqual(resumeCommands(program, GcodeTransform(10, 20, 90), 1)[1], 'G0 X10 Y21 ')
+
+    def testStartOfTheProgram(self):
+        program = parseLines(['G1 X1'])
+        self.assertEqual(resumeCommands(program, GcodeTransform(), 0), [])
+
+
+class StreamCheckpointTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def testCheckpointIsWritten(self):
+        path       = os.path.join(self.directory, 'state', 'checkpoint.json')
+        checkpoint = StreamCheckpoint(path)
+        checkpoint.flushInterval = 0
+        checkpoint.fileName = 'part.nc'
+        checkpoint.lineAcknowledged(41, STATE_INCHES | STATE_UNITS_SET)
+        checkpoint.positionReported((1.0, 2.0, 3.0))
+        checkpoint.flushIfDue()
+
+        with open(path) as checkpointFile:
+            state = json.load(checkpointFile)
+        self.assertEqual(state['lastAckedIndex'], 41)
+        self.assertEqual(state['modalCommands'], 'G20 ')
+        self.assertEqual(state['position'], [1.0, 2.0, 3.0])
+        self.assertEqual(checkpoint.resumeIndex(), 42)
+
+        checkpoint.clear()
+        self.assertEqual(checkpoint.resumeIndex(), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
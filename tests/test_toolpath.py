@@ -0,0 +1,88 @@
+'''
+
+Tests of the polyline simplification and of building a Toolpath.
+
+'''
+
+from DataStructures.gcodeProgram             import GcodeProgram
+from DataStructures.toolpath                 import Toolpath, CutPath, simplify
+from array                                   import array
+import math
+import unittest
+
+
+def distanceToSegment(x, y, x1, y1, x2, y2):
+    dx = x2 - x1
+    dy = y2 - y1
+    lengthSquared = dx*dx + dy*dy
+    if lengthSquared == 0:
+        return math.hypot(x - x1, y - y1)
+    along = max(0.0, min(1.0, ((x - x1)*dx + (y - y1)*dy)/lengthSquared))
+    return math.hypot(x - x1 - along*dx, y - y1 - along*dy)
+
+def parseLines(lines):
+    program = GcodeProgram()
+    program.parse(line + '\n' for line in lines)
+    program.boundingBox = program.findBoundingBox()
+    return program
+
+
+class SimplifyTest(unittest.TestCase):
+
+    def testShortPolylinesAreKept(self):
+        polyline = array('f', [0, 0, 1, 1])
+        self.assertEqual(list(simplify(polyline, 1)), [0, 0, 1, 1])
+
+    def testStraightLineKeepsItsEnds(self):
+        polyline = array('f', [value for x in xrange(11) for value in (x, 0)])
+        self.assertEqual(list(simplify(polyline, .1)), [0, 0, 10, 0])
+
+    def testCornerIsKept(self):
+        polyline = array('f', [0, 0, 5, 0, 10, 0, 10, 5, 10, 10])
+        self.assertEqual(list(simplify(polyline, .1)), [0, 0, 10, 0, 10, 10])
+
+    def testStaysWithinTolerance(self):
+        tolerance = .05
+        points    = [(10*math.cos(step/100.0), 10*math.sin(step/100.0)) for step in xrange(315)]
+        polyline  = array('f', [value for point in points for value in point])
+        simplified = simplify(polyline, tolerance)
+        kept = [(simplified[index], simplified[index + 1]) for index in xrange(0, len(simplified), 2)]
+
+        self.assertTrue(len(kept) < len(points))
+        self.assertEqual(kept[0], (polyline[0], polyline[1]))
+        self.assertEqual(kept[-1], (polyline[-2], polyline[-1]))
+        for x, y in points:
+            distance = min(distanceToSegment(x, y, x1, y1, x2, y2) for (x1, y1), (x2, y2) in zip(kept, kept[1:]))
+            self.assertTrue(distance <= tolerance + 1e-4, (x, y, distance))
+
+
+class ToolpathTest(unittest.TestCase):
+
+    lines = ['G21', 'G0 Z5', 'G0 X10 Y0', 'G1 Z-1 F100', 'G1 X20', 'G2 X30 Y0 I5 J0', 'G0 Z5', 'G18', 'G0 X0 Y0']
+
+    def testAddingEveryLine(self):
+        toolpath = Toolpath(parseLines(self.lines))
+        while not toolpath.isComplete():
+            if toolpath.linesAdded < len(toolpath.program):
+                toolpath.addLines(3)
+            else:
+                toolpath.simplifyCells(10)
+        self.assertEqual(toolpath.units, "MM")
+        self.assertTrue(toolpath.usesXZPlane)
+        self.assertTrue(toolpath.groups['feed'].cells)
+        self.assertTrue(toolpath.groups['plunge'].cells)
+        self.assertTrue(toolpath.groups['raise'].cells)
+
+    def testCutPathOnlyDrawsTheLinesSent(self):
+        program = parseLines(self.lines)
+        cutPath = CutPath(program, 4)
+        self.assertEqual(cutPath.linesAdded, 4)
+        cutPath.addLinesTo(5)
+        self.assertEqual(cutPath.linesAdded, 5)
+        cutPath.addLinesTo(3)
+        self.assertEqual(cutPath.linesAdded, 5)
+        self.assertTrue(cutPath.batchesFor('feed')[0].vertexCount() > 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,55 @@
+'''
+
+Tests of ZLayerIndex.
+
+'''
+
+from DataStructures.gcodeProgram             import GcodeProgram
+from DataStructures.zLayerIndex              import ZLayerIndex
+import unittest
+
+
+def indexOf(lines, tolerance = .01):
+    program = GcodeProgram()
+    program.parse(line + '\n' for line in lines)
+    return ZLayerIndex.fromProgram(program, tolerance)
+
+
+class ZLayerIndexTest(unittest.TestCase):
+
+    lines = ['G0 Z5', 'G0 X1', 'G1 Z-1', 'G1 X2', 'G1 X3', 'G0 Z5', 'G0 X0', 'G1 Z-2', 'G1 X4']
+
+    def testPasses(self):
+        zLayers = indexOf(self.lines)
+        self.assertEqual(zLayers.layers(), [(5.0, 0, 0), (-1.0, 1, 3), (5.0, 4, 5), (-2.0, 6, 8)])
+        self.assertEqual(len(zLayers), 4)
+
+    def testLayerAt(self):
+        zLayers = indexOf(self.lines)
+        self.assertEqual([zLayers.layerAt(index) for index in xrange(len(self.lines))], [0, 1, 1, 1, 2, 2, 3, 3, 3])
+
+    def testMoveFrom(self):
+        zLayers = indexOf(self.lines)
+        self.assertEqual(zLayers.moveFrom(0, 1), 1)
+        self.assertEqual(zLayers.moveFrom(2, 1), 4)
+        self.assertEqual(zLayers.moveFrom(2, -1), 1)            #back to the start of the pass first
+        self.assertEqual(zLayers.moveFrom(1, -1), 0)
+        self.assertEqual(zLayers.moveFrom(7, 1), 7)             #the last pass stays where it is
+        self.assertEqual(zLayers.moveFrom(3, -10), 0)
+
+    def testSmallMovesAreNotPasses(self):
+        zLayers = indexOf(['G1 Z-1', 'G1 X1 Z-1.001', 'G1 X2'])
+        self.assertEqual(len(zLayers), 1)
+
+    def testRelativeMoves(self):
+        zLayers = indexOf(['G1 Z-1', 'G91', 'G1 X1', 'G1 Z-1', 'G1 X1'])
+        self.assertEqual(zLayers.depthOf(1), -2.0)
+
+    def testNoPasses(self):
+        zLayers = ZLayerIndex(lineCount = 10)
+        self.assertEqual(zLayers.layers(), [(0.0, 0, 9)])
+        self.assertEqual(zLayers.layerAt(5), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()